@@ -0,0 +1,183 @@
+# ann_index.py
+import os
+from typing import Dict, Optional, Tuple
+import numpy as np
+from vector_index import normalize_rows, top_k_indices
+
+# 検索時に調べるクラスタ数（大きいほど再現率が上がり、遅くなる）
+ANN_N_PROBE = int(os.getenv("ANN_N_PROBE", "8"))
+# クラスタ数（0の場合はベクトル数から自動で決める）
+ANN_N_LISTS = int(os.getenv("ANN_N_LISTS", "0"))
+KMEANS_ITERATIONS = 20
+# k-meansの学習に使う1クラスタあたりの最大サンプル数
+KMEANS_SAMPLES_PER_LIST = 256
+# 割り当て計算で一度に処理する行数
+ASSIGN_CHUNK_SIZE = 8192
+
+
+def default_n_lists(n_vectors: int) -> int:
+    return max(1, int(4 * np.sqrt(n_vectors)))
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignment = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), ASSIGN_CHUNK_SIZE):
+        assignment[start:start + ASSIGN_CHUNK_SIZE] = np.argmax(matrix[start:start + ASSIGN_CHUNK_SIZE] @ centroids.T, axis=1)
+    return assignment
+
+
+def train_centroids(matrix: np.ndarray, n_lists: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """
+    球面k-meansでクラスタ中心を学習する
+
+    :param matrix: 正規化済みのベクトル行列
+    :param n_lists: クラスタ数
+    :param iterations: 反復回数
+    :param seed: 乱数シード
+    :return: 正規化済みのクラスタ中心の行列
+    """
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, len(matrix))
+    sample_size = min(len(matrix), n_lists * KMEANS_SAMPLES_PER_LIST)
+    sample = matrix[rng.choice(len(matrix), sample_size, replace=False)] if sample_size < len(matrix) else matrix
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=n_lists)
+        # 空のクラスタはランダムな点で初期化し直す
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids, _ = normalize_rows(sums)
+    return centroids
+
+
+class IVFFlatIndex:
+    """
+    転置ファイル（IVF-flat）による近似最近傍探索インデックス
+    ベクトルはクラスタごとのリストに正規化済みのfloat32で保持し、検索時はn_probe個のクラスタだけを走査する
+    """
+
+    def __init__(self, centroids: np.ndarray, n_probe: int = ANN_N_PROBE):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.n_probe = n_probe
+        dim = self.centroids.shape[1]
+        self._list_ids = [np.empty(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self._list_vectors = [np.empty((0, dim), dtype=np.float32) for _ in range(len(self.centroids))]
+        self._assignment: Dict[int, int] = {}
+        # インデックスに反映済みのdata_change_logの変更ID
+        self.generation = 0
+
+    @classmethod
+    def build(cls, job_ids: np.ndarray, matrix: np.ndarray, n_lists: int = ANN_N_LISTS, n_probe: int = ANN_N_PROBE, seed: int = 0) -> "IVFFlatIndex":
+        """
+        正規化済みのベクトル行列からインデックスを作成する
+
+        :param job_ids: 求人IDの配列
+        :param matrix: 正規化済みのベクトル行列
+        :param n_lists: クラスタ数（0の場合は自動）
+        :param n_probe: 検索時に調べるクラスタ数
+        :param seed: 乱数シード
+        :return: IVFFlatIndex
+        """
+        index = cls(train_centroids(matrix, n_lists or default_n_lists(len(matrix)), seed=seed), n_probe)
+        index.add(job_ids, matrix)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._assignment)
+
+    def add(self, job_ids: np.ndarray, matrix: np.ndarray) -> None:
+        """
+        ベクトルを追加する（既存のIDは置き換える）
+
+        :param job_ids: 求人IDの配列
+        :param matrix: 正規化済みのベクトル行列
+        """
+        job_ids = np.asarray(job_ids, dtype=np.int64)
+        if not len(job_ids):
+            return
+        self.remove(job_ids)
+        assignment = _assign(np.asarray(matrix, dtype=np.float32), self.centroids)
+        for list_no in np.unique(assignment):
+            rows = assignment == list_no
+            self._list_ids[list_no] = np.concatenate([self._list_ids[list_no], job_ids[rows]])
+            self._list_vectors[list_no] = np.vstack([self._list_vectors[list_no], matrix[rows]])
+        self._assignment.update(zip(job_ids.tolist(), assignment.tolist()))
+
+    def remove(self, job_ids: np.ndarray) -> None:
+        """
+        ベクトルを削除する（存在しないIDは無視する）
+
+        :param job_ids: 求人IDの配列
+        """
+        by_list: Dict[int, list] = {}
+        for job_id in np.asarray(job_ids, dtype=np.int64).tolist():
+            list_no = self._assignment.pop(job_id, None)
+            if list_no is not None:
+                by_list.setdefault(list_no, []).append(job_id)
+        for list_no, removed in by_list.items():
+            keep = ~np.isin(self._list_ids[list_no], removed)
+            self._list_ids[list_no] = self._list_ids[list_no][keep]
+            self._list_vectors[list_no] = self._list_vectors[list_no][keep]
+
+    def search(self, query: np.ndarray, top_n: int, n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        正規化済みのクエリに近いベクトルを検索する
+
+        :param query: 正規化済みのクエリベクトル
+        :param top_n: 取得する件数
+        :param n_probe: 調べるクラスタ数（省略時はインスタンスの設定）
+        :return: (求人IDの配列, コサイン類似度の配列)（類似度の降順）
+        """
+        probes = top_k_indices(self.centroids @ query, n_probe or self.n_probe)
+        ids = [self._list_ids[list_no] for list_no in probes]
+        scores = [self._list_vectors[list_no] @ query for list_no in probes]
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        top = top_k_indices(scores, top_n)
+        return ids[top], scores[top]
+
+    def save(self, path: str) -> None:
+        """
+        インデックスをファイルに保存する（一時ファイルに書いてから置き換える）
+
+        :param path: 保存先のパス（.npz）
+        """
+        sizes = np.array([len(ids) for ids in self._list_ids], dtype=np.int64)
+        dim = self.centroids.shape[1]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                ids=np.concatenate(self._list_ids) if len(self._list_ids) else np.empty(0, dtype=np.int64),
+                vectors=np.vstack(self._list_vectors) if len(self._list_vectors) else np.empty((0, dim), dtype=np.float32),
+                sizes=sizes,
+                n_probe=self.n_probe,
+                generation=self.generation
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFFlatIndex":
+        """
+        保存したインデックスを読み込む
+
+        :param path: 保存したパス（.npz）
+        :return: IVFFlatIndex
+        """
+        with np.load(path) as data:
+            index = cls(data["centroids"], int(data["n_probe"]))
+            offsets = np.concatenate([[0], np.cumsum(data["sizes"])])
+            ids, vectors = data["ids"], data["vectors"]
+            for list_no in range(len(index.centroids)):
+                index._list_ids[list_no] = ids[offsets[list_no]:offsets[list_no + 1]]
+                index._list_vectors[list_no] = vectors[offsets[list_no]:offsets[list_no + 1]]
+                index._assignment.update(dict.fromkeys(index._list_ids[list_no].tolist(), list_no))
+            index.generation = int(data["generation"])
+        return index
@@ -1,13 +1,23 @@
 # /Users/takuya/Documents/talent-flow1.1/fastapi-backend/auth.py
+import os
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models import Employee
+from models import DepartmentMember, Employee
 
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+def parse_id_list(value: str) -> frozenset:
+    return frozenset(int(item) for item in value.split(",") if item.strip())
+
+# 他の従業員のデータを参照する機能（一括推薦・候補者検索）を使える採用担当・人事の従業員IDと部署ID（カンマ区切り、未設定の場合は誰も使えない）
+RECRUITER_EMPLOYEE_IDS = parse_id_list(os.getenv("RECRUITER_EMPLOYEE_IDS", ""))
+RECRUITER_DEPARTMENT_IDS = parse_id_list(os.getenv("RECRUITER_DEPARTMENT_IDS", ""))
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
@@ -19,14 +29,37 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 def authenticate_user(db: Session, username: str, password: str):
-    print(f"Attempting to authenticate user: {username}")
     user = db.query(Employee).filter(Employee.employee_name == username).first()
-    print(f"User found: {user}")
     if not user:
-        print("User not found")
         return False
     if user.password != password:  # 'hashed_password' ではなく 'password' を使用
-        print("Password verification failed")
         return False
-    print("Authentication successful")
-    return user
\ No newline at end of file
+    return user
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    user = (await db.execute(
+        select(Employee.employee_id, Employee.employee_name, Employee.password).where(Employee.employee_name == username)
+    )).first()
+    if not user:
+        return False
+    if user.password != password:
+        return False
+    return user
+
+async def is_recruiter(db: AsyncSession, employee_id: int) -> bool:
+    """
+    採用担当・人事として許可された従業員かを判定する（従業員IDか所属部署が許可リストにある場合）
+
+    :param db: 非同期データベースセッション
+    :param employee_id: 従業員ID
+    :return: 許可されている場合True
+    """
+    if employee_id in RECRUITER_EMPLOYEE_IDS:
+        return True
+    if not RECRUITER_DEPARTMENT_IDS:
+        return False
+    member = (await db.execute(select(DepartmentMember.employee_id).where(
+        DepartmentMember.employee_id == employee_id,
+        DepartmentMember.department_id.in_(RECRUITER_DEPARTMENT_IDS)
+    ).limit(1))).first()
+    return member is not None
@@ -0,0 +1,78 @@
+"""
+全件走査とIVF-flatの recall@5 とレイテンシを比較するベンチマーク
+
+    python -m benchmarks.bench_ann --jobs 100000 --dim 1536 --output ann.json
+"""
+import argparse
+import time
+import numpy as np
+from ann_index import IVFFlatIndex, default_n_lists
+from benchmarks.common import percentile_ms, write_results
+from vector_index import JobVectorIndex, normalize_rows
+
+TOP_N = 5
+
+
+def clustered_vectors(n: int, dim: int, n_topics: int, rng: np.random.Generator) -> np.ndarray:
+    # 実際の埋め込みに近づけるため、トピックごとのまとまりを持つベクトルを作る
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    labels = rng.integers(0, n_topics, n)
+    return topics[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def run(n_jobs: int, dim: int, n_queries: int, n_lists: int, probes, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    vectors = clustered_vectors(n_jobs + n_queries, dim, max(8, n_jobs // 500), rng)
+    job_ids = np.arange(1, n_jobs + 1, dtype=np.int64)
+    exact = JobVectorIndex.from_vectors(dict(zip(job_ids.tolist(), vectors[:n_jobs])))
+    queries, _ = normalize_rows(vectors[n_jobs:])
+
+    start = time.perf_counter()
+    ann = IVFFlatIndex.build(job_ids, exact.matrix, n_lists)
+    build_seconds = time.perf_counter() - start
+
+    exact_latencies, truth = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results = exact.search(query, TOP_N, include_vector=False)
+        exact_latencies.append(time.perf_counter() - start)
+        truth.append({result['job_id'] for result in results})
+
+    report = {
+        "n_jobs": n_jobs,
+        "dim": dim,
+        "n_queries": n_queries,
+        "n_lists": len(ann.centroids),
+        "build_seconds": round(build_seconds, 3),
+        "exact": {"p50_ms": percentile_ms(exact_latencies, 50), "p95_ms": percentile_ms(exact_latencies, 95)},
+        "ivf": []
+    }
+    for n_probe in probes:
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            ids, _ = ann.search(query, TOP_N, n_probe)
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected.intersection(ids.tolist()))
+        report["ivf"].append({
+            "n_probe": n_probe,
+            "recall_at_5": round(hits / (TOP_N * len(queries)), 4),
+            "p50_ms": percentile_ms(latencies, 50),
+            "p95_ms": percentile_ms(latencies, 95)
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-lists", type=int, default=0)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONを書き出すパス")
+    args = parser.parse_args()
+
+    report = run(args.jobs, args.dim, args.queries, args.n_lists or default_n_lists(args.jobs), args.probes, args.seed)
+    write_results("ann", report, args.output)
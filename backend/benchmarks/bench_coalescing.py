@@ -0,0 +1,71 @@
+"""
+同一内容の /recommendations を同時にN件送り、OpenAIスタブへのchat completionが1回だけであることを確認する
+
+    python -m benchmarks.bench_coalescing --concurrency 20 --llm-latency-ms 500
+
+同時リクエストと共有期間内の後続リクエストでchat completionが1回にならなかった場合は終了コード1で終了するため、
+回帰チェックとしても使える。
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Any, Dict, List
+import httpx
+from benchmarks.common import latency_summary, write_results
+from benchmarks.load_test import spawned_servers
+from benchmarks.synthetic_data import PASSWORD
+
+
+async def run(base_url: str, fake_url: str, concurrency: int, vector_type: str) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+        response = await client.post("/token", data={"username": "employee1", "password": PASSWORD})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        async def completions() -> int:
+            return (await client.get(f"{fake_url}/stats")).json()["chat_completions"]
+
+        async def recommend() -> tuple:
+            start = time.perf_counter()
+            response = await client.post("/recommendations", json={"vector_type": vector_type}, headers=headers)
+            return response, time.perf_counter() - start
+
+        before = await completions()
+        results = await asyncio.gather(*(recommend() for _ in range(concurrency)))
+        concurrent_completions = await completions() - before
+        # 共有期間内の後続のリクエストも同じ結果を返す
+        follow_up, _ = await recommend()
+        total_completions = await completions() - before
+
+        latencies: List[float] = [elapsed for _, elapsed in results]
+        bodies = {response.content for response, _ in results} | {follow_up.content}
+        return {
+            "requests": concurrency + 1,
+            "errors": sum(response.status_code >= 400 for response, _ in results) + (follow_up.status_code >= 400),
+            "distinct_bodies": len(bodies),
+            "concurrent_completions": concurrent_completions,
+            "total_completions": total_completions,
+            "latency": latency_summary(latencies)
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20, help="同時に送る同一リクエストの数")
+    parser.add_argument("--employees", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--vector-type", choices=("career", "personality", "hybrid"), default="career")
+    parser.add_argument("--output", help="結果のJSONを書き出すパス")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    with spawned_servers(args.employees, args.jobs, args.dim, args.llm_latency_ms) as (base_url, fake_url):
+        results = asyncio.run(run(base_url, fake_url, args.concurrency, args.vector_type))
+    write_results("bench_coalescing", {"config": config, "coalescing": results}, args.output)
+
+    if results["errors"] or results["total_completions"] != 1 or results["distinct_bodies"] != 1:
+        print(f"expected exactly one upstream completion, got {results['total_completions']}", file=sys.stderr)
+        sys.exit(1)
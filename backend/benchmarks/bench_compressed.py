@@ -0,0 +1,107 @@
+"""
+全件走査とcompressed（PCA・int8で削減した行列で候補を絞り、全精度で計算し直す）のメモリ・走査速度・一致率を比較するベンチマーク
+
+    python -m benchmarks.bench_compressed --jobs 100000 --dim 1536 --output compressed.json
+
+top5_match_rate は上位5件の求人IDと順序が全件走査と一致した割合、max_similarity_diff はパーセンテージの最大の差。
+"""
+import argparse
+import time
+import numpy as np
+from benchmarks.bench_ann import clustered_vectors
+from benchmarks.common import latency_summary, write_results
+from compressed_index import CompressedIndex, COMPRESSED_CANDIDATES
+from vector_index import JobVectorIndex, normalize_rows
+
+TOP_N = 5
+
+
+def scan_throughput(scan, n_vectors: int, bytes_scanned: int, repeat: int) -> dict:
+    # 1クエリで全行を走査する処理の速度
+    scan()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        scan()
+    seconds = (time.perf_counter() - start) / repeat
+    return {
+        "scan_ms": round(seconds * 1000, 3),
+        "vectors_per_second": round(n_vectors / seconds),
+        "gb_per_second": round(bytes_scanned / seconds / 1e9, 2)
+    }
+
+
+def search_all(index: JobVectorIndex, queries: np.ndarray) -> tuple:
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, TOP_N, return_percentage=True))
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def run(n_jobs: int, dim: int, n_queries: int, pca_dims, n_candidates: int, repeat: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    vectors = clustered_vectors(n_jobs + n_queries, dim, max(8, n_jobs // 500), rng)
+    job_ids = np.arange(1, n_jobs + 1, dtype=np.int64)
+    exact = JobVectorIndex.from_vectors(dict(zip(job_ids.tolist(), vectors[:n_jobs])))
+    queries, _ = normalize_rows(vectors[n_jobs:])
+    truth, exact_latencies = search_all(exact, queries)
+
+    report = {
+        "n_jobs": n_jobs,
+        "dim": dim,
+        "n_queries": n_queries,
+        "n_candidates": n_candidates,
+        "exact": {
+            # 以前の get_top_similar_jobs_for_vectors は np.array(list(job_vectors.values())) でfloat64の行列を作っていた
+            "float64_matrix_bytes": n_jobs * dim * 8,
+            "matrix_bytes": int(exact.matrix.nbytes),
+            **scan_throughput(lambda: exact.matrix @ queries[0], n_jobs, exact.matrix.nbytes, repeat),
+            "search": latency_summary(exact_latencies)
+        },
+        "compressed": []
+    }
+    configs = [(pca_dim, int8) for pca_dim in pca_dims for int8 in (False, True) if pca_dim or int8]
+    for pca_dim, int8 in configs:
+        start = time.perf_counter()
+        compressed = CompressedIndex.build(job_ids, exact.matrix, pca_dim, int8, n_candidates, seed)
+        build_seconds = time.perf_counter() - start
+        results, latencies = search_all(exact.with_index("compressed", compressed), queries)
+
+        matches, hits, max_diff = 0, 0, 0.0
+        for expected, actual in zip(truth, results):
+            expected_ids = [result['job_id'] for result in expected]
+            actual_ids = [result['job_id'] for result in actual]
+            matches += expected_ids == actual_ids
+            hits += len(set(expected_ids).intersection(actual_ids))
+            by_id = {result['job_id']: result['similarity'] for result in expected}
+            max_diff = max([max_diff] + [abs(by_id[result['job_id']] - result['similarity']) for result in actual if result['job_id'] in by_id])
+        report["compressed"].append({
+            "pca_dim": pca_dim or dim,
+            "int8": int8,
+            "build_seconds": round(build_seconds, 3),
+            "index_bytes": compressed.nbytes,
+            "bytes_per_vector": round(compressed.code_nbytes / n_jobs, 1),
+            **scan_throughput(lambda: compressed.approximate_scores(queries[:1]), n_jobs, compressed.code_nbytes, repeat),
+            "search": latency_summary(latencies),
+            "recall_at_5": round(hits / (TOP_N * n_queries), 4),
+            "top5_match_rate": round(matches / n_queries, 4),
+            "max_similarity_diff": max_diff
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--pca-dims", type=int, nargs="+", default=[128, 256, 0], help="0は削減しない（int8のみ）")
+    parser.add_argument("--candidates", type=int, default=COMPRESSED_CANDIDATES)
+    parser.add_argument("--repeat", type=int, default=20, help="走査速度の計測回数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONを書き出すパス")
+    args = parser.parse_args()
+
+    report = run(args.jobs, args.dim, args.queries, args.pca_dims, args.candidates, args.repeat, args.seed)
+    write_results("compressed", report, args.output)
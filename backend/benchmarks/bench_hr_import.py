@@ -0,0 +1,193 @@
+"""
+db_control/import_hr_data.py の取り込み速度と差分検出を合成データで計測する
+
+    python -m benchmarks.bench_hr_import --employees 50000 --jobs 10000 --format csv --output hr_import.json
+
+一時ディレクトリのDBに対して、初回の取り込み・同じファイルの再取り込み・一部を変更したファイルの取り込みを順に行う。
+変更を検出した従業員・求人のIDが実際に変更したIDと一致しない場合は終了コード1を返す。
+max_rss_mb にはSQLiteのmmap・ページキャッシュも含まれるため、Pythonのメモリ使用量だけを見る場合は
+SQLITE_MMAP_SIZE_BYTES=0 SQLITE_CACHE_SIZE_KB=2000 を指定して実行する。
+"""
+import argparse
+import csv
+import datetime
+import os
+import random
+import resource
+import sys
+import tempfile
+from typing import Any, Dict, Iterator, Set
+import orjson
+
+SKILLS_PER_EMPLOYEE = 5
+SKILLS_PER_JOB = 3
+EVALUATIONS_PER_EMPLOYEE = 3
+
+
+def employee_tables(i: int, modified: bool) -> Dict[str, list]:
+    # 変更する従業員は、IDに応じてキャリア情報・スキル・評価のいずれかを変える
+    from benchmarks.synthetic_data import N_DEPARTMENTS, N_GRADES, N_SKILLS, PASSWORD
+    kind = i % 3 if modified else -1
+    return {
+        "employee": [{
+            "employee_id": i,
+            "employee_name": f"employee{i}",
+            "password": PASSWORD,
+            "birthdate": datetime.date(1970 + i % 35, 1 + i % 12, 1 + i % 28).isoformat(),
+            "gender": "男性" if i % 2 else "女性",
+            "academic_background": f"大学{i % 50}",
+            "hire_date": datetime.date(2000 + i % 24, 4, 1).isoformat(),
+            "recruitment_type": "新卒" if i % 3 else "中途",
+            "career_info_detail": f"従業員{i}の職務経歴。プロジェクト{i % 97}を担当。" + ("異動あり。" if kind == 0 else ""),
+            "personality_detail": f"従業員{i}の性格。特性{i % 31}が強い。"
+        }],
+        "employee_skill": [
+            {"employee_id": i, "skill_id": (i * 7 + k * 13 + (kind == 1)) % N_SKILLS + 1} for k in range(SKILLS_PER_EMPLOYEE)
+        ],
+        "spi": [{
+            "employee_id": i,
+            "extraversion": i * 3 % 99 + 1,
+            "agreebleness": i * 5 % 99 + 1,
+            "conscientiousness": i * 7 % 99 + 1,
+            "neuroticism": i * 11 % 99 + 1,
+            "openness": i * 13 % 99 + 1
+        }],
+        "evaluation_history": [
+            {"employee_id": i, "evaluation_year": 2024 - k, "evaluation": "ABC"[(i + k + (kind == 2 and k == 0)) % 3], "evaluation_comment": f"{2024 - k}年度の評価"}
+            for k in range(EVALUATIONS_PER_EMPLOYEE)
+        ],
+        "department_member": [{"employee_id": i, "department_id": 1 + i % N_DEPARTMENTS}],
+        "employee_grade": [{"employee_id": i, "grade": 1 + i % N_GRADES}]
+    }
+
+
+def job_tables(i: int, modified: bool) -> Dict[str, list]:
+    # 変更する求人は、IDに応じて詳細または必要スキルを変える
+    from benchmarks.synthetic_data import N_DEPARTMENTS, N_SKILLS
+    kind = i % 2 if modified else -1
+    return {
+        "job_post": [{
+            "job_post_id": i,
+            "department_id": 1 + i % N_DEPARTMENTS,
+            "job_title": f"求人{i}",
+            "job_detail": f"求人{i}の詳細。スキル{i % N_SKILLS}を活かした業務。" + ("リモート可。" if kind == 0 else "")
+        }],
+        "required_skill": [
+            {"job_post_id": i, "skill_id": (i * 11 + k * 17 + (kind == 1)) % N_SKILLS + 1} for k in range(SKILLS_PER_JOB)
+        ]
+    }
+
+
+def _write_rows(path: str, fmt: str, rows: Iterator[Dict[str, Any]]) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = None
+        for row in rows:
+            if fmt == "csv":
+                if writer is None:
+                    writer = csv.DictWriter(f, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+            else:
+                f.write(orjson.dumps(row).decode("utf-8") + "\n")
+            count += 1
+    return count
+
+
+def write_files(directory: str, fmt: str, n_employees: int, n_jobs: int, modified_employees: Set[int], modified_jobs: Set[int]) -> Dict[str, str]:
+    # テーブルごとに1ファイルを、行を生成しながら書き出す
+    from hr_import import IMPORT_TABLES
+    os.makedirs(directory, exist_ok=True)
+    sources = {}
+    for table_name, spec in IMPORT_TABLES.items():
+        if spec.owner_column == "employee_id":
+            rows = (row for i in range(1, n_employees + 1) for row in employee_tables(i, i in modified_employees)[table_name])
+        else:
+            rows = (row for i in range(1, n_jobs + 1) for row in job_tables(i, i in modified_jobs)[table_name])
+        sources[table_name] = os.path.join(directory, f"{table_name}.{fmt}")
+        _write_rows(sources[table_name], fmt, rows)
+    return sources
+
+
+def _max_rss_mb() -> float:
+    # Linuxではキロバイト単位
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run(workdir: str, n_employees: int, n_jobs: int, fmt: str, modify_ratio: float, chunk_size: int, commit_rows: int, seed: int) -> Dict[str, Any]:
+    # DATABASE_URLを設定してから読み込む必要があるため、ここでimportする
+    from benchmarks.synthetic_data import _insert, N_DEPARTMENTS, N_GRADES, N_SKILLS
+    from database import SessionLocal, engine
+    from db_control.migrate_schema import migrate_schema
+    from hr_import import import_hr_data
+    import models
+
+    migrate_schema()
+    with engine.begin() as connection:
+        _insert(connection, models.Department, [
+            {"department_id": i, "department_name": f"部署{i}", "department_detail": f"部署{i}の説明"} for i in range(1, N_DEPARTMENTS + 1)
+        ])
+        _insert(connection, models.Grade, [{"grade_id": i, "grade_name": f"G{i}"} for i in range(1, N_GRADES + 1)])
+        _insert(connection, models.SkillList, [
+            {"skill_id": i, "skill_category": f"カテゴリ{i % 10}", "skill_name": f"スキル{i}"} for i in range(1, N_SKILLS + 1)
+        ])
+
+    rng = random.Random(seed)
+    modified_employees = set(rng.sample(range(1, n_employees + 1), round(n_employees * modify_ratio)))
+    modified_jobs = set(rng.sample(range(1, n_jobs + 1), round(n_jobs * modify_ratio)))
+    initial = write_files(os.path.join(workdir, "initial"), fmt, n_employees, n_jobs, set(), set())
+    phases = {
+        "initial": initial,
+        "unchanged": initial,
+        "modified": write_files(os.path.join(workdir, "modified"), fmt, n_employees, n_jobs, modified_employees, modified_jobs)
+    }
+    expected = {
+        "initial": (list(range(1, n_employees + 1)), list(range(1, n_jobs + 1))),
+        "unchanged": ([], []),
+        "modified": (sorted(modified_employees), sorted(modified_jobs))
+    }
+
+    report = {"n_employees": n_employees, "n_jobs": n_jobs, "format": fmt, "modify_ratio": modify_ratio, "phases": {}, "ok": True}
+    for phase, sources in phases.items():
+        db = SessionLocal()
+        try:
+            result = import_hr_data(db, sources, chunk_size=chunk_size, commit_rows=commit_rows)
+        finally:
+            db.close()
+        rows = sum(stats["rows"] for stats in result["tables"].values())
+        seconds = sum(stats["seconds"] for stats in result["tables"].values())
+        ok = (result["employee_ids"], result["job_post_ids"]) == expected[phase]
+        report["ok"] &= ok
+        report["phases"][phase] = {
+            "rows": rows,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(rows / seconds) if seconds else 0,
+            "changed_employees": len(result["employee_ids"]),
+            "changed_job_posts": len(result["job_post_ids"]),
+            "changed_ids_match": ok,
+            "max_rss_mb": _max_rss_mb(),
+            "tables": result["tables"]
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=50000)
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--modify-ratio", type=float, default=0.05, help="3回目の取り込みで内容を変える従業員・求人の割合")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--commit-rows", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONを書き出すパス")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        report = run(workdir, args.employees, args.jobs, args.format, args.modify_ratio, args.chunk_size, args.commit_rows, args.seed)
+    from benchmarks.common import write_results
+    write_results("hr_import", report, args.output)
+    if not report["ok"]:
+        sys.exit(1)
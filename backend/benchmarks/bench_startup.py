@@ -0,0 +1,124 @@
+"""
+main.py のimport時間と、APIサーバーの起動から /ready が200を返すまでの時間を計測する
+
+    python -m benchmarks.bench_startup --jobs 5000 --output startup.json
+
+import時間の中央値が --max-import-seconds を超えた場合は終了コード1で終了するため、
+コールドスタートの回帰チェックとしても使える。importに時間がかかっているモジュールの上位も出力する。
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+import httpx
+from benchmarks.load_test import BACKEND_DIR, free_port
+
+MAX_IMPORT_SECONDS = 1.5
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+IMPORTTIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure_import(env: Dict[str, str], repeat: int) -> Dict[str, Any]:
+    # 毎回新しいプロセスでimportする（.pycは1回目で作成されるため、1回目は計測に含めない）
+    samples = []
+    for i in range(repeat + 1):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True).stdout
+        if i:
+            samples.append(float(output.strip().splitlines()[-1]))
+    return {
+        "median_seconds": round(statistics.median(samples), 4),
+        "min_seconds": round(min(samples), 4),
+        "max_seconds": round(max(samples), 4),
+        "samples": len(samples)
+    }
+
+
+def slowest_imports(env: Dict[str, str], top: int) -> List[Dict[str, Any]]:
+    # python -X importtime で、mainが直接importしているモジュールを累積時間の大きい順に並べる
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True).stderr
+    # 子のモジュールは親より先に出力されるため、mainの行の直前までに出た1段下のモジュールが対象
+    children: List[Dict[str, Any]] = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if not match:
+            continue
+        depth = (len(match.group(3)) - 1) // 2
+        if depth == 1:
+            children.append({"module": match.group(4), "cumulative_ms": round(int(match.group(2)) / 1000, 1)})
+        elif depth == 0:
+            if match.group(4) == "main":
+                return sorted(children, key=lambda entry: -entry["cumulative_ms"])[:top]
+            children = []
+    return []
+
+
+def measure_startup(env: Dict[str, str], timeout: float = 120) -> Dict[str, Any]:
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    listening = None
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1)
+            except httpx.HTTPError:
+                time.sleep(0.02)
+                continue
+            if listening is None:
+                listening = time.perf_counter() - start
+            if response.status_code == 200:
+                return {
+                    "listening_seconds": round(listening, 4),
+                    "ready_seconds": round(time.perf_counter() - start, 4),
+                    "warmup": response.json()
+                }
+            time.sleep(0.02)
+        raise RuntimeError("Server did not become ready")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--repeat", type=int, default=5, help="import時間の計測回数")
+    parser.add_argument("--top", type=int, default=10, help="出力する時間のかかるimportの数")
+    parser.add_argument("--max-import-seconds", type=float, default=MAX_IMPORT_SECONDS)
+    parser.add_argument("--output", help="結果のJSONを書き出すパス")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache.db"),
+            OPENAI_API_KEY="benchmark"
+        )
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.synthetic_data", "--employees", str(args.employees), "--jobs", str(args.jobs), "--dim", str(args.dim)],
+            cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL
+        )
+        results = {
+            "import": measure_import(env, args.repeat),
+            "slowest_imports": slowest_imports(env, args.top),
+            "startup": measure_startup(env),
+            "startup_without_warmup": measure_startup(dict(env, WARMUP_ON_STARTUP="0"))
+        }
+    from benchmarks.common import write_results
+    write_results("bench_startup", {"config": config, "startup": results}, args.output)
+
+    if results["import"]["median_seconds"] > args.max_import_seconds:
+        print(f"import main took {results['import']['median_seconds']}s, exceeds {args.max_import_seconds}s", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,56 @@
+"""
+求人から候補者を探す従業員ベクトルインデックスの検索レイテンシを計測する
+
+    OMP_NUM_THREADS=1 python -m benchmarks.bench_talent_search --employees 100000 --dim 1536 --output talent.json
+"""
+import argparse
+import time
+import numpy as np
+from benchmarks.common import latency_summary, write_results
+from employee_index import EmployeeVectorIndex
+
+N_DEPARTMENTS = 20
+N_GRADES = 8
+TOP_N = 10
+
+
+def run(n_employees: int, dim: int, n_queries: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    employee_ids = np.arange(1, n_employees + 1, dtype=np.int64)
+    index = EmployeeVectorIndex.from_arrays(
+        employee_ids,
+        {"career_info_vector": rng.standard_normal((n_employees, dim), dtype=np.float32)},
+        grades=rng.integers(1, N_GRADES + 1, n_employees),
+        member_employee_ids=employee_ids,
+        member_department_ids=rng.integers(1, N_DEPARTMENTS + 1, n_employees)
+    )
+    queries = rng.standard_normal((n_queries, dim), dtype=np.float32)
+    filters = {
+        "none": {},
+        "departments[2]": {"department_ids": [1, 2]},
+        "grades[4]": {"grade_ids": [1, 2, 3, 4]},
+        "exclude_department": {"exclude_department_id": 1}
+    }
+
+    report = {"n_employees": n_employees, "dim": dim, "n_queries": n_queries, "filters": {}}
+    for name, kwargs in filters.items():
+        index.search(queries[0], "career_info_vector", TOP_N, **kwargs)
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, "career_info_vector", TOP_N, **kwargs)
+            latencies.append(time.perf_counter() - start)
+        report["filters"][name] = latency_summary(latencies)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONを書き出すパス")
+    args = parser.parse_args()
+
+    write_results("talent_search", run(args.employees, args.dim, args.queries, args.seed), args.output)
@@ -0,0 +1,84 @@
+"""ベンチマーク共通の集計・結果出力"""
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return round(float(np.percentile(samples, q)) * 1000, 3) if samples else 0.0
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """
+    秒単位のレイテンシのリストをミリ秒のp50/p95/p99に集計する
+
+    :param samples: レイテンシ（秒）のリスト
+    :return: 集計結果
+    """
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(np.mean(samples)) * 1000, 3) if samples else 0.0,
+        "p50_ms": percentile_ms(samples, 50),
+        "p95_ms": percentile_ms(samples, 95),
+        "p99_ms": percentile_ms(samples, 99)
+    }
+
+
+def time_calls(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """
+    関数をrepeat回実行してレイテンシを集計する
+
+    :param fn: 計測する関数
+    :param repeat: 計測回数
+    :param warmup: 計測前に実行する回数
+    :return: 集計結果
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_metadata() -> Dict[str, Any]:
+    """コミット間で結果を比較するための実行環境の情報"""
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor()
+    }
+
+
+def write_results(name: str, results: Dict[str, Any], output: Optional[str]) -> Dict[str, Any]:
+    """
+    結果をメタデータ付きのJSONとして標準出力とファイルに書き出す
+
+    :param name: ベンチマーク名
+    :param results: 結果
+    :param output: 出力先のパス（Noneの場合は標準出力のみ）
+    :return: 書き出した内容
+    """
+    report = {"benchmark": name, "metadata": run_metadata(), "results": results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    return report
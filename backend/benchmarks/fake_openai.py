@@ -0,0 +1,92 @@
+"""
+OpenAIのembeddings / chat completionsエンドポイントの決定的なスタブ
+
+    uvicorn benchmarks.fake_openai:app --port 9000
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=dummy uvicorn main:app
+
+FAKE_LLM_LATENCY_MS で応答までの待ち時間、FAKE_EMBEDDING_DIM でベクトルの次元数を指定できる。
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from embedding_cache import fake_embedding
+
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", "1536"))
+STREAM_CHUNK_CHARS = 16
+
+app = FastAPI()
+stats = {"embeddings": 0, "embedding_inputs": 0, "chat_completions": 0}
+
+
+def fake_completion_text(messages: List[Dict[str, Any]]) -> str:
+    # プロンプトに含まれる求人IDを使い、指定の形式どおりの推薦文を返す
+    prompt = " ".join(str(message.get("content", "")) for message in messages)
+    job_ids = re.findall(r'"job_id":\s*(\d+)', prompt)[:5] or [str(i) for i in range(1, 6)]
+    return "\n\n".join(
+        f"{rank}. 推奨求人：求人ID: {job_id}\n   マッチング理由：\n   ・これまでの経験が活かせます。\n   ・強みが発揮できる環境です。"
+        for rank, job_id in enumerate(job_ids, start=1)
+    )
+
+
+@app.post("/v1/embeddings")
+async def create_embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    stats["embeddings"] += 1
+    stats["embedding_inputs"] += len(inputs)
+    vectors = fake_embedding([str(text) for text in inputs], body.get("model", ""), FAKE_EMBEDDING_DIM)
+    tokens = sum(len(str(text)) for text in inputs)
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": vector.tolist()} for i, vector in enumerate(vectors)],
+        "model": body.get("model", ""),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+    }
+
+
+@app.post("/v1/chat/completions")
+async def create_chat_completion(request: Request):
+    body = await request.json()
+    stats["chat_completions"] += 1
+    if FAKE_LLM_LATENCY_MS:
+        await asyncio.sleep(FAKE_LLM_LATENCY_MS / 1000)
+    text = fake_completion_text(body.get("messages", []))
+    created = int(time.time())
+    prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+    completion_tokens = len(text) // 2
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    if body.get("stream"):
+        async def chunks():
+            for start in range(0, len(text), STREAM_CHUNK_CHARS):
+                chunk = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": body.get("model", ""),
+                    "choices": [{"index": 0, "delta": {"content": text[start:start + STREAM_CHUNK_CHARS]}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                # 本物のAPIと同様に、最後にchoicesが空のチャンクでトークン数を返す
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": body.get("model", ""), "choices": [], "usage": usage}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": created,
+        "model": body.get("model", ""),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": usage
+    }
+
+
+@app.get("/stats")
+async def read_stats():
+    return stats
@@ -0,0 +1,153 @@
+"""
+/token, /users/me, /recommendations に一定の同時実行数で負荷をかけ、p50/p95/p99とスループットを計測する
+
+    # 合成データ・OpenAIスタブ・APIサーバーを起動して計測する
+    python -m benchmarks.load_test --employees 1000 --jobs 1000 --concurrency 16 --requests 500 --output load.json
+
+    # 起動済みのサーバーに対して計測する（OpenAIスタブ・合成データは別途用意する）
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+import httpx
+from benchmarks.common import latency_summary, write_results
+from benchmarks.synthetic_data import PASSWORD
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("token", "users_me", "recommendations")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url: str, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server did not become ready: {url}")
+
+
+@contextmanager
+def spawned_servers(n_employees: int, n_jobs: int, dim: int, llm_latency_ms: float):
+    """合成データを作成し、OpenAIスタブとAPIサーバーを別プロセスで起動する（APIサーバーとスタブのURLを返す）"""
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache.db"),
+            FAKE_LLM_LATENCY_MS=str(llm_latency_ms),
+            FAKE_EMBEDDING_DIM=str(dim),
+            OPENAI_API_KEY="benchmark"
+        )
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.synthetic_data", "--employees", str(n_employees), "--jobs", str(n_jobs), "--dim", str(dim)],
+            cwd=BACKEND_DIR, env=env, check=True
+        )
+        fake_port, api_port = free_port(), free_port()
+        env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{fake_port}/v1"
+        processes = [
+            subprocess.Popen([sys.executable, "-m", "uvicorn", "benchmarks.fake_openai:app", "--port", str(fake_port), "--log-level", "warning"], cwd=BACKEND_DIR, env=env),
+            subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"], cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+        ]
+        try:
+            wait_until_ready(f"http://127.0.0.1:{fake_port}/stats")
+            wait_until_ready(f"http://127.0.0.1:{api_port}/docs")
+            yield f"http://127.0.0.1:{api_port}", f"http://127.0.0.1:{fake_port}"
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+
+async def run_scenario(client: httpx.AsyncClient, make_request: Callable[[int], Any], n_requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(n_requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await make_request(i)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        **latency_summary(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0
+    }
+
+
+async def run_load_test(base_url: str, n_users: int, n_requests: int, concurrency: int, scenarios, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    user_ids = [rng.randint(1, n_users) for _ in range(n_requests)]
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def login(i):
+            return await client.post("/token", data={"username": f"employee{user_ids[i]}", "password": PASSWORD})
+
+        tokens = {}
+        for user_id in sorted(set(user_ids)):
+            response = await client.post("/token", data={"username": f"employee{user_id}", "password": PASSWORD})
+            response.raise_for_status()
+            tokens[user_id] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        async def users_me(i):
+            return await client.get("/users/me", headers=tokens[user_ids[i]])
+
+        async def recommendations(i):
+            vector_type = "career" if i % 2 else "personality"
+            return await client.post("/recommendations", json={"vector_type": vector_type}, headers=tokens[user_ids[i]])
+
+        requests = {"token": login, "users_me": users_me, "recommendations": recommendations}
+        return {name: await run_scenario(client, requests[name], n_requests, concurrency) for name in scenarios}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="起動済みのAPIサーバーのURL（省略時は自動で起動する）")
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--users", type=int, default=200, help="リクエストに使う従業員数")
+    parser.add_argument("--requests", type=int, default=500, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONを書き出すパス")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    n_users = min(args.users, args.employees)
+    if args.base_url:
+        results = asyncio.run(run_load_test(args.base_url, n_users, args.requests, args.concurrency, args.scenarios, args.seed))
+    else:
+        with spawned_servers(args.employees, args.jobs, args.dim, args.llm_latency_ms) as (base_url, _):
+            results = asyncio.run(run_load_test(base_url, n_users, args.requests, args.concurrency, args.scenarios, args.seed))
+    write_results("load_test", {"config": config, "scenarios": results}, args.output)
@@ -0,0 +1,80 @@
+"""
+utils の主要な関数のマイクロベンチマーク
+
+    python -m benchmarks.microbench --employees 1000 --jobs 5000 --output micro.json
+
+--database-url を指定しない場合は一時ディレクトリに合成データを作成する。
+"""
+import argparse
+import os
+import random
+import tempfile
+from typing import Any, Dict
+
+
+def run(n_employees: int, n_jobs: int, dim: int, repeat: int, seed: int) -> Dict[str, Any]:
+    # DATABASE_URLを設定してから読み込む必要があるため、ここでimportする
+    from benchmarks.common import time_calls
+    from benchmarks.synthetic_data import generate
+    from database import SessionLocal
+    import models
+    from utils import get_all_job_post_vectors, get_top_similar_jobs_for_vectors, get_all_employee_data, get_employee_vectors, load_employee_profile, get_top_hybrid_jobs_for_employees, resolve_hybrid_weights
+    from skill_index import JobSkillIndex
+    from vector_index import JobVectorIndex
+
+    if n_employees:
+        generate(n_employees, n_jobs, dim, seed)
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        n_employees = db.query(models.Employee).count()
+        employee_ids = [rng.randint(1, n_employees) for _ in range(repeat + 1)]
+        employee_vector = {"career_info_vector": get_employee_vectors(db, employee_ids[0])["career_info_vector"]}
+        job_vectors = get_all_job_post_vectors(db)
+        job_index = JobVectorIndex(search_backend="exact")
+        job_index.refresh(db)
+        skill_index = JobSkillIndex()
+        skill_index.refresh(db)
+        hybrid_weights = resolve_hybrid_weights()
+
+        def lazy_profile():
+            db.expunge_all()
+            employee = db.query(models.Employee).filter(models.Employee.employee_id == rng.choice(employee_ids)).first()
+            get_all_employee_data(db, employee)
+
+        def eager_profile():
+            db.expunge_all()
+            get_all_employee_data(db, load_employee_profile(db, rng.choice(employee_ids)))
+
+        return {
+            "get_all_job_post_vectors": time_calls(lambda: get_all_job_post_vectors(db), repeat),
+            "get_top_similar_jobs_for_vectors[dict]": time_calls(lambda: get_top_similar_jobs_for_vectors(employee_vector, job_vectors, return_percentage=True), repeat),
+            "get_top_similar_jobs_for_vectors[index]": time_calls(lambda: get_top_similar_jobs_for_vectors(employee_vector, job_index, return_percentage=True), repeat),
+            "get_top_hybrid_jobs_for_employees[1]": time_calls(lambda: get_top_hybrid_jobs_for_employees(db, [rng.choice(employee_ids)], job_index, skill_index, hybrid_weights), repeat),
+            "get_top_hybrid_jobs_for_employees[100]": time_calls(lambda: get_top_hybrid_jobs_for_employees(db, employee_ids[:100], job_index, skill_index, hybrid_weights), repeat),
+            "job_vector_index.refresh[unchanged]": time_calls(lambda: job_index.refresh(db), repeat),
+            "get_all_employee_data[lazy]": time_calls(lazy_profile, repeat),
+            "get_all_employee_data[eager]": time_calls(eager_profile, repeat)
+        }
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="既存のデータベース（指定した場合は合成データを作成しない）")
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONを書き出すパス")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "database_url")}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        results = run(0 if args.database_url else args.employees, args.jobs, args.dim, args.repeat, args.seed)
+    from benchmarks.common import write_results
+    write_results("microbench", {"config": config, "functions": results}, args.output)
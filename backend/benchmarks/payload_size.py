@@ -0,0 +1,95 @@
+"""
+/recommendations のレスポンスと推薦文生成プロンプトのサイズを計測する
+
+    python -m benchmarks.payload_size --employees 100 --jobs 1000 --output payload.json
+
+レスポンスのバイト数かプロンプトのトークン数が上限を超えた場合は終了コード1で終了するため、
+回帰チェックとしても使える。トークン数はtiktokenがあれば実測し、なければ概算する。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+MAX_RESPONSE_BYTES = 16 * 1024
+MAX_PROMPT_TOKENS = 4000
+TOKENIZER_ENCODING = "o200k_base"
+
+
+def count_tokens(text: str) -> Dict[str, Any]:
+    try:
+        import tiktoken
+    except ImportError:
+        # 日本語混じりのテキストはUTF-8で3バイト前後が1トークンになるため、その値で概算する
+        return {"tokens": len(text.encode("utf-8")) // 3, "estimated": True}
+    return {"tokens": len(tiktoken.get_encoding(TOKENIZER_ENCODING).encode(text)), "estimated": False}
+
+
+def run(n_employees: int, n_jobs: int, dim: int, samples: int, seed: int) -> Dict[str, Any]:
+    # DATABASE_URLを設定してから読み込む必要があるため、ここでimportする
+    import orjson
+    from benchmarks.synthetic_data import generate
+    from database import SessionLocal
+    import models
+    from main import prepare_job_recommendations
+    from utils import JOB_RESPONSE_FIELDS, DEFAULT_JOB_FIELDS, VECTOR_TYPE_COLUMNS, build_recommendation_messages
+
+    if n_employees:
+        generate(n_employees, n_jobs, dim, seed)
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        n_employees = db.query(models.Employee).count()
+        response_bytes: Dict[str, List[int]] = {"default": [], "with_vector": []}
+        prompt_tokens: List[int] = []
+        estimated = False
+        for i in range(samples):
+            employee = db.get(models.Employee, rng.randint(1, n_employees))
+            vector_type = list(VECTOR_TYPE_COLUMNS)[i % len(VECTOR_TYPE_COLUMNS)]
+            for name, fields in (("default", DEFAULT_JOB_FIELDS), ("with_vector", JOB_RESPONSE_FIELDS)):
+                prepared, top_jobs, _, _ = prepare_job_recommendations(db, employee, vector_type, fields)
+                response_bytes[name].append(len(orjson.dumps({"recommendations": {}, "top_jobs": top_jobs}, option=orjson.OPT_SERIALIZE_NUMPY)))
+            for vec_type, prepared_data in prepared.items():
+                messages = build_recommendation_messages(prepared_data, vec_type)
+                counted = count_tokens("".join(message["content"] for message in messages))
+                prompt_tokens.append(counted["tokens"])
+                estimated = estimated or counted["estimated"]
+        return {
+            "response_bytes": {name: {"max": max(values), "mean": round(sum(values) / len(values), 1)} for name, values in response_bytes.items()},
+            "prompt_tokens": {"max": max(prompt_tokens), "mean": round(sum(prompt_tokens) / len(prompt_tokens), 1), "estimated": estimated}
+        }
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="既存のデータベース（指定した場合は合成データを作成しない）")
+    parser.add_argument("--employees", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-response-bytes", type=int, default=MAX_RESPONSE_BYTES)
+    parser.add_argument("--max-prompt-tokens", type=int, default=MAX_PROMPT_TOKENS)
+    parser.add_argument("--output", help="結果のJSONを書き出すパス")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "database_url")}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        results = run(0 if args.database_url else args.employees, args.jobs, args.dim, args.samples, args.seed)
+    from benchmarks.common import write_results
+    write_results("payload_size", {"config": config, "payloads": results}, args.output)
+
+    failures = []
+    if results["response_bytes"]["default"]["max"] > args.max_response_bytes:
+        failures.append(f"response size {results['response_bytes']['default']['max']} bytes exceeds {args.max_response_bytes}")
+    if results["prompt_tokens"]["max"] > args.max_prompt_tokens:
+        failures.append(f"prompt size {results['prompt_tokens']['max']} tokens exceeds {args.max_prompt_tokens}")
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,143 @@
+"""
+models.py のスキーマに合成データを投入する
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.synthetic_data --employees 10000 --jobs 5000
+
+ログインはユーザー名 employee{ID}、パスワード password で行える。
+既存のデータをすべて削除するため、DATABASE_URLで既定値（開発用DB）以外の投入先を明示しないと実行しない。
+"""
+import argparse
+import datetime
+import os
+import time
+from typing import Dict, List
+import numpy as np
+from sqlalchemy import insert
+from database import engine, DEFAULT_DATABASE_URL, SQLALCHEMY_DATABASE_URL
+import models
+from db_control.migrate_schema import migrate_schema
+
+PASSWORD = "password"
+CHUNK_SIZE = 5000
+N_DEPARTMENTS = 20
+N_GRADES = 8
+N_SKILLS = 200
+SKILLS_PER_EMPLOYEE = 5
+SKILLS_PER_JOB = 3
+EVALUATIONS_PER_EMPLOYEE = 3
+
+
+def random_vectors(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _insert(connection, model, rows: List[Dict]) -> None:
+    if rows:
+        connection.execute(insert(model.__table__), rows)
+
+
+def check_target_database() -> None:
+    """
+    投入先が明示されていることを確認する
+
+    :raises RuntimeError: DATABASE_URLが未設定、または既定値（開発用DB）の場合
+    """
+    if not os.getenv("DATABASE_URL") or SQLALCHEMY_DATABASE_URL == DEFAULT_DATABASE_URL:
+        raise RuntimeError(f"既存のデータを削除するため、DATABASE_URLで {DEFAULT_DATABASE_URL} 以外の投入先を指定してください")
+
+
+def generate(n_employees: int, n_jobs: int, dim: int = 1536, seed: int = 0) -> Dict[str, float]:
+    """
+    合成データを投入する（既存のデータがある場合は先に削除する）
+
+    :param n_employees: 従業員数
+    :param n_jobs: 求人数
+    :param dim: ベクトルの次元数
+    :param seed: 乱数シード
+    :return: 件数と所要時間
+    :raises RuntimeError: 投入先が明示されていない場合
+    """
+    check_target_database()
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    migrate_schema()
+    with engine.begin() as connection:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+        _insert(connection, models.Department, [
+            {"department_id": i, "department_name": f"部署{i}", "department_detail": f"部署{i}の説明"} for i in range(1, N_DEPARTMENTS + 1)
+        ])
+        _insert(connection, models.Grade, [{"grade_id": i, "grade_name": f"G{i}"} for i in range(1, N_GRADES + 1)])
+        _insert(connection, models.SkillList, [
+            {"skill_id": i, "skill_category": f"カテゴリ{i % 10}", "skill_name": f"スキル{i}"} for i in range(1, N_SKILLS + 1)
+        ])
+
+        for chunk_start in range(1, n_employees + 1, CHUNK_SIZE):
+            ids = range(chunk_start, min(chunk_start + CHUNK_SIZE, n_employees + 1))
+            career = random_vectors(rng, len(ids), dim)
+            personality = random_vectors(rng, len(ids), dim)
+            _insert(connection, models.Employee, [{
+                "employee_id": i,
+                "employee_name": f"employee{i}",
+                "password": PASSWORD,
+                "birthdate": datetime.date(1970 + i % 35, 1 + i % 12, 1 + i % 28),
+                "gender": "男性" if i % 2 else "女性",
+                "academic_background": f"大学{i % 50}",
+                "hire_date": datetime.date(2000 + i % 24, 4, 1),
+                "recruitment_type": "新卒" if i % 3 else "中途",
+                "career_info_detail": f"従業員{i}の職務経歴。プロジェクト{i % 97}を担当。",
+                "personality_detail": f"従業員{i}の性格。特性{i % 31}が強い。",
+                "career_info_vector": career[k],
+                "personality_vector": personality[k]
+            } for k, i in enumerate(ids)])
+            _insert(connection, models.EmployeeGrade, [{"employee_id": i, "grade": 1 + i % N_GRADES} for i in ids])
+            _insert(connection, models.DepartmentMember, [{"employee_id": i, "department_id": 1 + i % N_DEPARTMENTS} for i in ids])
+            _insert(connection, models.Spi, [{
+                "employee_id": i,
+                "extraversion": int(rng.integers(1, 100)),
+                "agreebleness": int(rng.integers(1, 100)),
+                "conscientiousness": int(rng.integers(1, 100)),
+                "neuroticism": int(rng.integers(1, 100)),
+                "openness": int(rng.integers(1, 100))
+            } for i in ids])
+            _insert(connection, models.EmployeeSkill, [
+                {"employee_id": i, "skill_id": int(skill)}
+                for i in ids for skill in rng.choice(N_SKILLS, SKILLS_PER_EMPLOYEE, replace=False) + 1
+            ])
+            _insert(connection, models.EvaluationHistory, [
+                {"employee_id": i, "evaluation_year": 2024 - k, "evaluation": "ABC"[(i + k) % 3], "evaluation_comment": f"{2024 - k}年度の評価"}
+                for i in ids for k in range(EVALUATIONS_PER_EMPLOYEE)
+            ])
+
+        for chunk_start in range(1, n_jobs + 1, CHUNK_SIZE):
+            ids = range(chunk_start, min(chunk_start + CHUNK_SIZE, n_jobs + 1))
+            vectors = random_vectors(rng, len(ids), dim)
+            _insert(connection, models.JobPost, [{
+                "job_post_id": i,
+                "department_id": 1 + i % N_DEPARTMENTS,
+                "job_title": f"求人{i}",
+                "job_detail": f"求人{i}の詳細。スキル{i % N_SKILLS}を活かした業務。"
+            } for i in ids])
+            _insert(connection, models.JobPostVector, [{"job_post_id": i, "vector": vectors[k]} for k, i in enumerate(ids)])
+            _insert(connection, models.RequiredSkill, [
+                {"job_post_id": i, "skill_id": int(skill)}
+                for i in ids for skill in rng.choice(N_SKILLS, SKILLS_PER_JOB, replace=False) + 1
+            ])
+
+    return {"employees": n_employees, "jobs": n_jobs, "dim": dim, "seconds": round(time.perf_counter() - start, 2)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        check_target_database()
+    except RuntimeError as e:
+        parser.error(str(e))
+    print(generate(args.employees, args.jobs, args.dim, args.seed))
@@ -0,0 +1,174 @@
+# compressed_index.py
+import os
+from typing import Optional
+import numpy as np
+from vector_index import top_k_rows
+
+# PCAで削減した後の次元数（0の場合は削減しない）
+COMPRESSED_PCA_DIM = int(os.getenv("COMPRESSED_PCA_DIM", "256"))
+# 1の場合は削減後のベクトルをさらにint8に量子化する（メモリは1/4になるが、numpyではfloat32への変換が入るため走査は速くならない）
+COMPRESSED_INT8 = os.getenv("COMPRESSED_INT8", "0") == "1"
+# 1段目の走査で残し、全精度で計算し直す候補の数
+COMPRESSED_CANDIDATES = int(os.getenv("COMPRESSED_CANDIDATES", "500"))
+# PCAの学習に使う最大サンプル数
+FIT_SAMPLE_SIZE = 20000
+# 走査で一度に処理する行数（int8の場合はこの行数ずつfloat32に変換する）
+SCAN_CHUNK_SIZE = 16384
+
+
+class CompressedIndex:
+    """
+    求人ベクトルをPCAで削減（オプションでint8に量子化）した行列を持ち、全精度で計算し直す候補を絞り込むインデックス
+    スコアは内積の近似で、平均ベクトルとの内積はすべての求人で共通のため順位には影響しない
+    """
+
+    def __init__(self, components: np.ndarray, scales: Optional[np.ndarray] = None, n_candidates: int = COMPRESSED_CANDIDATES):
+        # 元の次元 × 削減後の次元 の射影行列
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        # 次元ごとの量子化の幅（Noneの場合はfloat32のまま持つ）
+        self.scales = None if scales is None else np.asarray(scales, dtype=np.float32)
+        self.n_candidates = n_candidates
+        self._ids = np.empty(0, dtype=np.int64)
+        self._codes = np.empty((0, self.components.shape[1]), dtype=self.code_dtype)
+        # インデックスに反映済みのdata_change_logの変更ID
+        self.generation = 0
+
+    @property
+    def code_dtype(self):
+        return np.float32 if self.scales is None else np.int8
+
+    @classmethod
+    def build(cls, job_ids: np.ndarray, matrix: np.ndarray, pca_dim: int = COMPRESSED_PCA_DIM, int8: bool = COMPRESSED_INT8, n_candidates: int = COMPRESSED_CANDIDATES, seed: int = 0) -> "CompressedIndex":
+        """
+        正規化済みのベクトル行列から射影行列と量子化の幅を学習してインデックスを作成する
+
+        :param job_ids: 求人IDの配列
+        :param matrix: 正規化済みのベクトル行列
+        :param pca_dim: 削減後の次元数（0または元の次元以上の場合は削減しない）
+        :param int8: int8に量子化するかどうかのフラグ
+        :param n_candidates: 全精度で計算し直す候補の数
+        :param seed: 乱数シード
+        :return: CompressedIndex
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        dim = matrix.shape[1]
+        rng = np.random.default_rng(seed)
+        sample = matrix[rng.choice(len(matrix), FIT_SAMPLE_SIZE, replace=False)] if len(matrix) > FIT_SAMPLE_SIZE else matrix
+        if 0 < pca_dim < dim:
+            # 共分散行列の固有ベクトルのうち、固有値の大きいものから射影行列を作る
+            centered = sample - sample.mean(axis=0)
+            _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+            components = eigenvectors[:, ::-1][:, :pca_dim]
+        else:
+            components = np.eye(dim, dtype=np.float32)
+        scales = None
+        if int8:
+            projected = sample @ components.astype(np.float32)
+            scales = np.abs(projected).max(axis=0) / 127
+            scales[scales == 0] = 1
+        index = cls(components, scales, n_candidates)
+        index.add(job_ids, matrix)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def code_nbytes(self) -> int:
+        # 1段目の走査で読むバイト数
+        return int(self._codes.nbytes)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._ids.nbytes + self._codes.nbytes + self.components.nbytes)
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        projected = np.asarray(matrix, dtype=np.float32) @ self.components
+        if self.scales is None:
+            return np.ascontiguousarray(projected)
+        return np.clip(np.rint(projected / self.scales), -127, 127).astype(np.int8)
+
+    def add(self, job_ids: np.ndarray, matrix: np.ndarray) -> None:
+        """
+        ベクトルを追加する（既存のIDは置き換える）
+
+        :param job_ids: 求人IDの配列
+        :param matrix: 正規化済みのベクトル行列
+        """
+        job_ids = np.asarray(job_ids, dtype=np.int64)
+        if not len(job_ids):
+            return
+        self.remove(job_ids)
+        self._ids = np.concatenate([self._ids, job_ids])
+        self._codes = np.vstack([self._codes, self.encode(matrix)])
+
+    def remove(self, job_ids: np.ndarray) -> None:
+        """
+        ベクトルを削除する（存在しないIDは無視する）
+
+        :param job_ids: 求人IDの配列
+        """
+        keep = ~np.isin(self._ids, np.asarray(job_ids, dtype=np.int64))
+        if not keep.all():
+            self._ids, self._codes = self._ids[keep], self._codes[keep]
+
+    def approximate_scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        削減した行列で内積を近似する（平均ベクトルとの内積の分だけずれるが、求人間の順位は保たれる）
+
+        :param queries: 正規化済みのクエリを行に持つ2次元配列
+        :return: クエリ数 × 求人数 の近似スコア
+        """
+        projected = np.asarray(queries, dtype=np.float32) @ self.components
+        if self.scales is None:
+            return projected @ self._codes.T
+        projected *= self.scales
+        scores = np.empty((len(projected), len(self._ids)), dtype=np.float32)
+        for start in range(0, len(self._ids), SCAN_CHUNK_SIZE):
+            scores[:, start:start + SCAN_CHUNK_SIZE] = projected @ self._codes[start:start + SCAN_CHUNK_SIZE].astype(np.float32).T
+        return scores
+
+    def candidates(self, queries: np.ndarray, top_n: int) -> np.ndarray:
+        """
+        近似スコアの上位の求人IDをクエリごとに取得する
+
+        :param queries: 正規化済みのクエリを行に持つ2次元配列
+        :param top_n: 必要な件数（候補はこれとn_candidatesの大きい方）
+        :return: クエリ数 × 候補数 の求人IDの配列
+        """
+        n_candidates = min(max(top_n, self.n_candidates), len(self._ids))
+        return self._ids[top_k_rows(self.approximate_scores(queries), n_candidates)]
+
+    def save(self, path: str) -> None:
+        """
+        インデックスをファイルに保存する（一時ファイルに書いてから置き換える）
+
+        :param path: 保存先のパス（.npz）
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                components=self.components,
+                scales=self.scales if self.scales is not None else np.empty(0, dtype=np.float32),
+                ids=self._ids,
+                codes=self._codes,
+                n_candidates=self.n_candidates,
+                generation=self.generation
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CompressedIndex":
+        """
+        保存したインデックスを読み込む
+
+        :param path: 保存したパス（.npz）
+        :return: CompressedIndex
+        """
+        with np.load(path) as data:
+            index = cls(data["components"], data["scales"] if len(data["scales"]) else None, int(data["n_candidates"]))
+            index._ids = data["ids"]
+            index._codes = data["codes"]
+            index.generation = int(data["generation"])
+        return index
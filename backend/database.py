@@ -1,11 +1,99 @@
 # /Users/takuya/Documents/talent-flow1.1/fastapi-backend/database.py
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./R&D.db"
+DEFAULT_DATABASE_URL = "sqlite:///./R&D.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
+# 省略時はDATABASE_URLのドライバを非同期ドライバに置き換えたURLを使う
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# コネクションプール（SQLiteのインメモリDBでは使わない）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+# SQLiteの接続ごとに設定するPRAGMA
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_MMAP_SIZE_BYTES = int(os.getenv("SQLITE_MMAP_SIZE_BYTES", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# 同期ドライバと非同期ドライバの対応
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg"
+}
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def to_async_url(url: str) -> str:
+    """
+    同期ドライバのURLを非同期ドライバのURLに変換する
+
+    :param url: データベースURL
+    :return: 非同期ドライバのURL
+    :raises ValueError: 対応する非同期ドライバがない場合
+    """
+    parsed = make_url(url)
+    if parsed.get_driver_name() in ("aiosqlite", "asyncpg"):
+        return url
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for: {backend}")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def engine_options(url: str) -> dict:
+    """
+    URLに応じたcreate_engineの引数を作成する
+
+    :param url: データベースURL
+    :return: create_engine / create_async_engine に渡す引数
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+            "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+            "pool_pre_ping": True
+        }
+    options = {"connect_args": {"check_same_thread": False}}
+    if parsed.database and parsed.database != ":memory:":
+        from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+        options.update(
+            poolclass=AsyncAdaptedQueuePool if parsed.get_driver_name() == "aiosqlite" else QueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT_SECONDS
+        )
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # WALにすることで、ベクトル再構築などの書き込み中も読み取りがブロックされない
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_BYTES}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+if is_sqlite(SQLALCHEMY_DATABASE_URL):
+    event.listen(engine, "connect", set_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -16,3 +104,56 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# 非同期エンジンは非同期ドライバ（aiosqlite / asyncpg）が必要なため、最初に使われた時点で作成する
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        url = ASYNC_DATABASE_URL or to_async_url(SQLALCHEMY_DATABASE_URL)
+        _async_engine = create_async_engine(url, **engine_options(url))
+        if is_sqlite(url):
+            event.listen(_async_engine.sync_engine, "connect", set_sqlite_pragmas)
+    return _async_engine
+
+def AsyncSessionLocal():
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _async_sessionmaker = async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def dispose_async_engine():
+    # 終了時に非同期エンジンの接続を閉じる（作成されていなければ何もしない）
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_sessionmaker = None
+
+def upsert_statement(bind, table, index_elements, update_columns):
+    """
+    一意キーが重複した場合に更新するINSERT文を作成する（executemanyで一括実行できる）
+
+    :param bind: エンジンまたはセッションのバインド
+    :param table: 対象のテーブル
+    :param index_elements: 重複判定に使うカラム名のリスト
+    :param update_columns: 重複時に更新するカラム名のリスト
+    :return: INSERT ... ON CONFLICT DO UPDATE 文
+    """
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: statement.excluded[column] for column in update_columns}
+    )
@@ -0,0 +1,29 @@
+import argparse
+import time
+from database import SessionLocal
+from ann_index import IVFFlatIndex, ANN_N_LISTS, ANN_N_PROBE
+from vector_index import JobVectorIndex, ANN_INDEX_PATH
+
+def build_ann_index(n_lists: int = ANN_N_LISTS, n_probe: int = ANN_N_PROBE, path: str = ANN_INDEX_PATH):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        job_index = JobVectorIndex(search_backend="exact")
+        job_index.refresh(db)
+        ann = IVFFlatIndex.build(job_index.job_ids, job_index.matrix, n_lists, n_probe)
+        # 作成時点の世代を記録し、APIサーバーは以降の変更だけを反映する
+        ann.generation = job_index.generation
+        ann.save(path)
+        print(f"ANN index built: {len(ann)} vectors, {len(ann.centroids)} lists in {time.perf_counter() - start:.1f}s -> {path}")
+    except Exception as e:
+        print(f"Error building ANN index: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="job_post_vectorsからIVF-flatインデックスを作成する")
+    parser.add_argument("--n-lists", type=int, default=ANN_N_LISTS, help="クラスタ数（0の場合は自動）")
+    parser.add_argument("--n-probe", type=int, default=ANN_N_PROBE, help="検索時に調べるクラスタ数の既定値")
+    parser.add_argument("--path", default=ANN_INDEX_PATH)
+    args = parser.parse_args()
+    build_ann_index(args.n_lists, args.n_probe, args.path)
@@ -0,0 +1,33 @@
+import argparse
+import time
+from database import SessionLocal
+from compressed_index import CompressedIndex, COMPRESSED_CANDIDATES, COMPRESSED_INT8, COMPRESSED_PCA_DIM
+from vector_index import JobVectorIndex, COMPRESSED_INDEX_PATH
+
+def build_compressed_index(pca_dim: int = COMPRESSED_PCA_DIM, int8: bool = COMPRESSED_INT8, n_candidates: int = COMPRESSED_CANDIDATES, path: str = COMPRESSED_INDEX_PATH):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        job_index = JobVectorIndex(search_backend="exact")
+        job_index.refresh(db)
+        compressed = CompressedIndex.build(job_index.job_ids, job_index.matrix, pca_dim, int8, n_candidates)
+        # 作成時点の世代を記録し、APIサーバーは以降の変更だけを反映する
+        compressed.generation = job_index.generation
+        compressed.save(path)
+        print(
+            f"Compressed index built: {len(compressed)} vectors, {job_index.matrix.shape[1]} -> {compressed.components.shape[1]} dims"
+            f"{' (int8)' if int8 else ''}, {compressed.nbytes / 2**20:.1f} MiB in {time.perf_counter() - start:.1f}s -> {path}"
+        )
+    except Exception as e:
+        print(f"Error building compressed index: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="job_post_vectorsからPCA（オプションでint8量子化）で削減したインデックスを作成する")
+    parser.add_argument("--pca-dim", type=int, default=COMPRESSED_PCA_DIM, help="削減後の次元数（0の場合は削減しない）")
+    parser.add_argument("--int8", action="store_true", default=COMPRESSED_INT8, help="削減後のベクトルをint8に量子化する")
+    parser.add_argument("--candidates", type=int, default=COMPRESSED_CANDIDATES, help="全精度で計算し直す候補の数")
+    parser.add_argument("--path", default=COMPRESSED_INDEX_PATH)
+    args = parser.parse_args()
+    build_compressed_index(args.pca_dim, args.int8, args.candidates, args.path)
@@ -0,0 +1,60 @@
+import argparse
+import time
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session, aliased
+from database import SessionLocal
+from models import DataChangeLog
+
+# 1回のDELETEで対象にする変更IDの範囲（書き込みロックを長時間保持しないようにする）
+COMPACT_BATCH_SIZE = 50000
+
+def compact_change_log(db: Session, batch_size: int = COMPACT_BATCH_SIZE) -> int:
+    """
+    同じ行(table_name, row_id)により新しい変更がある古い変更ログを削除する
+
+    変更ログの利用側（求人・従業員ベクトルのインデックス、事前計算した推薦、/users/me のキャッシュとETag、推薦文キャッシュの世代）は
+    「ある変更ID以降に変更された行」と「テーブル・行ごとの最新の変更ID」しか参照しないため、行ごとに最新の1件を残せば結果は変わらない
+    保存されていないワーカーのプロセス内の反映位置がどれだけ古くても変更を見落とさず、最新の変更IDも小さくならない（IDは再利用されない）
+
+    :param db: データベースセッション
+    :param batch_size: 1回のDELETEで対象にする変更IDの範囲
+    :return: 削除した行数
+    """
+    first, last = db.query(func.min(DataChangeLog.change_id), func.max(DataChangeLog.change_id)).one()
+    if first is None:
+        return 0
+    newer = aliased(DataChangeLog)
+    superseded = select(newer.change_id).where(
+        newer.table_name == DataChangeLog.table_name,
+        newer.row_id == DataChangeLog.row_id,
+        newer.change_id > DataChangeLog.change_id
+    ).exists()
+    deleted = 0
+    for start in range(first - 1, last, batch_size):
+        result = db.execute(delete(DataChangeLog).where(
+            DataChangeLog.change_id > start,
+            DataChangeLog.change_id <= start + batch_size,
+            superseded
+        ))
+        db.commit()
+        deleted += result.rowcount
+    return deleted
+
+def compact(batch_size: int = COMPACT_BATCH_SIZE):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        deleted = compact_change_log(db, batch_size)
+        print(f"Data change log compacted: {deleted} superseded rows removed in {time.perf_counter() - start:.1f}s.")
+        return deleted
+    except Exception as e:
+        print(f"Error compacting data change log: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="data_change_logから、同じ行により新しい変更がある古い行を削除する")
+    parser.add_argument("--batch-size", type=int, default=COMPACT_BATCH_SIZE)
+    args = parser.parse_args()
+    compact(args.batch_size)
@@ -0,0 +1,34 @@
+import argparse
+import time
+from database import SessionLocal
+from vector_index import JobVectorIndex
+from vector_snapshot import VECTOR_SNAPSHOT_DIR, VectorSnapshotStore
+
+def export_vector_snapshot(directory: str = VECTOR_SNAPSHOT_DIR, full: bool = False):
+    if not directory:
+        print("Error exporting job vector snapshot: VECTOR_SNAPSHOT_DIR is not set.")
+        return None
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        # 公開中のスナップショットがあれば、それに変更分だけを反映して書き出す（--fullの場合はDBから全件読み込む）
+        job_index = JobVectorIndex(search_backend="exact", snapshot_dir=None if full else directory)
+        job_index.refresh(db)
+        job_index.snapshot_store = job_index.snapshot_store or VectorSnapshotStore(directory)
+        manifest = job_index.publish_snapshot()
+        print(
+            f"Job vector snapshot exported: {manifest['count']} vectors at generation {manifest['generation']} "
+            f"in {time.perf_counter() - start:.1f}s -> {manifest['path']}"
+        )
+        return manifest
+    except Exception as e:
+        print(f"Error exporting job vector snapshot: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="求人ベクトルの行列をAPIサーバーの全ワーカーで共有するスナップショットとして書き出す")
+    parser.add_argument("--dir", default=VECTOR_SNAPSHOT_DIR, help="書き出し先（既定値は環境変数 VECTOR_SNAPSHOT_DIR）")
+    parser.add_argument("--full", action="store_true", help="公開中のスナップショットを使わずDBから全件読み込む")
+    args = parser.parse_args()
+    export_vector_snapshot(args.dir, args.full)
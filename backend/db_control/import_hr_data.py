@@ -0,0 +1,41 @@
+import argparse
+import time
+from database import SessionLocal
+from hr_import import import_hr_data, write_changed_ids, IMPORT_TABLES, IMPORT_CHUNK_SIZE, IMPORT_COMMIT_ROWS
+
+def import_hr_files(sources: dict, force: bool = False, chunk_size: int = IMPORT_CHUNK_SIZE, commit_rows: int = IMPORT_COMMIT_ROWS, changed_ids_path: str = None):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        result = import_hr_data(db, sources, force, chunk_size, commit_rows)
+        for table_name, stats in result["tables"].items():
+            print(
+                f"{table_name}: {stats['rows']} rows for {stats['owners']} owners, {stats['changed']} changed, "
+                f"{stats['skipped']} unchanged in {stats['seconds']:.1f}s ({stats['rows_per_second']} rows/s)"
+            )
+        if changed_ids_path:
+            write_changed_ids(changed_ids_path, result)
+        print(
+            f"HR data imported in {time.perf_counter() - start:.1f}s: {len(result['employee_ids'])} employees and "
+            f"{len(result['job_post_ids'])} job posts changed."
+        )
+        return result
+    except Exception as e:
+        print(f"Error importing HR data: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="人事データのCSV/JSONLを取り込む（内容が変わっていない従業員・求人は書き込まない）")
+    for table_name in IMPORT_TABLES:
+        parser.add_argument(f"--{table_name.replace('_', '-')}", metavar="PATH", help=f"{table_name} のファイル（.csv, .jsonl, .ndjson。.gzも可）")
+    parser.add_argument("--force", action="store_true", help="内容が同じでも書き込む")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="差分の判定と書き込みをまとめて行う従業員・求人の数")
+    parser.add_argument("--commit-rows", type=int, default=IMPORT_COMMIT_ROWS, help="この行数を書き込むごとにコミットする")
+    parser.add_argument("--changed-ids", metavar="PATH", help="内容が変わった従業員・求人のIDを書き出すJSONファイル（update_*_vectors.py の --ids-file に渡す）")
+    args = parser.parse_args()
+    sources = {table_name: getattr(args, table_name) for table_name in IMPORT_TABLES if getattr(args, table_name)}
+    if not sources:
+        parser.error("no input files")
+    import_hr_files(sources, args.force, args.chunk_size, args.commit_rows, args.changed_ids)
@@ -0,0 +1,44 @@
+from sqlalchemy import inspect
+from database import engine
+import models
+
+def add_missing_columns(connection) -> list:
+    # create_allは既存テーブルにカラムを追加しないため、不足しているカラムをALTER TABLEで追加する
+    inspector = inspect(connection)
+    added = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+def add_missing_indexes(connection) -> list:
+    inspector = inspect(connection)
+    added = []
+    for table in models.Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=connection)
+                added.append(index.name)
+    return added
+
+def migrate_schema():
+    with engine.begin() as connection:
+        models.Base.metadata.create_all(bind=connection)
+        added_columns = add_missing_columns(connection)
+        added_indexes = add_missing_indexes(connection)
+    for name in added_columns:
+        print(f"Added column: {name}")
+    for name in added_indexes:
+        print(f"Added index: {name}")
+    print("Schema is up to date.")
+
+if __name__ == "__main__":
+    migrate_schema()
@@ -0,0 +1,50 @@
+from sqlalchemy import MetaData, Table, select, update, bindparam, func
+from database import SessionLocal, engine
+from vector_codec import encode_vector
+
+# 変換対象（テーブル名, 主キー, ベクトルカラム）
+VECTOR_COLUMNS = [
+    ("employee", "employee_id", "career_info_vector"),
+    ("employee", "employee_id", "personality_vector"),
+    ("employee_vectors", "id", "vector"),
+    ("job_post_vectors", "id", "vector"),
+]
+CHUNK_SIZE = 1000
+
+def migrate_column(db, table_name: str, key_column: str, vector_column: str) -> int:
+    # 型変換を通さずに生の値を読むため、リフレクションしたテーブルを使う
+    table = Table(table_name, MetaData(), autoload_with=engine)
+    key = table.c[key_column]
+    column = table.c[vector_column]
+    statement = update(table).where(key == bindparam("_key")).values({vector_column: bindparam("_vector")})
+
+    converted = 0
+    last_key = None
+    while True:
+        query = select(key, column).where(func.typeof(column) == "text").order_by(key).limit(CHUNK_SIZE)
+        if last_key is not None:
+            query = query.where(key > last_key)
+        rows = db.execute(query).all()
+        if not rows:
+            break
+        db.execute(statement, [{"_key": row[0], "_vector": encode_vector(row[1])} for row in rows])
+        db.commit()
+        converted += len(rows)
+        last_key = rows[-1][0]
+    return converted
+
+def migrate_all_vectors():
+    db = SessionLocal()
+    try:
+        for table_name, key_column, vector_column in VECTOR_COLUMNS:
+            converted = migrate_column(db, table_name, key_column, vector_column)
+            print(f"{table_name}.{vector_column}: {converted} rows converted to binary.")
+        print("All vectors migrated successfully.")
+    except Exception as e:
+        print(f"Error migrating vectors: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate_all_vectors()
@@ -0,0 +1,30 @@
+import argparse
+import time
+from database import SessionLocal
+from recommendation_store import refresh_recommendations, MATERIALIZED_TOP_N, MATERIALIZE_CHUNK_SIZE
+from db_control.compact_change_log import compact_change_log
+
+def refresh_all_recommendations(full: bool = False, top_n: int = MATERIALIZED_TOP_N, chunk_size: int = MATERIALIZE_CHUNK_SIZE):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        results = refresh_recommendations(db, top_n=top_n, chunk_size=chunk_size, full=full)
+        for column, result in results.items():
+            print(f"{column}: {result}")
+        print(f"Employee job recommendations refreshed in {time.perf_counter() - start:.1f}s.")
+        # 反映が終わった変更ログのうち、同じ行により新しい変更がある行を削除する
+        print(f"Data change log compacted: {compact_change_log(db)} superseded rows removed.")
+        return results
+    except Exception as e:
+        print(f"Error refreshing employee job recommendations: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="従業員ごとの上位求人を計算してemployee_job_recommendationに保存する（2回目以降は変更分のみ）")
+    parser.add_argument("--full", action="store_true", help="変更の有無に関わらず全件を計算し直す")
+    parser.add_argument("--top-n", type=int, default=MATERIALIZED_TOP_N)
+    parser.add_argument("--chunk-size", type=int, default=MATERIALIZE_CHUNK_SIZE)
+    args = parser.parse_args()
+    refresh_all_recommendations(args.full, args.top_n, args.chunk_size)
@@ -1,28 +1,28 @@
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine
-import models
-from utils import get_all_employee_data, vectorize_employee
-import json
+import argparse
+import time
+from database import SessionLocal
+from hr_import import load_changed_ids
+from embedding_pipeline import update_employee_embeddings, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY
+from explanation_cache import purge_explanation_cache
+from recommendation_store import has_materialized_recommendations, refresh_recommendations
 
-def update_all_employee_vectors():
+def update_all_employee_vectors(force: bool = False, batch_size: int = EMBEDDING_BATCH_SIZE, max_concurrency: int = EMBEDDING_MAX_CONCURRENCY, ids=None):
     db = SessionLocal()
     try:
-        employees = db.query(models.Employee).all()
-        for employee in employees:
-            employee_data = get_all_employee_data(db, employee)
-            if employee_data:
-                employee_vector = vectorize_employee(employee_data)
-                vector_json = json.dumps(employee_vector)
-                
-                existing_vector = db.query(models.EmployeeVector).filter(models.EmployeeVector.employee_id == employee.employee_id).first()
-                if existing_vector:
-                    existing_vector.vector = vector_json
-                else:
-                    new_vector = models.EmployeeVector(employee_id=employee.employee_id, vector=vector_json)
-                    db.add(new_vector)
-            
-        db.commit()
-        print("All employee vectors updated successfully.")
+        start = time.perf_counter()
+        result = update_employee_embeddings(db, force=force, ids=ids, batch_size=batch_size, max_concurrency=max_concurrency)
+        if result["changed_ids"]:
+            # ベクトルが変わったため、生成済みの推薦文キャッシュを破棄する
+            purge_explanation_cache(db)
+            if has_materialized_recommendations(db):
+                # 保存済みの上位求人に変更分のみ反映する
+                print(f"Employee job recommendations refreshed: {refresh_recommendations(db)}")
+        print(
+            f"Employee vectors updated: {result['embedded']} texts embedded for "
+            f"{len(result['changed_ids'])} of {result['scanned']} employees "
+            f"in {time.perf_counter() - start:.1f}s."
+        )
+        return result
     except Exception as e:
         print(f"Error updating employee vectors: {e}")
         db.rollback()
@@ -30,4 +30,10 @@ def update_all_employee_vectors():
         db.close()
 
 if __name__ == "__main__":
-    update_all_employee_vectors()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="テキストが変更された従業員のベクトルを再計算する")
+    parser.add_argument("--force", action="store_true", help="変更の有無に関わらず全件を再計算する")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_MAX_CONCURRENCY)
+    parser.add_argument("--ids-file", help="import_hr_data.py の --changed-ids で書き出したファイル（変更された従業員のみを走査する）")
+    args = parser.parse_args()
+    update_all_employee_vectors(args.force, args.batch_size, args.concurrency, load_changed_ids(args.ids_file, "employee_ids") if args.ids_file else None)
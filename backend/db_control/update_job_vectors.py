@@ -1,26 +1,32 @@
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine
-import models
-from utils import get_all_job_posts, vectorize_job_post
-import json
+import argparse
+import time
+from database import SessionLocal
+from hr_import import load_changed_ids
+from embedding_pipeline import update_job_embeddings, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY
+from explanation_cache import purge_explanation_cache
+from recommendation_store import has_materialized_recommendations, refresh_recommendations
+from vector_snapshot import VECTOR_SNAPSHOT_DIR
+from db_control.export_vector_snapshot import export_vector_snapshot
 
-def update_all_job_vectors():
+def update_all_job_vectors(force: bool = False, batch_size: int = EMBEDDING_BATCH_SIZE, max_concurrency: int = EMBEDDING_MAX_CONCURRENCY, ids=None):
     db = SessionLocal()
     try:
-        job_posts = get_all_job_posts(db)
-        for job_post in job_posts:
-            job_vector = vectorize_job_post(job_post)
-            vector_json = json.dumps(job_vector)
-            
-            existing_vector = db.query(models.JobPostVector).filter(models.JobPostVector.job_post_id == job_post.job_post_id).first()
-            if existing_vector:
-                existing_vector.vector = vector_json
-            else:
-                new_vector = models.JobPostVector(job_post_id=job_post.job_post_id, vector=vector_json)
-                db.add(new_vector)
-        
-        db.commit()
-        print("All job post vectors updated successfully.")
+        start = time.perf_counter()
+        result = update_job_embeddings(db, force=force, ids=ids, batch_size=batch_size, max_concurrency=max_concurrency)
+        if result["changed_ids"] or result["deleted"]:
+            # ベクトルが変わったため、生成済みの推薦文キャッシュを破棄する
+            purge_explanation_cache(db)
+            if has_materialized_recommendations(db):
+                # 保存済みの上位求人に変更分のみ反映する
+                print(f"Employee job recommendations refreshed: {refresh_recommendations(db)}")
+            if VECTOR_SNAPSHOT_DIR:
+                # APIサーバーのワーカーが新しい世代に切り替えられるよう、共有スナップショットを書き出す
+                export_vector_snapshot()
+        print(
+            f"Job post vectors updated: {result['embedded']} of {result['scanned']} job posts embedded, "
+            f"{result['deleted']} orphaned vectors removed in {time.perf_counter() - start:.1f}s."
+        )
+        return result
     except Exception as e:
         print(f"Error updating job post vectors: {e}")
         db.rollback()
@@ -28,4 +34,10 @@ def update_all_job_vectors():
         db.close()
 
 if __name__ == "__main__":
-    update_all_job_vectors()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="job_detailが変更された求人のベクトルを再計算する")
+    parser.add_argument("--force", action="store_true", help="変更の有無に関わらず全件を再計算する")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_MAX_CONCURRENCY)
+    parser.add_argument("--ids-file", help="import_hr_data.py の --changed-ids で書き出したファイル（変更された求人のみを走査する）")
+    args = parser.parse_args()
+    update_all_job_vectors(args.force, args.batch_size, args.concurrency, load_changed_ids(args.ids_file, "job_post_ids") if args.ids_file else None)
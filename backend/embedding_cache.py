@@ -0,0 +1,191 @@
+# embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+import numpy as np
+from vector_codec import encode_vector, decode_vector
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# 上限を超えた場合、この割合まで古いエントリを削除する
+EVICTION_TARGET_RATIO = 0.9
+# SQLiteのバインド変数の上限を超えないように分割する件数
+LOOKUP_CHUNK_SIZE = 500
+
+
+def normalize_text(text: str) -> str:
+    return text.replace("\n", " ")
+
+
+def cache_key(model: str, text: str) -> bytes:
+    """
+    (モデル名, 正規化したテキスト) からキャッシュキーを計算する
+
+    :param model: 埋め込みモデル名
+    :param text: テキスト
+    :return: SHA-256のダイジェスト
+    """
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+def fake_embedding(texts: List[str], model: str, dim: int = 1536) -> List[np.ndarray]:
+    """
+    テキストから決定的に生成する正規化済みのダミーベクトル（オフラインでのテスト・ベンチマーク用）
+
+    :param texts: テキストのリスト
+    :param model: 埋め込みモデル名
+    :param dim: 次元数
+    :return: ベクトルのリスト
+    """
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(cache_key(model, text)[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+        vectors.append(vector / np.linalg.norm(vector))
+    return vectors
+
+
+class EmbeddingCache:
+    """埋め込みベクトルをfloat32でローカルのSQLiteファイルに保存するキャッシュ"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # 保存しているベクトルの合計バイト数（接続時に1回だけ集計し、以降は書き込みと削除のたびに更新する）
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # 使われるまでファイルを作らない
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key BLOB PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_access ON embeddings (last_access)")
+            self._total_bytes = self._sum_sizes(connection)
+            self._connection = connection
+        return self._connection
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        複数のテキストのベクトルをまとめて検索する
+
+        :param model: 埋め込みモデル名
+        :param texts: テキストのリスト
+        :return: 入力と同じ順序のベクトルのリスト（キャッシュにないものはNone）
+        """
+        keys = [cache_key(model, text) for text in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(unique_keys), LOOKUP_CHUNK_SIZE):
+                chunk = unique_keys[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                for key, vector in connection.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk):
+                    found[key] = decode_vector(vector)
+            if found:
+                now = time.time()
+                connection.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+                connection.commit()
+            results = [found.get(key) for key in keys]
+            hits = sum(vector is not None for vector in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        複数のテキストのベクトルを保存し、容量の上限を超えた場合は古いものから削除する
+
+        :param model: 埋め込みモデル名
+        :param texts: テキストのリスト
+        :param vectors: ベクトルのリスト
+        """
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            payload = encode_vector(vector)
+            key = cache_key(model, text)
+            rows[key] = (key, model, payload, len(payload), now)
+        with self._lock:
+            connection = self._connect()
+            # 置き換える行のサイズは合計から差し引く（主キーで引くため件数に比例する）
+            keys = list(rows)
+            replaced = 0
+            for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                replaced += connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})", chunk).fetchone()[0]
+            connection.executemany("INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_access) VALUES (?, ?, ?, ?, ?)", list(rows.values()))
+            connection.commit()
+            self._total_bytes += sum(row[3] for row in rows.values()) - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict(connection)
+
+    @staticmethod
+    def _sum_sizes(connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        # 同じファイルを使う他のプロセスの書き込み・削除は合計に含まれないため、削除する前に集計し直す
+        self._total_bytes = self._sum_sizes(connection)
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICTION_TARGET_RATIO
+        # 最終アクセスが古い順にインデックスをたどり、目標サイズを下回るまでの行だけを削除する
+        evicted = []
+        remaining = self._total_bytes
+        cursor = connection.execute("SELECT key, size FROM embeddings ORDER BY last_access, key")
+        for key, size in cursor:
+            if remaining <= target:
+                break
+            evicted.append(key)
+            remaining -= size
+        cursor.close()
+        for start in range(0, len(evicted), LOOKUP_CHUNK_SIZE):
+            chunk = evicted[start:start + LOOKUP_CHUNK_SIZE]
+            connection.execute(f"DELETE FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+        connection.commit()
+        self._total_bytes = remaining
+
+    def embed(self, texts: Sequence[str], model: str, embed_fn: Callable[[List[str], str], List[Sequence[float]]]) -> List[np.ndarray]:
+        """
+        キャッシュにないテキストのみembed_fnでベクトル化する
+
+        :param texts: テキストのリスト
+        :param model: 埋め込みモデル名
+        :param embed_fn: (テキストのリスト, モデル名) を受け取りベクトルのリストを返す関数
+        :return: 入力と同じ順序のベクトルのリスト
+        """
+        results = self.get_many(model, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+        if missing:
+            computed = dict(zip(missing, embed_fn(missing, model)))
+            self.put_many(model, missing, [computed[text] for text in missing])
+            results = [vector if vector is not None else np.asarray(computed[text], dtype=np.float32) for text, vector in zip(texts, results)]
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "bytes": self._total_bytes
+            }
+
+
+# プロセス全体で共有する埋め込みキャッシュ（EMBEDDING_CACHE_PATHを空にすると無効）
+embedding_cache = EmbeddingCache() if EMBEDDING_CACHE_PATH else None
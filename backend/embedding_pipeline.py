@@ -0,0 +1,215 @@
+# embedding_pipeline.py
+import hashlib
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+from sqlalchemy import select, update, delete, bindparam
+from sqlalchemy.orm import Session
+from database import upsert_statement
+from models import Employee, JobPost, JobPostVector
+from embedding_cache import EmbeddingCache, embedding_cache, normalize_text
+from utils import request_embeddings, EMBEDDING_MODEL
+
+# 1回のAPI呼び出しで送るテキスト数（APIの上限は2048件）
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_BACKOFF_SECONDS = 1.0
+EMBEDDING_MAX_BACKOFF_SECONDS = 60.0
+# DBから一度に読み込み、一括更新する行数
+DB_CHUNK_SIZE = 2000
+
+# 従業員の（ベクトルカラム, テキストカラム, ハッシュカラム）
+EMPLOYEE_EMBEDDING_FIELDS = (
+    ("career_info_vector", "career_info_detail", "career_info_hash"),
+    ("personality_vector", "personality_detail", "personality_hash"),
+)
+
+EmbedFunction = Callable[[List[str], str], List[Sequence[float]]]
+
+
+def content_hash(text: str, model: str = EMBEDDING_MODEL) -> str:
+    """
+    ベクトル化の元になるテキストのハッシュ値を計算する（モデルが変わった場合も再計算対象にする）
+
+    :param text: テキスト
+    :param model: 埋め込みモデル名
+    :return: SHA-256の16進文字列
+    """
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def _iter_chunks(db: Session, query, key_column, chunk_size: int, ids: Optional[Iterable[int]] = None) -> Iterator[list]:
+    # キーの昇順に chunk_size 件ずつ読み込む（idsを指定した場合はそのIDのみ）
+    if ids is not None:
+        ids = sorted(set(ids))
+        for start in range(0, len(ids), chunk_size):
+            rows = db.execute(query.where(key_column.in_(ids[start:start + chunk_size]))).all()
+            if rows:
+                yield rows
+        return
+    last_id = None
+    while True:
+        chunk_query = query.limit(chunk_size)
+        if last_id is not None:
+            chunk_query = chunk_query.where(key_column > last_id)
+        rows = db.execute(chunk_query).all()
+        if not rows:
+            return
+        last_id = getattr(rows[-1], key_column.key)
+        yield rows
+
+
+def _embed_batch_with_retry(batch: List[str], embed_fn: EmbedFunction, model: str, max_retries: int) -> List[Sequence[float]]:
+    for attempt in range(max_retries + 1):
+        try:
+            vectors = embed_fn(batch, model)
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+            return vectors
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            # 指数バックオフ（ジッター付き）
+            delay = min(EMBEDDING_MAX_BACKOFF_SECONDS, EMBEDDING_BACKOFF_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def embed_texts(texts: List[str], embed_fn: Optional[EmbedFunction] = None, model: str = EMBEDDING_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE, max_concurrency: int = EMBEDDING_MAX_CONCURRENCY, max_retries: int = EMBEDDING_MAX_RETRIES, cache: Optional[EmbeddingCache] = embedding_cache) -> List[Sequence[float]]:
+    """
+    埋め込みキャッシュにないテキストのみ、バッチに分けて並行にベクトル化する
+
+    :param texts: テキストのリスト
+    :param embed_fn: (テキストのリスト, モデル名) を受け取りベクトルのリストを返す関数
+    :param model: 埋め込みモデル名
+    :param batch_size: 1回のAPI呼び出しで送るテキスト数
+    :param max_concurrency: 同時に実行するAPI呼び出しの数
+    :param max_retries: 失敗時の最大リトライ回数
+    :param cache: 埋め込みキャッシュ（Noneの場合は使わない）
+    :return: 入力と同じ順序のベクトルのリスト
+    """
+    embed_fn = embed_fn or request_embeddings
+    texts = [normalize_text(text) for text in texts]
+    # キャッシュは全件を1回で検索し、見つからなかったテキストのみAPIに送る
+    results = cache.get_many(model, texts) if cache is not None else [None] * len(texts)
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+    if not missing:
+        return results
+
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(batches)))) as executor:
+        batch_results = executor.map(lambda batch: _embed_batch_with_retry(batch, embed_fn, model, max_retries), batches)
+        computed = [vector for batch_vectors in batch_results for vector in batch_vectors]
+    if cache is not None:
+        cache.put_many(model, missing, computed)
+
+    computed_by_text = dict(zip(missing, computed))
+    return [vector if vector is not None else computed_by_text[text] for text, vector in zip(texts, results)]
+
+
+def update_employee_embeddings(db: Session, embed_fn: Optional[EmbedFunction] = None, model: str = EMBEDDING_MODEL, force: bool = False, chunk_size: int = DB_CHUNK_SIZE, ids: Optional[Iterable[int]] = None, **embed_options: Any) -> Dict[str, Any]:
+    """
+    テキストが変更された従業員のみ、キャリア情報と性格のベクトルを再計算する
+
+    :param db: データベースセッション
+    :param embed_fn: ベクトル化関数（省略時はOpenAI API）
+    :param model: 埋め込みモデル名
+    :param force: Trueの場合は全件を再計算する
+    :param chunk_size: 一度に読み込み・更新する従業員数
+    :param ids: 対象の従業員ID（省略時は全件。import_hr_data.py が出力した変更分のみを走査する場合に指定する）
+    :param embed_options: embed_textsに渡すオプション（batch_size, max_concurrency, max_retries）
+    :return: scanned（走査件数）, embedded（ベクトル化したテキスト数）, changed_ids（更新した従業員ID）
+    """
+    table = Employee.__table__
+    statements = {
+        vector_column: update(table).where(table.c.employee_id == bindparam("_employee_id")).values({
+            vector_column: bindparam("_vector"),
+            hash_column: bindparam("_hash")
+        })
+        for vector_column, _, hash_column in EMPLOYEE_EMBEDDING_FIELDS
+    }
+    columns = [Employee.employee_id] + [
+        getattr(Employee, name) for _, text_column, hash_column in EMPLOYEE_EMBEDDING_FIELDS for name in (text_column, hash_column)
+    ]
+
+    scanned, embedded, changed_ids = 0, 0, set()
+    for rows in _iter_chunks(db, select(*columns).order_by(Employee.employee_id), Employee.employee_id, chunk_size, ids):
+        scanned += len(rows)
+
+        pending = []  # (ベクトルカラム, 従業員ID, テキスト, ハッシュ)
+        for row in rows:
+            for vector_column, text_column, hash_column in EMPLOYEE_EMBEDDING_FIELDS:
+                text = getattr(row, text_column)
+                if not text:
+                    continue
+                text_hash = content_hash(text, model)
+                if force or text_hash != getattr(row, hash_column):
+                    pending.append((vector_column, row.employee_id, text, text_hash))
+        if not pending:
+            continue
+
+        vectors = embed_texts([item[2] for item in pending], embed_fn, model, **embed_options)
+        for vector_column, statement in statements.items():
+            params = [
+                {"_employee_id": employee_id, "_vector": vector, "_hash": text_hash}
+                for (column, employee_id, _, text_hash), vector in zip(pending, vectors) if column == vector_column
+            ]
+            if params:
+                db.execute(statement, params)
+        db.commit()
+        embedded += len(pending)
+        changed_ids.update(item[1] for item in pending)
+
+    return {"scanned": scanned, "embedded": embedded, "changed_ids": sorted(changed_ids)}
+
+
+def update_job_embeddings(db: Session, embed_fn: Optional[EmbedFunction] = None, model: str = EMBEDDING_MODEL, force: bool = False, chunk_size: int = DB_CHUNK_SIZE, ids: Optional[Iterable[int]] = None, **embed_options: Any) -> Dict[str, Any]:
+    """
+    job_detailが変更された求人のみベクトルを再計算し、job_post_vectorsに一括でupsertする
+
+    :param db: データベースセッション
+    :param embed_fn: ベクトル化関数（省略時はOpenAI API）
+    :param model: 埋め込みモデル名
+    :param force: Trueの場合は全件を再計算する
+    :param chunk_size: 一度に読み込み・更新する求人数
+    :param ids: 対象の求人ID（省略時は全件。import_hr_data.py が出力した変更分のみを走査する場合に指定する）
+    :param embed_options: embed_textsに渡すオプション（batch_size, max_concurrency, max_retries）
+    :return: scanned（走査件数）, embedded（ベクトル化した件数）, changed_ids（更新した求人ID）, deleted（削除した件数）
+    """
+    statement = upsert_statement(db.get_bind(), JobPostVector.__table__, ["job_post_id"], ["vector", "content_hash"])
+
+    scanned, changed_ids = 0, []
+    query = select(JobPost.job_post_id, JobPost.job_detail, JobPostVector.content_hash).outerjoin(
+        JobPostVector, JobPostVector.job_post_id == JobPost.job_post_id
+    ).order_by(JobPost.job_post_id)
+    for rows in _iter_chunks(db, query, JobPost.job_post_id, chunk_size, ids):
+        scanned += len(rows)
+
+        pending = []  # (求人ID, テキスト, ハッシュ)
+        for row in rows:
+            if not row.job_detail:
+                continue
+            text_hash = content_hash(row.job_detail, model)
+            if force or text_hash != row.content_hash:
+                pending.append((row.job_post_id, row.job_detail, text_hash))
+        if not pending:
+            continue
+
+        vectors = embed_texts([item[1] for item in pending], embed_fn, model, **embed_options)
+        db.execute(statement, [
+            {"job_post_id": job_post_id, "vector": vector, "content_hash": text_hash}
+            for (job_post_id, _, text_hash), vector in zip(pending, vectors)
+        ])
+        db.commit()
+        changed_ids.extend(item[0] for item in pending)
+
+    # 削除された求人のベクトルを取り除く
+    deleted = db.execute(
+        delete(JobPostVector).where(~JobPostVector.job_post_id.in_(select(JobPost.job_post_id)))
+    ).rowcount
+    db.commit()
+
+    return {"scanned": scanned, "embedded": len(changed_ids), "changed_ids": changed_ids, "deleted": deleted}
@@ -0,0 +1,265 @@
+# employee_index.py
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import DataChangeLog, DepartmentMember, Employee, EmployeeGrade
+from vector_codec import decode_vector
+from vector_index import FULL_RELOAD_RATIO, lookup_positions, normalize_rows, top_k_indices
+
+# インデックスに常駐させる従業員ベクトルのカラム
+EMPLOYEE_VECTOR_COLUMNS = ("career_info_vector", "personality_vector")
+NO_GRADE = -1
+# 絞り込み後の候補がこの割合未満の場合は、該当する行のみを計算する
+SUBSET_SCAN_RATIO = 0.25
+
+
+class EmployeeVectorIndex:
+    """従業員ベクトルと所属・等級のマスクを常駐させる、求人から候補者を探すためのインデックス"""
+
+    # 従業員ID単位で変更を記録するテーブル（いずれかが変わったら該当する従業員を読み直す）
+    TABLE_NAMES = (Employee.__tablename__, DepartmentMember.__tablename__, EmployeeGrade.__tablename__)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 検索側は常にこのタプルを一度だけ参照するため、更新中でも不整合が起きない
+        self._snapshot = self._build_snapshot(
+            np.empty(0, dtype=np.int64),
+            {column: np.empty((0, 0), dtype=np.float32) for column in EMPLOYEE_VECTOR_COLUMNS},
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64)
+        )
+        self.generation: Optional[int] = None
+
+    @staticmethod
+    def _build_snapshot(employee_ids: np.ndarray, raw_matrices: Dict[str, np.ndarray], grades: np.ndarray, member_employee_ids: np.ndarray, member_department_ids: np.ndarray) -> tuple:
+        matrices = {}
+        has_vector = {}
+        for column, raw_matrix in raw_matrices.items():
+            matrix, norms = normalize_rows(raw_matrix)
+            matrices[column] = matrix
+            has_vector[column] = norms > 0 if len(norms) else np.zeros(len(employee_ids), dtype=bool)
+
+        # 部署・等級ごとのマスクは読み込み時に作っておき、検索時は論理演算のみ行う
+        positions, found = lookup_positions(employee_ids, member_employee_ids)
+        department_masks = {}
+        for department_id in np.unique(member_department_ids[found]).tolist():
+            mask = np.zeros(len(employee_ids), dtype=bool)
+            mask[positions[found & (member_department_ids == department_id)]] = True
+            department_masks[department_id] = mask
+        grade_masks = {grade: grades == grade for grade in np.unique(grades).tolist() if grade != NO_GRADE}
+        return employee_ids, matrices, has_vector, grades, (member_employee_ids[found], member_department_ids[found]), department_masks, grade_masks
+
+    @classmethod
+    def from_arrays(cls, employee_ids: np.ndarray, vectors: Dict[str, np.ndarray], grades: Optional[np.ndarray] = None, member_employee_ids: Optional[np.ndarray] = None, member_department_ids: Optional[np.ndarray] = None) -> "EmployeeVectorIndex":
+        """
+        配列からインデックスを作成する（DBとは同期しない）
+
+        :param employee_ids: 従業員IDの配列
+        :param vectors: カラム名をキー、従業員ベクトルを行に持つ2次元配列を値とする辞書
+        :param grades: 従業員ごとの等級ID（省略時は等級なし）
+        :param member_employee_ids: 部署所属の従業員IDの配列
+        :param member_department_ids: member_employee_idsと同じ長さの部署IDの配列
+        :return: EmployeeVectorIndex
+        """
+        index = cls()
+        empty = np.empty(0, dtype=np.int64)
+        index._snapshot = cls._build_snapshot(
+            np.asarray(employee_ids, dtype=np.int64),
+            {column: vectors.get(column, np.zeros((len(employee_ids), 0), dtype=np.float32)) for column in EMPLOYEE_VECTOR_COLUMNS},
+            np.asarray(grades, dtype=np.int64) if grades is not None else np.full(len(employee_ids), NO_GRADE, dtype=np.int64),
+            np.asarray(member_employee_ids, dtype=np.int64) if member_employee_ids is not None else empty,
+            np.asarray(member_department_ids, dtype=np.int64) if member_department_ids is not None else empty
+        )
+        return index
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0])
+
+    @property
+    def employee_ids(self) -> np.ndarray:
+        return self._snapshot[0]
+
+    def vectors(self, column: str) -> tuple:
+        """
+        正規化済みの従業員ベクトルを取得する（同じスナップショットから取り出す）
+
+        :param column: "career_info_vector" または "personality_vector"
+        :return: (従業員IDの配列, 正規化済み行列, ベクトルがあるかどうかの配列)
+        """
+        employee_ids, matrices, has_vector = self._snapshot[:3]
+        return employee_ids, matrices[column], has_vector[column]
+
+    def current_generation(self, db: Session) -> int:
+        """
+        従業員関連テーブルの最新の変更IDを取得する
+
+        :param db: データベースセッション
+        :return: 最新の変更ID（変更がなければ0）
+        """
+        latest = db.query(func.max(DataChangeLog.change_id)).filter(DataChangeLog.table_name.in_(self.TABLE_NAMES)).scalar()
+        return latest or 0
+
+    def refresh(self, db: Session) -> bool:
+        """
+        DBの変更を検知した場合のみインデックスを更新する
+
+        :param db: データベースセッション
+        :return: 更新した場合True
+        """
+        latest = self.current_generation(db)
+        if latest == self.generation:
+            return False
+        with self._lock:
+            if latest == self.generation:
+                return False
+            if self.generation is None or not self._apply_changes(db, self._changed_ids(db, self.generation, latest)):
+                self._snapshot = self._build_snapshot(*self._load(db))
+                print(f"Employee vector index loaded: {len(self._snapshot[0])} employees")
+            self.generation = latest
+        return True
+
+    def _load(self, db: Session, employee_ids: Optional[List[int]] = None) -> tuple:
+        # employee_idsを指定した場合はその従業員のみ読み込む
+        query = db.query(Employee.employee_id, *(getattr(Employee, column) for column in EMPLOYEE_VECTOR_COLUMNS))
+        grade_query = db.query(EmployeeGrade.employee_id, EmployeeGrade.grade)
+        member_query = db.query(DepartmentMember.employee_id, DepartmentMember.department_id)
+        if employee_ids is not None:
+            query = query.filter(Employee.employee_id.in_(employee_ids))
+            grade_query = grade_query.filter(EmployeeGrade.employee_id.in_(employee_ids))
+            member_query = member_query.filter(DepartmentMember.employee_id.in_(employee_ids))
+        rows = query.all()
+
+        ids = np.fromiter((row.employee_id for row in rows), dtype=np.int64, count=len(rows))
+        raw_matrices = {}
+        for column in EMPLOYEE_VECTOR_COLUMNS:
+            vectors = [getattr(row, column) for row in rows]
+            dim = next((len(vector) for vector in vectors if vector is not None), 0)
+            # ベクトルがない従業員は0ベクトル（検索対象外）にする
+            raw_matrices[column] = np.vstack([
+                decode_vector(vector) if vector is not None else np.zeros(dim, dtype=np.float32) for vector in vectors
+            ]) if rows and dim else np.zeros((len(rows), 0), dtype=np.float32)
+
+        grades = np.full(len(ids), NO_GRADE, dtype=np.int64)
+        grade_rows = [row for row in grade_query.all() if row.grade is not None]
+        positions, found = lookup_positions(ids, np.fromiter((row.employee_id for row in grade_rows), dtype=np.int64, count=len(grade_rows)))
+        grades[positions[found]] = np.fromiter((row.grade for row in grade_rows), dtype=np.int64, count=len(grade_rows))[found]
+
+        member_rows = member_query.all()
+        member_employee_ids = np.fromiter((row.employee_id for row in member_rows), dtype=np.int64, count=len(member_rows))
+        member_department_ids = np.fromiter((row.department_id for row in member_rows), dtype=np.int64, count=len(member_rows))
+        return ids, raw_matrices, grades, member_employee_ids, member_department_ids
+
+    def _changed_ids(self, db: Session, since: int, until: int) -> List[int]:
+        return [
+            row.row_id for row in db.query(DataChangeLog.row_id).filter(
+                DataChangeLog.table_name.in_(self.TABLE_NAMES),
+                DataChangeLog.change_id > since,
+                DataChangeLog.change_id <= until
+            ).distinct()
+        ]
+
+    def _apply_changes(self, db: Session, changed_ids: List[int]) -> bool:
+        employee_ids, matrices, _, grades, (member_employee_ids, member_department_ids), _, _ = self._snapshot
+        if len(changed_ids) > max(1, len(employee_ids)) * FULL_RELOAD_RATIO:
+            return False
+
+        new_ids, new_matrices, new_grades, new_member_employee_ids, new_member_department_ids = self._load(db, changed_ids)
+        for column in EMPLOYEE_VECTOR_COLUMNS:
+            if new_matrices[column].shape[1] and matrices[column].shape[1] and new_matrices[column].shape[1] != matrices[column].shape[1]:
+                return False
+
+        # 変更のあった従業員を取り除き、最新の行を末尾に追加した新しい配列に差し替える
+        changed = np.asarray(changed_ids, dtype=np.int64)
+        keep = ~np.isin(employee_ids, changed)
+        keep_members = ~np.isin(member_employee_ids, changed)
+        raw_matrices = {}
+        for column in EMPLOYEE_VECTOR_COLUMNS:
+            kept, added = matrices[column][keep], new_matrices[column]
+            dim = kept.shape[1] or added.shape[1]
+            if kept.shape[1] != dim:
+                kept = np.zeros((len(kept), dim), dtype=np.float32)
+            if added.shape[1] != dim:
+                added = np.zeros((len(added), dim), dtype=np.float32)
+            # 正規化済みの行はそのまま再利用する（ノルムはマスクの判定にのみ使う）
+            raw_matrices[column] = np.vstack([kept, added])
+        self._snapshot = self._build_snapshot(
+            np.concatenate([employee_ids[keep], new_ids]),
+            raw_matrices,
+            np.concatenate([grades[keep], new_grades]),
+            np.concatenate([member_employee_ids[keep_members], new_member_employee_ids]),
+            np.concatenate([member_department_ids[keep_members], new_member_department_ids])
+        )
+        return True
+
+    def search(self, vector: Sequence[float], column: str, top_n: int, department_ids: Optional[Sequence[int]] = None, grade_ids: Optional[Sequence[int]] = None, exclude_department_id: Optional[int] = None, return_percentage: bool = False) -> List[Dict[str, Any]]:
+        """
+        求人ベクトルとのコサイン類似度が高い従業員を取得する（行列ベクトル積1回、絞り込みはマスクの論理演算）
+
+        :param vector: 求人ベクトル
+        :param column: "career_info_vector" または "personality_vector"
+        :param top_n: 取得する上位の数
+        :param department_ids: 指定した部署のいずれかに所属する従業員に絞り込む
+        :param grade_ids: 指定した等級のいずれかの従業員に絞り込む
+        :param exclude_department_id: この部署に所属する従業員を除く
+        :param return_percentage: 類似度をパーセンテージで返すかどうかのフラグ
+        :return: employee_id, similarity を含む辞書のリスト
+        """
+        employee_ids, matrices, has_vector, _, _, department_masks, grade_masks = self._snapshot
+        matrix = matrices[column]
+        mask = has_vector[column]
+        if department_ids is not None:
+            mask = mask & self._any_mask(department_masks, department_ids, len(employee_ids))
+        if grade_ids is not None:
+            mask = mask & self._any_mask(grade_masks, grade_ids, len(employee_ids))
+        if exclude_department_id is not None and exclude_department_id in department_masks:
+            mask = mask & ~department_masks[exclude_department_id]
+
+        query = decode_vector(vector)
+        query_norm = np.linalg.norm(query)
+        n_candidates = int(mask.sum())
+        if query_norm == 0 or not n_candidates or query.shape[0] != matrix.shape[1]:
+            return []
+        if n_candidates < len(employee_ids) * SUBSET_SCAN_RATIO:
+            rows = np.flatnonzero(mask)
+            row_scores = matrix[rows] @ (query / query_norm)
+            top = top_k_indices(row_scores, min(top_n, n_candidates))
+            indices, top_scores = rows[top], row_scores[top]
+        else:
+            scores = matrix @ (query / query_norm)
+            scores[~mask] = -np.inf
+            indices = top_k_indices(scores, min(top_n, n_candidates))
+            top_scores = scores[indices]
+
+        results = []
+        for i, score in zip(indices, top_scores):
+            similarity = float(score)
+            if return_percentage:
+                similarity = round(similarity * 100, 2)
+            results.append({'employee_id': int(employee_ids[i]), 'similarity': similarity})
+        return results
+
+    @staticmethod
+    def _any_mask(masks: Dict[int, np.ndarray], keys: Sequence[int], size: int) -> np.ndarray:
+        mask = np.zeros(size, dtype=bool)
+        for key in keys:
+            if key in masks:
+                mask |= masks[key]
+        return mask
+
+
+# プロセス全体で共有する従業員ベクトルインデックス（最初の候補者検索で読み込む）
+employee_vector_index = EmployeeVectorIndex()
+
+
+def get_employee_vector_index(db: Session) -> EmployeeVectorIndex:
+    """
+    最新の状態に同期した共有インデックスを取得する
+
+    :param db: データベースセッション
+    :return: EmployeeVectorIndex
+    """
+    employee_vector_index.refresh(db)
+    return employee_vector_index
@@ -0,0 +1,209 @@
+# explanation_cache.py
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy.orm import Session
+from models import ExplanationCacheEntry
+
+# プロンプトを変更した場合はこの値を上げて古いキャッシュを無効にする
+PROMPT_TEMPLATE_VERSION = 2
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", "1024"))
+EXPLANATION_CACHE_TTL_SECONDS = float(os.getenv("EXPLANATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# 保存のたびにこの確率で期限切れのエントリをDBから削除する
+EXPLANATION_CACHE_PURGE_RATE = float(os.getenv("EXPLANATION_CACHE_PURGE_RATE", "0.01"))
+
+
+def vector_hash(vector: Sequence[float]) -> str:
+    """
+    ベクトルの内容からハッシュ値を計算する
+
+    :param vector: ベクトル
+    :return: SHA-256の16進文字列
+    """
+    return hashlib.sha256(np.ascontiguousarray(vector, dtype="<f4").tobytes()).hexdigest()
+
+
+def prompt_hash(prompt_data: Any) -> str:
+    """
+    プロンプトに含める従業員・求人の特徴からハッシュ値を計算する（スキルや等級の変更はベクトルが変わらなくても反映する）
+
+    :param prompt_data: JSONにシリアライズできる値（numpyのスカラーを含んでもよい）
+    :return: SHA-256の16進文字列
+    """
+    payload = json.dumps(prompt_data, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=float)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_explanation_key(employee_vector_hash: str, job_ids: List[int], vector_type: str, model: str, data_generation: int = 0, template_version: int = PROMPT_TEMPLATE_VERSION, prompt_data_hash: str = "") -> str:
+    """
+    推薦文キャッシュのキーを作成する
+
+    :param employee_vector_hash: 従業員ベクトルのハッシュ値（vector_hashで計算したもの）
+    :param job_ids: 上位求人IDのリスト（順序を含めてキーにする）
+    :param vector_type: ベクトルタイプ
+    :param model: 生成に使うモデル名
+    :param data_generation: 求人ベクトルの世代（ベクトル再構築で変わる）
+    :param template_version: プロンプトテンプレートのバージョン
+    :param prompt_data_hash: プロンプトに含める特徴のハッシュ値（prompt_hashで計算したもの）
+    :return: キャッシュキー
+    """
+    payload = json.dumps(
+        [employee_vector_hash, [int(job_id) for job_id in job_ids], vector_type, model, template_version, data_generation, prompt_data_hash],
+        separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExplanationCache:
+    """メモリ上のLRUとDBテーブルの2層からなる推薦文キャッシュ"""
+
+    def __init__(self, max_entries: int = EXPLANATION_CACHE_SIZE, ttl_seconds: float = EXPLANATION_CACHE_TTL_SECONDS, purge_rate: float = EXPLANATION_CACHE_PURGE_RATE):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.purge_rate = purge_rate
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, explanation: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (explanation, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._entries[key]
+        return None
+
+    def _load(self, db: Session, key: str) -> Optional[str]:
+        row = db.query(ExplanationCacheEntry.explanation, ExplanationCacheEntry.expires_at).filter(
+            ExplanationCacheEntry.cache_key == key,
+            ExplanationCacheEntry.expires_at > time.time()
+        ).first()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        self._remember(key, row.explanation, row.expires_at)
+        with self._lock:
+            self.db_hits += 1
+        return row.explanation
+
+    def _store(self, db: Session, key: str, explanation: str, created_at: float, expires_at: float) -> None:
+        try:
+            db.merge(ExplanationCacheEntry(cache_key=key, explanation=explanation, created_at=created_at, expires_at=expires_at))
+            db.commit()
+            if random.random() < self.purge_rate:
+                purge_explanation_cache(db, expired_only=True)
+        except Exception as e:
+            print(f"Error saving explanation cache: {e}")
+            db.rollback()
+
+    def get(self, db: Session, key: str) -> Optional[str]:
+        """
+        キャッシュから推薦文を取得する（メモリ→DBの順に参照する）
+
+        :param db: データベースセッション
+        :param key: キャッシュキー
+        :return: 推薦文（ない場合・期限切れの場合はNone）
+        """
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        return self._load(db, key)
+
+    async def get_async(self, db: Session, key: str) -> Optional[str]:
+        """
+        getの非同期版（メモリにない場合のDBの参照はイベントループを止めないようにスレッドで実行する）
+
+        :param db: データベースセッション
+        :param key: キャッシュキー
+        :return: 推薦文（ない場合・期限切れの場合はNone）
+        """
+        from starlette.concurrency import run_in_threadpool
+
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        return await run_in_threadpool(self._load, db, key)
+
+    def set(self, db: Session, key: str, explanation: str) -> None:
+        """
+        推薦文をキャッシュに保存する
+
+        :param db: データベースセッション
+        :param key: キャッシュキー
+        :param explanation: 推薦文
+        """
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        self._remember(key, explanation, expires_at)
+        self._store(db, key, explanation, now, expires_at)
+
+    async def set_async(self, db: Session, key: str, explanation: str) -> None:
+        """
+        setの非同期版（メモリにはすぐに保存し、DBへの書き込みはスレッドで実行する）
+
+        :param db: データベースセッション
+        :param key: キャッシュキー
+        :param explanation: 推薦文
+        """
+        from starlette.concurrency import run_in_threadpool
+
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        self._remember(key, explanation, expires_at)
+        await run_in_threadpool(self._store, db, key, explanation, now, expires_at)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "memory_entries": len(self._entries)
+            }
+
+
+def purge_explanation_cache(db: Session, expired_only: bool = False) -> int:
+    """
+    DB上の推薦文キャッシュを削除する（ベクトル再構築後に呼び出す。期限切れのみの削除は保存時にも一定の確率で行う）
+
+    :param db: データベースセッション
+    :param expired_only: Trueの場合は期限切れのエントリのみ削除する
+    :return: 削除した件数
+    """
+    query = db.query(ExplanationCacheEntry)
+    if expired_only:
+        query = query.filter(ExplanationCacheEntry.expires_at <= time.time())
+    deleted = query.delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+# プロセス全体で共有する推薦文キャッシュ
+explanation_cache = ExplanationCache()
@@ -0,0 +1,229 @@
+# hr_import.py
+import csv
+import datetime
+import gzip
+import hashlib
+import itertools
+import os
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+import orjson
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from database import upsert_statement
+import models
+
+# 差分の判定と書き込みをまとめて行う従業員・求人の数（IN句に渡すIDの数）
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+# 書き込んだ行数がこれを超えるごとにコミットする
+IMPORT_COMMIT_ROWS = int(os.getenv("IMPORT_COMMIT_ROWS", "50000"))
+
+
+class ImportSpec(NamedTuple):
+    model: Any
+    owner_column: str  # 差分の判定と書き込みの単位になるカラム（employee_id または job_post_id）
+    replace: bool  # Trueの場合はowner単位で行の集合を置き換える（Falseの場合はowner1件につき1行をupsertする）
+    excluded: Tuple[str, ...] = ()  # 取り込まないカラム（自動採番のIDやベクトルなど）
+
+
+# 取り込み対象のテーブル（この順序で取り込む）
+IMPORT_TABLES = {
+    "employee": ImportSpec(models.Employee, "employee_id", False, (
+        "career_info_vector", "personality_vector", "career_info_hash", "personality_hash"
+    )),
+    "employee_skill": ImportSpec(models.EmployeeSkill, "employee_id", True, ("employee_skill_id",)),
+    "spi": ImportSpec(models.Spi, "employee_id", True, ("spi_id",)),
+    "evaluation_history": ImportSpec(models.EvaluationHistory, "employee_id", True, ("evaluation_id",)),
+    "department_member": ImportSpec(models.DepartmentMember, "employee_id", True),
+    "employee_grade": ImportSpec(models.EmployeeGrade, "employee_id", True),
+    "job_post": ImportSpec(models.JobPost, "job_post_id", False),
+    "required_skill": ImportSpec(models.RequiredSkill, "job_post_id", True, ("required_id",)),
+}
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    CSV（ヘッダー付き）またはJSONL（1行1オブジェクト）を1行ずつ読み込む（.gzの場合は展開しながら読む）
+
+    :param path: ファイルのパス（.csv, .jsonl, .ndjson とそれぞれの .gz）
+    :return: 1行分の辞書のイテレータ
+    """
+    compressed = path.endswith(".gz")
+    name = path[:-3] if compressed else path
+    opener = gzip.open if compressed else open
+    if name.endswith(".csv"):
+        with opener(path, "rt", encoding="utf-8-sig", newline="") as f:
+            yield from csv.DictReader(f)
+    elif name.endswith((".jsonl", ".ndjson")):
+        with opener(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
+    else:
+        raise ValueError(f"Unsupported file type: {path} (expected .csv, .jsonl or .ndjson)")
+
+
+def _parse_date(value: Any) -> datetime.date:
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value).replace("/", "-"))
+
+
+def _converter(column) -> Callable[[Any], Any]:
+    # CSVは全て文字列で読み込まれるため、カラムの型に合わせて変換する（空文字はNULLとして扱う）
+    parse = {int: int, float: float, datetime.date: _parse_date}.get(column.type.python_type, str)
+    return lambda value: None if value is None or value == "" else parse(value)
+
+
+def _content_hash(rows: Iterable[tuple]) -> str:
+    # 行の順序に依存しないよう、行ごとにシリアライズしてから並べ替える（日付はISO形式の文字列になる）
+    return hashlib.sha256(b"\n".join(sorted(orjson.dumps(list(row)) for row in rows))).hexdigest()
+
+
+def _owner_groups(records: Iterator[Dict[str, Any]], owner_column: str, convert_owner: Callable) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    # 同じowner（従業員・求人）の行は連続している必要がある（連続していない場合は途中で置き換えてしまうためエラーにする）
+    seen = set()
+    for owner_id, group in itertools.groupby(records, key=lambda record: convert_owner(record.get(owner_column))):
+        if owner_id is None:
+            raise ValueError(f"{owner_column} is missing")
+        if owner_id in seen:
+            raise ValueError(f"Rows for {owner_column}={owner_id} are not contiguous; sort the input by {owner_column}")
+        seen.add(owner_id)
+        yield owner_id, list(group)
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def import_table(db: Session, table_name: str, records: Iterable[Dict[str, Any]], force: bool = False, chunk_size: int = IMPORT_CHUNK_SIZE, commit_rows: int = IMPORT_COMMIT_ROWS) -> Dict[str, Any]:
+    """
+    1テーブル分の行を取り込む（DBの現在の内容とハッシュが一致する従業員・求人は書き込まない）
+
+    :param db: データベースセッション
+    :param table_name: IMPORT_TABLES のキー
+    :param records: 1行分の辞書のイテレータ（同じ従業員・求人の行は連続していること）
+    :param force: Trueの場合は内容が同じでも書き込む
+    :param chunk_size: 差分の判定と書き込みをまとめて行う従業員・求人の数
+    :param commit_rows: 書き込んだ行数がこれを超えるごとにコミットする
+    :return: rows, owners, changed, skipped, seconds, rows_per_second, changed_ids（内容が変わった従業員・求人のID）
+    """
+    spec = IMPORT_TABLES[table_name]
+    table = spec.model.__table__
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return {"rows": 0, "owners": 0, "changed": 0, "skipped": 0, "seconds": 0.0, "rows_per_second": 0, "changed_ids": []}
+
+    # ファイルにあるカラムのみを取り込み・比較する（ファイルにないカラムは更新しない）
+    columns = [column.name for column in table.columns if column.name in first and column.name not in spec.excluded]
+    if spec.owner_column not in columns or len(columns) < 2:
+        raise ValueError(f"{table_name}: {spec.owner_column} and at least one other column are required (got {sorted(first)})")
+    ignored = sorted(set(first) - set(columns))
+    if ignored:
+        print(f"{table_name}: ignoring columns {ignored}")
+    converters = [_converter(table.c[name]) for name in columns]
+    owner = table.c[spec.owner_column]
+    owner_index = columns.index(spec.owner_column)
+    current_query = select(*[table.c[name] for name in columns])
+    if spec.replace:
+        write_statement = insert(table)
+    else:
+        write_statement = upsert_statement(db.get_bind(), table, [spec.owner_column], [name for name in columns if name != spec.owner_column])
+
+    start = time.perf_counter()
+    n_rows, n_owners, pending_rows = 0, 0, 0
+    changed_ids = []
+    groups = _owner_groups(itertools.chain([first], records), spec.owner_column, converters[owner_index])
+    for chunk in _chunks(groups, chunk_size):
+        incoming = {}
+        for owner_id, group in chunk:
+            if not spec.replace and len(group) > 1:
+                raise ValueError(f"{table_name}: duplicate rows for {spec.owner_column}={owner_id}")
+            incoming[owner_id] = [tuple(convert(record.get(name)) for convert, name in zip(converters, columns)) for record in group]
+            n_rows += len(group)
+        n_owners += len(incoming)
+
+        if force:
+            changed = list(incoming)
+        else:
+            current = defaultdict(list)
+            for row in db.execute(current_query.where(owner.in_(list(incoming)))):
+                current[row[owner_index]].append(tuple(row))
+            changed = [owner_id for owner_id, rows in incoming.items() if owner_id not in current or _content_hash(rows) != _content_hash(current[owner_id])]
+        if not changed:
+            continue
+
+        params = [dict(zip(columns, row)) for owner_id in changed for row in incoming[owner_id]]
+        if spec.replace:
+            db.execute(delete(table).where(owner.in_(changed)))
+        if params:
+            db.execute(write_statement, params)
+        changed_ids.extend(changed)
+        pending_rows += len(params)
+        if pending_rows >= commit_rows:
+            db.commit()
+            pending_rows = 0
+    db.commit()
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": n_rows,
+        "owners": n_owners,
+        "changed": len(changed_ids),
+        "skipped": n_owners - len(changed_ids),
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(n_rows / seconds) if seconds else 0,
+        "changed_ids": changed_ids
+    }
+
+
+def import_hr_data(db: Session, sources: Dict[str, str], force: bool = False, chunk_size: int = IMPORT_CHUNK_SIZE, commit_rows: int = IMPORT_COMMIT_ROWS) -> Dict[str, Any]:
+    """
+    人事データのファイルを IMPORT_TABLES の順に取り込み、内容が変わった従業員・求人のIDを返す
+
+    :param db: データベースセッション
+    :param sources: テーブル名 → ファイルのパス
+    :param force: Trueの場合は内容が同じでも書き込む
+    :param chunk_size: 差分の判定と書き込みをまとめて行う従業員・求人の数
+    :param commit_rows: 書き込んだ行数がこれを超えるごとにコミットする
+    :return: tables（テーブルごとの件数と速度）, employee_ids, job_post_ids（いずれかのテーブルで内容が変わったID）
+    """
+    unknown = set(sources) - set(IMPORT_TABLES)
+    if unknown:
+        raise ValueError(f"Unknown tables: {sorted(unknown)}")
+    tables = {}
+    changed = {"employee_id": set(), "job_post_id": set()}
+    for table_name, spec in IMPORT_TABLES.items():
+        if table_name not in sources:
+            continue
+        stats = import_table(db, table_name, iter_records(sources[table_name]), force, chunk_size, commit_rows)
+        changed[spec.owner_column].update(stats.pop("changed_ids"))
+        tables[table_name] = stats
+    return {"tables": tables, "employee_ids": sorted(changed["employee_id"]), "job_post_ids": sorted(changed["job_post_id"])}
+
+
+def write_changed_ids(path: str, result: Dict[str, Any]) -> None:
+    """
+    内容が変わった従業員・求人のIDをJSONで書き出す（update_*_vectors.py の --ids-file に渡せる）
+
+    :param path: 書き出し先のパス
+    :param result: import_hr_data の戻り値
+    """
+    with open(path, "wb") as f:
+        f.write(orjson.dumps({"employee_ids": result["employee_ids"], "job_post_ids": result["job_post_ids"]}))
+
+
+def load_changed_ids(path: str, key: str) -> List[int]:
+    """
+    write_changed_ids で書き出したIDを読み込む
+
+    :param path: ファイルのパス
+    :param key: "employee_ids" または "job_post_ids"
+    :return: IDのリスト
+    """
+    with open(path, "rb") as f:
+        return orjson.loads(f.read()).get(key, [])
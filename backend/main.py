@@ -1,24 +1,83 @@
 # main.py
-from fastapi import FastAPI, HTTPException, status, Depends
+from fastapi import FastAPI, HTTPException, status, Depends, Query, Request
 from fastapi.params import Body
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import StreamingResponse, ORJSONResponse, PlainTextResponse, Response
+from typing import List, Dict, Any, Tuple, Optional, Sequence, Callable
+import asyncio
+import time
+from contextlib import asynccontextmanager
+import orjson
+from sqlalchemy import select
 from jose import JWTError, jwt
-from auth import SECRET_KEY, ALGORITHM, authenticate_user, create_access_token
+from auth import SECRET_KEY, ALGORITHM, authenticate_user_async, create_access_token, is_recruiter
 from utils import (
     get_employee_vectors,
-    get_all_job_post_vectors,
     get_top_similar_jobs_for_vectors,
+    get_top_similar_jobs_for_employees,
     get_job_details,
     prepare_recommendation_data,
-    generate_recommendations,
-    get_all_employee_data
+    generate_recommendations_cached,
+    stream_recommendations_cached,
+    get_all_employee_data,
+    load_employee_profile,
+    resolve_hybrid_weights,
+    get_top_hybrid_jobs_for_employees,
+    HYBRID_VECTOR_TYPE,
+    get_top_candidates_for_job,
+    JobVectorNotFound,
+    TOP_N_CANDIDATES,
+    resolve_job_fields,
+    project_jobs,
+    TOP_N_JOBS,
+    BATCH_CHUNK_SIZE,
+    BATCH_MAX_EMPLOYEES,
+    BATCH_MAX_TOP_N,
+    VECTOR_TYPE_COLUMNS
 )
-from database import get_db, engine
+from database import get_db, get_async_db, dispose_async_engine, SessionLocal
+from vector_index import get_job_vector_index, job_vector_index as shared_job_vector_index
+from skill_index import get_job_skill_index
+from employee_index import get_employee_vector_index
+from recommendation_store import get_materialized_top_jobs, live_freshness
+import numpy as np
+from explanation_cache import explanation_cache
+from principal_cache import Principal, principal_cache
+from profile_cache import etag_matches, profile_cache
+from embedding_cache import embedding_cache
+from single_flight import SingleFlight
+from recommendation_jobs import QueueFull, RecommendationJob, RecommendationJobQueue
+from warmup import WarmupState, run_warmup, WARMUP_BLOCKING
+from metrics import begin_request, end_request, finish_profiler, record_request, register_cache, render_metrics, span, start_profiler
 import models
 
-app = FastAPI()
+# スキーマの作成・変更はAPIの起動時ではなく python -m db_control.migrate_schema で行う
+warmup_state = WarmupState()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = None
+    if warmup_state.enabled:
+        if WARMUP_BLOCKING:
+            await run_warmup(warmup_state)
+        else:
+            # 接続は受け付けつつ、終わるまで/readyは503を返す
+            warmup_task = asyncio.create_task(run_warmup(warmup_state))
+    await recommendation_jobs.start()
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await recommendation_jobs.stop()
+    await dispose_async_engine()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# numpyの値と数値キーの辞書をそのままシリアライズする
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,100 +87,442 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-models.Base.metadata.create_all(bind=engine)
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # 処理段階ごとの時間とSQLの数を集計し、Server-Timingヘッダーと/metricsに出力する
+    recorder, token = begin_request()
+    profiler = start_profiler()
+    start = time.perf_counter()
+
+    async def finish(status_code: int) -> float:
+        # 先に同期的に記録し、キャンセル中でもプロファイラを止める
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        try:
+            record_request(recorder, request.method, route_path, status_code, elapsed)
+        finally:
+            await finish_profiler(profiler, elapsed, f"{request.method} {route_path}")
+        return elapsed
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        # 例外だけでなく、クライアントの切断によるキャンセルでも計測を終える
+        await finish(500)
+        raise
+    finally:
+        # SSEの本文は別のタスクで送られるため、コンテキストはここで戻す
+        end_request(token)
+
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        # SSEはヘッダーの送信後も処理が続くため、本文を送り終えた時点で計測を終える（Server-Timingは付けない）
+        body_iterator = response.body_iterator
+
+        async def stream_then_finish():
+            try:
+                async for chunk in body_iterator:
+                    yield chunk
+            finally:
+                await finish(response.status_code)
+
+        response.body_iterator = stream_then_finish()
+        return response
+
+    response.headers["Server-Timing"] = recorder.server_timing(await finish(response.status_code))
+    return response
+
+register_cache("explanation", explanation_cache.stats)
+register_cache("principal", principal_cache.stats)
+register_cache("profile", profile_cache.stats)
+register_cache("recommendation_coalescing", lambda: recommendation_flights.stats())
+if embedding_cache is not None:
+    register_cache("embedding", embedding_cache.stats)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# 同一内容の/recommendationsの同時リクエストをまとめる
+recommendation_flights = SingleFlight()
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
+        employee_id = payload.get("employee_id")
         if username is None:
             raise HTTPException(status_code=400, detail="Invalid authentication credentials")
-        user = db.query(models.Employee).filter(models.Employee.employee_name == username).first()
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+    if employee_id is None:
+        # employee_idを含まない以前のトークンはユーザー名で検索する
+        user = (await db.execute(select(models.Employee.employee_id).where(models.Employee.employee_name == username))).first()
         if user is None:
             raise HTTPException(status_code=404, detail="User not found")
-        return user
-    except JWTError:
+        employee_id = user.employee_id
+
+    # キャッシュにあればDBにアクセスせずに認証済みユーザーを返す
+    principal = await principal_cache.get_async(db, employee_id)
+    if principal is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if principal.employee_name != username:
+        # トークン発行後にユーザー名が変更された場合
         raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return principal
+
+async def get_current_recruiter(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    # 他の従業員のデータを返すエンドポイントは、許可された採用担当・人事のみが使える
+    if not await is_recruiter(db, current_user.employee_id):
+        raise HTTPException(status_code=403, detail="Not permitted to access other employees' data")
+    return current_user
 
 @app.post("/token")
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="ユーザー名またはパスワードが正しくありません",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.employee_name})
+    access_token = create_access_token(data={"sub": user.employee_name, "employee_id": user.employee_id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me")
-async def read_users_me(current_user: models.Employee = Depends(get_current_user), db: Session = Depends(get_db)):
-    employee_data = get_all_employee_data(db, current_user)
-    if employee_data is None:
+async def read_users_me(request: Request, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # シリアライズ済みのレスポンスをキャッシュし、ETagが一致すれば本文を返さない
+    entry = await profile_cache.load(db, current_user.employee_id)
+    if entry is None:
         raise HTTPException(status_code=500, detail="Error retrieving employee data")
-    return employee_data
+    # ブラウザには保存させつつ、毎回If-None-Matchで確認させる
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+def get_job_fields(fields: Optional[List[str]]) -> Tuple[str, ...]:
+    try:
+        return resolve_job_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def get_hybrid_weights(vector_type: str, weights: Optional[Dict[str, float]]) -> Optional[Dict[str, float]]:
+    if vector_type not in VECTOR_TYPE_COLUMNS and vector_type != HYBRID_VECTOR_TYPE:
+        raise HTTPException(status_code=400, detail="Invalid vector_type")
+    if vector_type != HYBRID_VECTOR_TYPE:
+        return None
+    try:
+        return resolve_hybrid_weights(weights)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def prepare_job_recommendations(db: Session, current_user: Principal, vector_type: str, fields: Sequence[str], weights: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, Any], Dict[str, Any], int, Dict[str, Any]]:
+    """
+    類似求人の検索と推薦文生成用データの準備を行う
+    上位求人は事前計算したテーブルにあればそれを使い、なければその場で検索する
+
+    :param fields: レスポンスの求人に含めるフィールド
+    :param weights: hybridの場合の正規化済みの重み（Noneの場合は既定値）
+    :return: (ベクトルタイプごとの推薦文生成用データ, ベクトルタイプごとの上位求人, 求人ベクトルの世代, ベクトルタイプごとの鮮度)
+    """
+    if vector_type not in VECTOR_TYPE_COLUMNS and vector_type != HYBRID_VECTOR_TYPE:
+        raise HTTPException(status_code=400, detail="Invalid vector_type")
+
+    employee_vectors = get_employee_vectors(db, current_user.employee_id)
+    with span("job_index"):
+        job_vector_index = get_job_vector_index(db)
+
+    if vector_type == HYBRID_VECTOR_TYPE:
+        weights = weights or resolve_hybrid_weights()
+        hybrid_jobs = get_top_hybrid_jobs_for_employees(
+            db, [current_user.employee_id], job_vector_index, get_job_skill_index(db), weights, return_percentage=True
+        )
+        top_job_ids = {HYBRID_VECTOR_TYPE: hybrid_jobs.get(current_user.employee_id, [])}
+        freshness = {HYBRID_VECTOR_TYPE: live_freshness()}
+        # 推薦文キャッシュのキーには両方のベクトルと重みを使う
+        vector_to_use = {HYBRID_VECTOR_TYPE: np.concatenate([
+            employee_vectors["career_info_vector"], employee_vectors["personality_vector"], list(weights.values())
+        ])}
+    else:
+        column = VECTOR_TYPE_COLUMNS[vector_type]
+        vector_to_use = {column: employee_vectors[column]}
+        # 事前計算したテーブルには求人ベクトルを保存していないため、vectorを返す場合はその場で検索する
+        with span("materialized_lookup"):
+            materialized = None if "vector" in fields else get_materialized_top_jobs(db, current_user.employee_id, column, TOP_N_JOBS, return_percentage=True)
+        if materialized is not None:
+            top_job_ids = {column: materialized[0]}
+            freshness = {column: materialized[1]}
+        else:
+            top_job_ids = get_top_similar_jobs_for_vectors(vector_to_use, job_vector_index, return_percentage=True, include_vector="vector" in fields)
+            freshness = {column: live_freshness()}
+
+    if not top_job_ids:
+        raise HTTPException(status_code=404, detail="No top job recommendations found")
+
+    # 従業員プロフィールはベクトルタイプに関わらず1回だけ読み込む
+    employee_data = get_all_employee_data(db, load_employee_profile(db, current_user.employee_id))
+    if employee_data is None:
+        raise HTTPException(status_code=404, detail="Error retrieving employee data")
+
+    prepared = {}
+    top_jobs = {}
+    for vec_type, jobs in top_job_ids.items():
+        job_ids = [job['job_id'] for job in jobs]
+        job_details = get_job_details(db, job_ids)
+        
+        combined_jobs = []
+        for job in jobs:
+            job_detail = next((detail for detail in job_details if detail['job_post_id'] == job['job_id']), None)
+            if job_detail:
+                combined_job = {
+                    **job,
+                    'job_title': job_detail['job_title'],
+                    'department_name': job_detail['department_name'],
+                    'job_detail': job_detail['job_detail']
+                }
+                combined_jobs.append(combined_job)
+
+        prepared[vec_type] = prepare_recommendation_data(employee_data, combined_jobs, vector_to_use[vec_type], vec_type)
+        top_jobs[vec_type] = project_jobs(combined_jobs, fields)
+
+    return prepared, top_jobs, job_vector_index.generation, freshness
 
 # main. py
+async def compute_recommendations(current_user: Principal, vector_type: str, job_fields: Tuple[str, ...], hybrid_weights: Optional[Dict[str, float]], on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    # 同じ処理を共有する他のリクエストが待っているため、リクエストに依存しない専用のセッションを使う
+    db = SessionLocal()
+    try:
+        # ベクトル検索と同期セッションのクエリはイベントループを止めないようにスレッドで実行する
+        with span("prepare"):
+            prepared, top_jobs, generation, freshness = await run_in_threadpool(prepare_job_recommendations, db, current_user, vector_type, job_fields, hybrid_weights)
+
+        # 途中経過を受け取る場合は、上位求人と生成が終わった推薦文から順に渡す
+        recommendations = {}
+        if on_progress is not None:
+            on_progress({"top_jobs": top_jobs, "freshness": freshness, "recommendations": {}})
+
+        async def explain(vec_type: str, prepared_data: Dict[str, Any]) -> None:
+            recommendations[vec_type] = await generate_recommendations_cached(db, prepared_data, vec_type, generation)
+            if on_progress is not None:
+                on_progress({"recommendations": dict(recommendations)})
+
+        # 複数のベクトルタイプの推薦文は並行して生成する
+        with span("explanations"):
+            await asyncio.gather(*(explain(vec_type, prepared_data) for vec_type, prepared_data in prepared.items()))
+        return {
+            "recommendations": {vec_type: recommendations[vec_type] for vec_type in prepared},
+            "top_jobs": top_jobs,
+            "freshness": freshness
+        }
+    finally:
+        db.close()
+
+async def run_recommendation_job(job: RecommendationJob) -> Dict[str, Any]:
+    return await compute_recommendations(
+        job.principal, job.request["vector_type"], tuple(job.request["fields"]), job.request["weights"], on_progress=job.update
+    )
+
+# 推薦文の生成を待たずにジョブIDを返す非同期モード（POST /recommendations/jobs）
+recommendation_jobs = RecommendationJobQueue(run_recommendation_job)
+
 @app.post("/recommendations")
 async def recommend_jobs(
-    current_user: models.Employee = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    vector_type: str = Body(..., embed=True)
+    current_user: Principal = Depends(get_current_user),
+    vector_type: str = Body(..., embed=True),
+    fields: Optional[List[str]] = Body(None),
+    weights: Optional[Dict[str, float]] = Body(None)
 ):
+    job_fields = get_job_fields(fields)
+    hybrid_weights = get_hybrid_weights(vector_type, weights)
+    # 同じ従業員・条件・求人ベクトルの世代のリクエストは、実行中（と完了直後）の処理の結果を共有する
+    key = (
+        current_user.employee_id,
+        vector_type,
+        job_fields,
+        tuple(sorted(hybrid_weights.items())) if hybrid_weights else None,
+        shared_job_vector_index.generation
+    )
     try:
-        employee_vectors = get_employee_vectors(db, current_user.employee_id)
-        job_post_vectors = get_all_job_post_vectors(db)
-
-        if vector_type not in ["personality", "career"]:
-            raise HTTPException(status_code=400, detail="Invalid vector_type")
+        result = await recommendation_flights.do(
+            key, lambda: compute_recommendations(current_user, vector_type, job_fields, hybrid_weights)
+        )
+        # jsonable_encoderを経由せずにorjsonで直接シリアライズする
+        with span("serialize"):
+            return ORJSONResponse(result)
 
-        if vector_type == "personality":
-            vector_to_use = {"personality_vector": employee_vectors["personality_vector"]}
-        else:  # career
-            vector_to_use = {"career_info_vector": employee_vectors["career_info_vector"]}
+    except Exception as e:
+        print(f"Error in job recommendation: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error in job recommendation: {str(e)}")
 
-        top_job_ids = get_top_similar_jobs_for_vectors(vector_to_use, job_post_vectors, return_percentage=True)
+@app.post("/recommendations/jobs", status_code=202)
+async def enqueue_recommendation_job(
+    current_user: Principal = Depends(get_current_user),
+    vector_type: str = Body(..., embed=True),
+    fields: Optional[List[str]] = Body(None),
+    weights: Optional[Dict[str, float]] = Body(None)
+):
+    job_fields = get_job_fields(fields)
+    hybrid_weights = get_hybrid_weights(vector_type, weights)
+    # 完了前の同じ内容のリクエスト（リトライやページの再読み込み）は既存のジョブを返す
+    key = (
+        current_user.employee_id,
+        vector_type,
+        job_fields,
+        tuple(sorted(hybrid_weights.items())) if hybrid_weights else None
+    )
+    try:
+        job = await recommendation_jobs.submit(
+            current_user, {"vector_type": vector_type, "fields": list(job_fields), "weights": hybrid_weights}, key
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return ORJSONResponse(job.to_dict(), status_code=202, headers={"Location": f"/recommendations/jobs/{job.job_id}"})
 
-        if not top_job_ids:
-            raise HTTPException(status_code=404, detail="No top job recommendations found")
+@app.get("/recommendations/jobs/{job_id}")
+async def read_recommendation_job(job_id: str, current_user: Principal = Depends(get_current_user)):
+    # 完了前は status が queued / running で、上位求人と生成済みの推薦文があれば含める
+    job = await recommendation_jobs.get(job_id, current_user.employee_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Recommendation job not found")
+    return ORJSONResponse(job)
 
-        recommendations = {}
-        top_jobs = {}
-        for vec_type, jobs in top_job_ids.items():
-            job_ids = [job['job_id'] for job in jobs]
-            job_details = get_job_details(db, job_ids)
-            
-            combined_jobs = []
-            for job in jobs:
-                job_detail = next((detail for detail in job_details if detail['job_post_id'] == job['job_id']), None)
-                if job_detail:
-                    combined_job = {
-                        **job,
-                        'job_title': job_detail['job_title'],
-                        'department_name': job_detail['department_name'],
-                        'job_detail': job_detail['job_detail']
-                    }
-                    combined_jobs.append(combined_job)
-
-            employee_data = get_all_employee_data(db, current_user)
-
-            if employee_data is None:
-                raise HTTPException(status_code=404, detail="Error retrieving employee data")
-
-            prepared_data = prepare_recommendation_data(employee_data, combined_jobs, vector_to_use[vec_type])
-
-            recommendations[vec_type] = generate_recommendations(prepared_data, vec_type)
-            top_jobs[vec_type] = combined_jobs
-
-        return {"recommendations": recommendations, "top_jobs": top_jobs}
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data, option=ORJSON_OPTIONS).decode()}\n\n"
 
+@app.post("/recommendations/stream")
+async def recommend_jobs_stream(
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    vector_type: str = Body(..., embed=True),
+    fields: Optional[List[str]] = Body(None),
+    weights: Optional[Dict[str, float]] = Body(None)
+):
+    job_fields = get_job_fields(fields)
+    hybrid_weights = get_hybrid_weights(vector_type, weights)
+    try:
+        # ベクトル検索と同期セッションのクエリはイベントループを止めないようにスレッドで実行する
+        prepared, top_jobs, generation, freshness = await run_in_threadpool(prepare_job_recommendations, db, current_user, vector_type, job_fields, hybrid_weights)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in job recommendation: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error in job recommendation: {str(e)}")
 
+    async def event_stream():
+        # 上位求人はベクトル検索の直後に送り、推薦文はトークンごとに送る
+        yield format_sse("top_jobs", {"top_jobs": top_jobs, "freshness": freshness})
+        # レスポンス送信中はリクエストのセッションが閉じられている可能性があるため、専用のセッションを使う
+        stream_db = SessionLocal()
+        try:
+            recommendations = {}
+            for vec_type, prepared_data in prepared.items():
+                parts = []
+                async for token in stream_recommendations_cached(stream_db, prepared_data, vec_type, generation):
+                    parts.append(token)
+                    yield format_sse("token", {"vector_type": vec_type, "content": token})
+                recommendations[vec_type] = "".join(parts)
+            yield format_sse("done", {"recommendations": recommendations})
+        except Exception as e:
+            # ヘッダーは送信済みのため、ステータスコードではなくerrorイベントで失敗を伝える
+            print(f"Error in job recommendation stream: {str(e)}")
+            yield format_sse("error", {"detail": f"Error in job recommendation: {str(e)}"})
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/recommendations/batch")
+async def recommend_jobs_batch(
+    current_user: Principal = Depends(get_current_recruiter),
+    db: Session = Depends(get_db),
+    employee_ids: List[int] = Body(...),
+    vector_type: str = Body(...),
+    top_n: int = Body(TOP_N_JOBS),
+    chunk_size: int = Body(BATCH_CHUNK_SIZE),
+    fields: Optional[List[str]] = Body(None),
+    weights: Optional[Dict[str, float]] = Body(None)
+):
+    job_fields = get_job_fields(fields)
+    hybrid_weights = get_hybrid_weights(vector_type, weights)
+    if top_n <= 0 or chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="top_n and chunk_size must be positive")
+    # 1回のリクエストで行う行列積の大きさを制限する
+    if len(employee_ids) > BATCH_MAX_EMPLOYEES or top_n > BATCH_MAX_TOP_N:
+        raise HTTPException(status_code=400, detail=f"employee_ids must have at most {BATCH_MAX_EMPLOYEES} items and top_n must be at most {BATCH_MAX_TOP_N}")
+
+    def search():
+        if hybrid_weights is not None:
+            return get_top_hybrid_jobs_for_employees(
+                db, employee_ids, get_job_vector_index(db), get_job_skill_index(db), hybrid_weights,
+                top_n=top_n, chunk_size=chunk_size, return_percentage=True
+            )
+        return get_top_similar_jobs_for_employees(
+            db, employee_ids, vector_type, get_job_vector_index(db),
+            top_n=top_n, chunk_size=chunk_size, return_percentage=True, include_vector="vector" in job_fields
+        )
+
+    results = await run_in_threadpool(search)
+    # バッチで返すフィールドは検索結果に含まれるjob_id, similarity, signals, vectorのみ
+    results = {employee_id: project_jobs(jobs, job_fields) for employee_id, jobs in results.items()}
+    missing_employee_ids = [employee_id for employee_id in dict.fromkeys(employee_ids) if employee_id not in results]
+    return ORJSONResponse({"results": results, "missing_employee_ids": missing_employee_ids})
+
+@app.get("/jobs/{job_post_id}/candidates")
+async def search_candidates(
+    job_post_id: int,
+    current_user: Principal = Depends(get_current_recruiter),
+    db: Session = Depends(get_db),
+    vector_type: str = "career",
+    top_n: int = TOP_N_CANDIDATES,
+    department_ids: Optional[List[int]] = Query(None),
+    grade_ids: Optional[List[int]] = Query(None),
+    exclude_current_department: bool = False
+):
+    if vector_type not in VECTOR_TYPE_COLUMNS:
+        raise HTTPException(status_code=400, detail="Invalid vector_type")
+    if top_n <= 0:
+        raise HTTPException(status_code=400, detail="top_n must be positive")
+
+    def search():
+        return get_top_candidates_for_job(
+            db, job_post_id, vector_type, get_employee_vector_index(db), top_n,
+            department_ids=department_ids,
+            grade_ids=grade_ids,
+            exclude_current_department=exclude_current_department,
+            return_percentage=True
+        )
+
+    try:
+        candidates = await run_in_threadpool(search)
+    except JobVectorNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return ORJSONResponse({"job_post_id": job_post_id, "vector_type": vector_type, "candidates": candidates})
+
+@app.get("/cache/stats")
+async def read_cache_stats():
+    return {
+        "explanation_cache": explanation_cache.stats(),
+        "principal_cache": principal_cache.stats(),
+        "profile_cache": profile_cache.stats(),
+        "recommendation_coalescing": recommendation_flights.stats(),
+        "recommendation_jobs": recommendation_jobs.stats(),
+        "job_vector_index": shared_job_vector_index.stats()
+    }
+
+@app.get("/ready")
+async def read_readiness():
+    # ウォームアップが終わるまでは503を返す（ロードバランサーのreadiness probe用）
+    return ORJSONResponse(warmup_state.to_dict(), status_code=200 if warmup_state.ready else 503)
+
+@app.get("/metrics")
+async def read_metrics():
+    # Prometheusのテキスト形式
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,349 @@
+# metrics.py
+import contextvars
+import functools
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as SampleCounter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# リクエスト単位のサンプリングプロファイラ（PROFILE_SLOW_REQUEST_MSを設定した場合のみ有効）
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "1.0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Counter:
+    """単調増加するカウンター（ラベルの組ごとに値を持つ）"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {value}")
+        return lines
+
+
+class Histogram:
+    """累積バケットのヒストグラム（Prometheusのhistogram形式で出力する）"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # ラベルの組 -> [バケットごとの件数, 合計, 件数]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (bucket_counts, total, count) in self._values.items():
+                labels = list(zip(self.labelnames, key))
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', repr(float(bound)))])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+registry: List = []
+# キャッシュ名 -> stats()を返す関数（/metricsの出力時に値を読む）
+cache_stats: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTPリクエストの処理時間", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("stage_duration_seconds", "処理段階ごとの所要時間", ("stage",))
+DB_QUERIES = Counter("db_queries_total", "実行したSQLの数")
+DB_QUERIES_PER_REQUEST = Histogram("db_queries_per_request", "リクエストごとのSQLの数", ("route",), QUERY_COUNT_BUCKETS)
+LLM_REQUESTS = Counter("llm_requests_total", "LLM呼び出しの回数", ("mode", "outcome"))
+LLM_SECONDS = Histogram("llm_request_duration_seconds", "LLM呼び出しの所要時間", ("mode",))
+LLM_TOKENS = Counter("llm_tokens_total", "LLMのトークン数", ("kind",))
+RECOMMENDATION_JOBS = Counter("recommendation_jobs_total", "非同期の推薦ジョブの数", ("outcome",))
+RECOMMENDATION_JOB_WAIT_SECONDS = Histogram("recommendation_job_wait_seconds", "推薦ジョブがキューで待った時間")
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, float]]) -> None:
+    """
+    /metricsにヒット率を出力するキャッシュを登録する
+
+    :param name: キャッシュ名（cacheラベルの値）
+    :param stats: hits（またはmemory_hits, db_hits）, misses, hit_rate を含む辞書を返す関数
+    """
+    cache_stats[name] = stats
+
+
+def _render_caches() -> List[str]:
+    lines = [
+        "# HELP cache_requests_total キャッシュの参照回数",
+        "# TYPE cache_requests_total counter"
+    ]
+    ratios = [
+        "# HELP cache_hit_ratio キャッシュのヒット率",
+        "# TYPE cache_hit_ratio gauge"
+    ]
+    for name, stats in cache_stats.items():
+        values = stats()
+        hits = values.get("hits", values.get("memory_hits", 0) + values.get("db_hits", 0))
+        lines.append(f'cache_requests_total{_format_labels([("cache", name), ("result", "hit")])} {hits}')
+        lines.append(f'cache_requests_total{_format_labels([("cache", name), ("result", "miss")])} {values.get("misses", 0)}')
+        ratios.append(f'cache_hit_ratio{_format_labels([("cache", name)])} {values.get("hit_rate", 0.0)}')
+    return lines + ratios
+
+
+def render_metrics() -> str:
+    """
+    登録済みのメトリクスをPrometheusのテキスト形式で出力する
+
+    :return: text/plain; version=0.0.4 の本文
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    lines.extend(_render_caches())
+    return "\n".join(lines) + "\n"
+
+
+class RequestMetrics:
+    """1リクエスト分の処理段階ごとの時間とSQLの数"""
+
+    __slots__ = ("spans", "db_queries")
+
+    def __init__(self):
+        # 段階名 -> 合計秒数（同じ段階が複数回あれば合算する）
+        self.spans: Dict[str, float] = {}
+        self.db_queries = 0
+
+    def add_span(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total_seconds: float) -> str:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items()]
+        entries.append(f'db;desc="{self.db_queries} queries"')
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+
+# スレッドプールで実行される処理にもコンテキストごと引き継がれる
+_current_request: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar("current_request_metrics", default=None)
+
+
+def begin_request() -> Tuple[RequestMetrics, contextvars.Token]:
+    recorder = RequestMetrics()
+    return recorder, _current_request.set(recorder)
+
+
+def end_request(token: contextvars.Token) -> None:
+    # begin_requestと同じコンテキストで呼ぶ
+    _current_request.reset(token)
+
+
+def record_request(recorder: RequestMetrics, method: str, route: str, status: int, elapsed: float) -> None:
+    HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=route, status=status)
+    DB_QUERIES_PER_REQUEST.observe(recorder.db_queries, route=route)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    処理段階の所要時間を計測する（stage_duration_secondsとServer-Timingヘッダーに記録される）
+
+    :param name: 段階名
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        recorder = _current_request.get()
+        if recorder is not None:
+            recorder.add_span(name, elapsed)
+
+
+def timed(name: str) -> Callable:
+    """
+    関数全体をspanで計測するデコレーター（async関数にも使える）
+
+    :param name: 段階名
+    """
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_call(mode: str, outcome: str, seconds: float, usage=None) -> None:
+    """
+    LLM呼び出しの回数・所要時間・トークン数を記録する
+
+    :param mode: "complete" または "stream"
+    :param outcome: "ok", "error" または "timeout"
+    :param seconds: 所要時間
+    :param usage: APIレスポンスのusage（prompt_tokens, completion_tokens）
+    """
+    LLM_REQUESTS.inc(mode=mode, outcome=outcome)
+    LLM_SECONDS.observe(seconds, mode=mode)
+    if usage is not None:
+        LLM_TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+        LLM_TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+
+
+# 非同期エンジンのsync_engineを含むすべてのエンジンのSQLを数える
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    DB_QUERIES.inc()
+    recorder = _current_request.get()
+    if recorder is not None:
+        recorder.db_queries += 1
+
+
+# 待機中のスレッドのスタックはプロファイルに含めない
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+
+
+class SamplingProfiler:
+    """
+    処理中の全スレッドのスタックを一定間隔で採取する（flamegraph用のfolded形式で保存する）
+    プロセス全体のスタックを採取するため、同時に処理中の他のリクエストのスタックも含まれる
+    """
+
+    # 同時に1つだけ動かす（サンプリングのスレッドを増やさない）
+    _active = threading.Lock()
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.samples: SampleCounter = SampleCounter()
+        self._stop = threading.Event()
+        self._stopping = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        # 複数回呼ばれてもロックは1回だけ解放する
+        with self._stopping:
+            if self._stop.is_set():
+                return
+            self._stop.set()
+        self._thread.join()
+        SamplingProfiler._active.release()
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def start_profiler() -> Optional[SamplingProfiler]:
+    # 無効な場合・サンプリング対象外の場合・他のリクエストを計測中の場合はNone
+    if PROFILE_SLOW_REQUEST_MS <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not SamplingProfiler._active.acquire(blocking=False):
+        return None
+    return SamplingProfiler(PROFILE_INTERVAL_MS / 1000).start()
+
+
+def _save_profile(profiler: SamplingProfiler, elapsed: float, label: str) -> Optional[str]:
+    profiler.stop()
+    if elapsed * 1000 < PROFILE_SLOW_REQUEST_MS or not profiler.samples:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{elapsed * 1000:.0f}ms.folded")
+    profiler.dump(path)
+    print(f"Slow request profiled: {label} took {elapsed * 1000:.0f}ms -> {path}")
+    return path
+
+
+async def finish_profiler(profiler: Optional[SamplingProfiler], elapsed: float, label: str) -> Optional[str]:
+    """
+    プロファイラを止め、PROFILE_SLOW_REQUEST_MSより遅かったリクエストのみ保存する
+    スレッドの終了待ちとファイルの書き込みはイベントループを止めないようにスレッドで実行する
+
+    :param profiler: start_profilerの戻り値
+    :param elapsed: リクエストの所要時間（秒）
+    :param label: ファイル名に含めるリクエストの説明
+    :return: 保存したファイルのパス（保存しなかった場合はNone）
+    """
+    if profiler is None:
+        return None
+    from starlette.concurrency import run_in_threadpool
+
+    try:
+        return await run_in_threadpool(_save_profile, profiler, elapsed, label)
+    except BaseException:
+        # キャンセルされてスレッドで実行されなかった場合もプロファイラを止め、次のリクエストで使えるようにする
+        profiler.stop()
+        raise
@@ -1,12 +1,13 @@
 # models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, Text, Float, Index, event
 from sqlalchemy.orm import relationship
 from database import Base
+from vector_codec import BinaryVector
 
 class Employee(Base):
     __tablename__ = 'employee'
     employee_id = Column(Integer, primary_key=True)
-    employee_name = Column(String)
+    employee_name = Column(String, index=True)
     password = Column(String)
     birthdate = Column(Date)
     gender = Column(String)
@@ -23,9 +24,11 @@ class Employee(Base):
     
     # 新しく追加したフィールド
     career_info_detail = Column(Text)
-    career_info_vector = Column(Text)  # JSONとして格納
+    career_info_vector = Column(BinaryVector)  # float32バイナリとして格納（旧JSON形式も読み込み可）
     personality_detail = Column(Text)
-    personality_vector = Column(Text)  # JSONとして格納
+    personality_vector = Column(BinaryVector)  # float32バイナリとして格納（旧JSON形式も読み込み可）
+    career_info_hash = Column(String)  # ベクトル化した時点のcareer_info_detailのハッシュ
+    personality_hash = Column(String)  # ベクトル化した時点のpersonality_detailのハッシュ
 
 # 以下の既存のクラスは変更なし
 class EmployeeVector(Base):
@@ -33,7 +36,7 @@ class EmployeeVector(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employee.employee_id"), unique=True)
-    vector = Column(String)  # JSON文字列として保存
+    vector = Column(BinaryVector)  # float32バイナリとして保存（旧JSON形式も読み込み可）
 
     employee = relationship("Employee", back_populates="vector")
 
@@ -53,7 +56,7 @@ class Grade(Base):
 class EmployeeSkill(Base):
     __tablename__ = 'employee_skill'
     employee_skill_id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey('employee.employee_id'))
+    employee_id = Column(Integer, ForeignKey('employee.employee_id'), index=True)
     skill_id = Column(Integer, ForeignKey('skill_list.skill_id'))
     employee = relationship('Employee', back_populates='skills')
     skill = relationship('SkillList', back_populates='employees')
@@ -68,7 +71,7 @@ class SkillList(Base):
 class Spi(Base):
     __tablename__ = 'spi'
     spi_id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey('employee.employee_id'))
+    employee_id = Column(Integer, ForeignKey('employee.employee_id'), index=True)
     extraversion = Column(Integer)
     agreebleness = Column(Integer)
     conscientiousness = Column(Integer)
@@ -79,7 +82,7 @@ class Spi(Base):
 class EvaluationHistory(Base):
     __tablename__ = 'evaluation_history'
     evaluation_id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey('employee.employee_id'))
+    employee_id = Column(Integer, ForeignKey('employee.employee_id'), index=True)
     evaluation_year = Column(Integer)
     evaluation = Column(String)
     evaluation_comment = Column(String)
@@ -113,7 +116,7 @@ class RequiredSkill(Base):
     __tablename__ = 'required_skill'
 
     required_id = Column(Integer, primary_key=True, autoincrement=True)
-    job_post_id = Column(Integer, ForeignKey('job_post.job_post_id'), nullable=False)
+    job_post_id = Column(Integer, ForeignKey('job_post.job_post_id'), nullable=False, index=True)
     skill_id = Column(Integer, ForeignKey('skill_list.skill_id'), nullable=False)
 
 class JobPostVector(Base):
@@ -121,5 +124,132 @@ class JobPostVector(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     job_post_id = Column(Integer, ForeignKey("job_post.job_post_id"), unique=True)
-    vector = Column(String)  # JSON文字列として保存
-    job_post = relationship("JobPost", back_populates="vector")
\ No newline at end of file
+    vector = Column(BinaryVector)  # float32バイナリとして保存（旧JSON形式も読み込み可）
+    content_hash = Column(String)  # ベクトル化した時点のjob_detailのハッシュ
+    job_post = relationship("JobPost", back_populates="vector")
+
+class DataChangeLog(Base):
+    """ベクトル等の変更を記録するテーブル（トリガーで自動追記される）"""
+    __tablename__ = "data_change_log"
+
+    change_id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer)  # 変更された行のキー（job_post_id など）
+
+    __table_args__ = (
+        Index("ix_data_change_log_table_change", "table_name", "change_id"),
+        # 従業員ごとの最新の変更IDを引くためのインデックス（/users/me のETag）
+        Index("ix_data_change_log_table_row", "table_name", "row_id", "change_id"),
+    )
+
+
+class ExplanationCacheEntry(Base):
+    """生成済みの推薦文のキャッシュ"""
+    __tablename__ = "explanation_cache"
+
+    cache_key = Column(String, primary_key=True)
+    explanation = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False)
+    expires_at = Column(Float, nullable=False, index=True)
+
+
+class EmployeeJobRecommendation(Base):
+    """従業員ごとの上位求人を事前に計算して保存するテーブル（1行が1件の順位）"""
+    __tablename__ = "employee_job_recommendation"
+
+    employee_id = Column(Integer, primary_key=True)
+    vector_type = Column(String, primary_key=True)  # "career_info_vector" または "personality_vector"
+    rank = Column(Integer, primary_key=True)  # 0始まりの順位
+    job_post_id = Column(Integer, nullable=False)
+    similarity = Column(Float, nullable=False)
+    computed_at = Column(Float, nullable=False)
+
+    # 変更された求人を含む一覧を探すためのインデックス
+    __table_args__ = (Index("ix_employee_job_recommendation_job", "vector_type", "job_post_id"),)
+
+
+class RecommendationRefreshState(Base):
+    """事前計算した推薦がどの変更ログまでを反映しているかを記録するテーブル"""
+    __tablename__ = "recommendation_refresh_state"
+
+    vector_type = Column(String, primary_key=True)
+    job_change_id = Column(Integer, nullable=False, default=0)
+    employee_change_id = Column(Integer, nullable=False, default=0)
+    top_n = Column(Integer, nullable=False)  # 従業員ごとに保存している件数
+    refreshed_at = Column(Float, nullable=False)
+    rebuilt_at = Column(Float, nullable=False)
+
+
+# 変更ログのトリガー定義（書き込み元に関係なく変更を検知するため）
+CHANGE_LOG_TRIGGERS = {
+    "job_post_vectors": "job_post_id",
+    "required_skill": "job_post_id",
+    "employee": "employee_id",
+    "department_member": "employee_id",
+    "employee_grade": "employee_id",
+    "employee_skill": "employee_id",
+    "spi": "employee_id",
+    "evaluation_history": "employee_id",
+    # 等級名・スキル名・部署名は全従業員のプロフィールに影響する
+    "grade": "grade_id",
+    "skill_list": "skill_id",
+    "department": "department_id",
+}
+
+
+def _change_log_ddl(table_name: str, key_column: str) -> list:
+    log = f"INSERT INTO data_change_log (table_name, row_id) VALUES ('{table_name}', {{row}}.{key_column});"
+    bodies = {
+        "INSERT": log.format(row="NEW"),
+        # キー自体が変更された場合は旧キーも記録する
+        "UPDATE": log.format(row="NEW") + (
+            f" INSERT INTO data_change_log (table_name, row_id) SELECT '{table_name}', OLD.{key_column}"
+            f" WHERE OLD.{key_column} IS NOT NEW.{key_column};"
+        ),
+        "DELETE": log.format(row="OLD"),
+    }
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table_name}_{operation.lower()}_log "
+        f"AFTER {operation} ON {table_name} BEGIN {body} END"
+        for operation, body in bodies.items()
+    ]
+
+
+def _postgresql_change_log_ddl(table_name: str, key_column: str) -> list:
+    # PostgreSQLではトリガー本体を関数として定義する
+    function = f"log_{table_name}_change"
+    return [
+        f"""CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO data_change_log (table_name, row_id) VALUES ('{table_name}', OLD.{key_column});
+                RETURN OLD;
+            END IF;
+            INSERT INTO data_change_log (table_name, row_id) VALUES ('{table_name}', NEW.{key_column});
+            IF TG_OP = 'UPDATE' AND OLD.{key_column} IS DISTINCT FROM NEW.{key_column} THEN
+                INSERT INTO data_change_log (table_name, row_id) VALUES ('{table_name}', OLD.{key_column});
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql""",
+        f"DROP TRIGGER IF EXISTS trg_{table_name}_log ON {table_name}",
+        f"CREATE TRIGGER trg_{table_name}_log AFTER INSERT OR UPDATE OR DELETE ON {table_name} "
+        f"FOR EACH ROW EXECUTE FUNCTION {function}()",
+    ]
+
+
+def create_change_log_triggers(connection) -> None:
+    """
+    変更ログ用のトリガーを作成する（既存DBに対しても冪等）
+
+    :param connection: データベース接続
+    """
+    build_ddl = _postgresql_change_log_ddl if connection.dialect.name == "postgresql" else _change_log_ddl
+    for table_name, key_column in CHANGE_LOG_TRIGGERS.items():
+        for statement in build_ddl(table_name, key_column):
+            connection.exec_driver_sql(statement)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _after_create(target, connection, **kw):
+    create_change_log_triggers(connection)
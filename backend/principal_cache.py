@@ -0,0 +1,191 @@
+# principal_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import DataChangeLog, Employee
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+# 変更ログを確認する間隔（この間のリクエストはDBにアクセスせずにキャッシュを返す）
+PRINCIPAL_CACHE_CHECK_SECONDS = float(os.getenv("PRINCIPAL_CACHE_CHECK_SECONDS", "1"))
+
+
+class Principal(NamedTuple):
+    """認証済みユーザーの識別情報（ORMオブジェクトではないためセッションに依存しない）"""
+    employee_id: int
+    employee_name: str
+
+
+PRINCIPAL_QUERY = select(Employee.employee_id, Employee.employee_name)
+LATEST_CHANGE_QUERY = select(func.max(DataChangeLog.change_id)).where(DataChangeLog.table_name == "employee")
+
+
+def changed_employees_query(watermark: int, latest: int, limit: int):
+    return select(DataChangeLog.row_id).where(
+        DataChangeLog.table_name == "employee",
+        DataChangeLog.change_id > watermark,
+        DataChangeLog.change_id <= latest
+    ).distinct().limit(limit)
+
+
+class PrincipalCache:
+    """
+    従業員IDから認証済みユーザーを引くための、件数上限とTTL付きのLRUキャッシュ
+    変更ログを PRINCIPAL_CACHE_CHECK_SECONDS ごとに確認し、更新・削除された従業員のエントリを破棄する
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PRINCIPAL_CACHE_SIZE,
+        ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS,
+        check_seconds: float = PRINCIPAL_CACHE_CHECK_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.check_seconds = check_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # キャッシュに反映済みの変更ID（Noneの場合は未確認）
+        self._watermark: Optional[int] = None
+        self._next_check = 0.0
+        # 変更を反映するたびに増やす（読み込み中に変更があったエントリを保存しないため）
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _check_due(self) -> bool:
+        if time.monotonic() < self._next_check:
+            return False
+        self._next_check = time.monotonic() + self.check_seconds
+        return True
+
+    def _apply_changes(self, latest: int, changed: List[int]) -> None:
+        with self._lock:
+            if self._watermark is not None and latest <= self._watermark:
+                return
+            if len(changed) > self.max_entries:
+                self._entries.clear()
+            else:
+                for employee_id in changed:
+                    self._entries.pop(employee_id, None)
+            self._watermark = latest
+            self._epoch += 1
+
+    def sync(self, db: Session) -> None:
+        """
+        前回の確認以降に変更された従業員のエントリを破棄する（確認の間隔内であれば何もしない）
+
+        :param db: データベースセッション
+        """
+        if not self._check_due():
+            return
+        latest = db.execute(LATEST_CHANGE_QUERY).scalar() or 0
+        watermark = self._watermark
+        if watermark is not None and latest <= watermark:
+            return
+        changed = []
+        if watermark is not None:
+            changed = list(db.execute(changed_employees_query(watermark, latest, self.max_entries + 1)).scalars())
+        self._apply_changes(latest, changed)
+
+    async def sync_async(self, db: AsyncSession) -> None:
+        """
+        syncの非同期版
+
+        :param db: 非同期データベースセッション
+        """
+        if not self._check_due():
+            return
+        latest = (await db.execute(LATEST_CHANGE_QUERY)).scalar() or 0
+        watermark = self._watermark
+        if watermark is not None and latest <= watermark:
+            return
+        changed = []
+        if watermark is not None:
+            changed = list((await db.execute(changed_employees_query(watermark, latest, self.max_entries + 1))).scalars())
+        self._apply_changes(latest, changed)
+
+    def _lookup(self, employee_id: int) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(employee_id)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(employee_id)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[employee_id]
+            self.misses += 1
+        return None
+
+    def _remember(self, row, epoch: int) -> Optional[Principal]:
+        if row is None:
+            return None
+        principal = Principal(row.employee_id, row.employee_name)
+        with self._lock:
+            if epoch != self._epoch:
+                # 読み込み中に変更が反映された場合は古い可能性があるため保存しない
+                return principal
+            self._entries[principal.employee_id] = (principal, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(principal.employee_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return principal
+
+    def get(self, db: Session, employee_id: int) -> Optional[Principal]:
+        """
+        認証済みユーザーを取得する（キャッシュにない場合のみ主キーで1回クエリする）
+
+        :param db: データベースセッション
+        :param employee_id: 従業員ID
+        :return: Principal（従業員が存在しない場合はNone）
+        """
+        self.sync(db)
+        principal = self._lookup(employee_id)
+        if principal is not None:
+            return principal
+        epoch = self._epoch
+        return self._remember(db.execute(PRINCIPAL_QUERY.where(Employee.employee_id == employee_id)).first(), epoch)
+
+    async def get_async(self, db: AsyncSession, employee_id: int) -> Optional[Principal]:
+        """
+        getの非同期版
+
+        :param db: 非同期データベースセッション
+        :param employee_id: 従業員ID
+        :return: Principal（従業員が存在しない場合はNone）
+        """
+        await self.sync_async(db)
+        principal = self._lookup(employee_id)
+        if principal is not None:
+            return principal
+        epoch = self._epoch
+        return self._remember((await db.execute(PRINCIPAL_QUERY.where(Employee.employee_id == employee_id))).first(), epoch)
+
+    def invalidate(self, employee_id: int) -> None:
+        with self._lock:
+            self._entries.pop(employee_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "entries": len(self._entries),
+                "watermark": self._watermark or 0
+            }
+
+
+principal_cache = PrincipalCache()
+
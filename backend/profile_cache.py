@@ -0,0 +1,173 @@
+# profile_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+import orjson
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import DataChangeLog
+from utils import get_all_employee_data, load_employee_profile_async
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "4096"))
+# 変更ログを確認する間隔（この間のリクエストはDBにアクセスせずにキャッシュを返す）
+PROFILE_CACHE_CHECK_SECONDS = float(os.getenv("PROFILE_CACHE_CHECK_SECONDS", "1"))
+# レスポンスの形式を変更した場合はこの値を上げて古いETagを無効にする
+PROFILE_FORMAT_VERSION = 1
+
+# 従業員IDをキーに変更ログが記録される、プロフィールの元になるテーブル
+PROFILE_TABLES = ("employee", "employee_grade", "employee_skill", "spi", "evaluation_history", "department_member")
+# 変更された場合は全従業員のプロフィールを作り直すテーブル（等級名・スキル名・部署名）
+REFERENCE_TABLES = ("grade", "skill_list", "department")
+
+
+class ProfileEntry(NamedTuple):
+    """シリアライズ済みの /users/me のレスポンス"""
+    body: bytes
+    etag: str
+
+
+def make_profile_etag(employee_id: int, version: int, reference_version: int) -> str:
+    """
+    従業員のデータのバージョンから強いETagを作る（ワーカーや再起動をまたいでも同じ値になる）
+
+    :param employee_id: 従業員ID
+    :param version: その従業員の行の最新の変更ID
+    :param reference_version: 等級・スキル・部署のマスタの最新の変更ID
+    :return: ダブルクォートで囲んだETag
+    """
+    return f'"p{PROFILE_FORMAT_VERSION}-{employee_id}-{version}-{reference_version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Matchヘッダーが指定のETagに一致するかを判定する（弱い比較）
+
+    :param if_none_match: If-None-Matchヘッダーの値
+    :param etag: 現在のETag
+    :return: 一致する場合True
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ProfileCache:
+    """
+    従業員ごとにシリアライズ済みの /users/me のレスポンスを持つ、件数上限付きのLRUキャッシュ
+    変更ログを PROFILE_CACHE_CHECK_SECONDS ごとに確認し、行が変更された従業員のエントリを破棄する
+    """
+
+    def __init__(self, max_entries: int = PROFILE_CACHE_SIZE, check_seconds: float = PROFILE_CACHE_CHECK_SECONDS):
+        self.max_entries = max_entries
+        self.check_seconds = check_seconds
+        self._entries: "OrderedDict[int, ProfileEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # キャッシュに反映済みの変更ID（Noneの場合は未確認）
+        self._watermark: Optional[int] = None
+        self._next_check = 0.0
+        # 変更を反映するたびに増やす（読み込み中に変更があったエントリを保存しないため）
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def sync(self, db: AsyncSession) -> None:
+        """
+        前回の確認以降に変更された従業員のエントリを破棄する（確認の間隔内であれば何もしない）
+
+        :param db: 非同期データベースセッション
+        """
+        if time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.check_seconds
+        tables = PROFILE_TABLES + REFERENCE_TABLES
+        latest = (await db.execute(
+            select(func.max(DataChangeLog.change_id)).where(DataChangeLog.table_name.in_(tables))
+        )).scalar() or 0
+        watermark = self._watermark
+        if watermark is not None and latest <= watermark:
+            return
+        changed = []
+        if watermark is not None:
+            changed = (await db.execute(
+                select(DataChangeLog.table_name, DataChangeLog.row_id).where(
+                    DataChangeLog.table_name.in_(tables),
+                    DataChangeLog.change_id > watermark,
+                    DataChangeLog.change_id <= latest
+                ).distinct().limit(self.max_entries + 1)
+            )).all()
+        with self._lock:
+            if self._watermark is not None and latest <= self._watermark:
+                return
+            if len(changed) > self.max_entries or any(row.table_name in REFERENCE_TABLES for row in changed):
+                self._entries.clear()
+            else:
+                for row in changed:
+                    self._entries.pop(row.row_id, None)
+            self._watermark = latest
+            self._epoch += 1
+
+    def get(self, employee_id: int) -> Optional[ProfileEntry]:
+        with self._lock:
+            entry = self._entries.get(employee_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(employee_id)
+            self.hits += 1
+            return entry
+
+    async def load(self, db: AsyncSession, employee_id: int) -> Optional[ProfileEntry]:
+        """
+        キャッシュになければプロフィールを読み込んでシリアライズし、キャッシュに保存する
+
+        :param db: 非同期データベースセッション
+        :param employee_id: 従業員ID
+        :return: ProfileEntry（従業員が存在しない場合はNone）
+        """
+        await self.sync(db)
+        entry = self.get(employee_id)
+        if entry is not None:
+            return entry
+
+        epoch = self._epoch
+        # バージョンを先に読むため、読み込み中に変更されてもETagが内容より新しくなることはない
+        version, reference_version = (await db.execute(select(
+            select(func.max(DataChangeLog.change_id)).where(
+                DataChangeLog.table_name.in_(PROFILE_TABLES), DataChangeLog.row_id == employee_id
+            ).scalar_subquery(),
+            select(func.max(DataChangeLog.change_id)).where(DataChangeLog.table_name.in_(REFERENCE_TABLES)).scalar_subquery()
+        ))).one()
+        employee = await load_employee_profile_async(db, employee_id)
+        employee_data = get_all_employee_data(db, employee) if employee is not None else None
+        if employee_data is None:
+            return None
+        entry = ProfileEntry(orjson.dumps(employee_data), make_profile_etag(employee_id, version or 0, reference_version or 0))
+        with self._lock:
+            if self._epoch == epoch:
+                self._entries[employee_id] = entry
+                self._entries.move_to_end(employee_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "entries": len(self._entries),
+                "watermark": self._watermark or 0
+            }
+
+
+profile_cache = ProfileCache()
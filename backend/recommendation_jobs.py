@@ -0,0 +1,443 @@
+# recommendation_jobs.py
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+import orjson
+from starlette.concurrency import run_in_threadpool
+from metrics import RECOMMENDATION_JOB_WAIT_SECONDS, RECOMMENDATION_JOBS
+from principal_cache import Principal
+
+# 推薦ジョブを同時に実行するワーカー数
+RECOMMENDATION_JOB_WORKERS = int(os.getenv("RECOMMENDATION_JOB_WORKERS", "4"))
+# 待機できるジョブの上限（超えた場合は受け付けない）
+RECOMMENDATION_JOB_QUEUE_SIZE = int(os.getenv("RECOMMENDATION_JOB_QUEUE_SIZE", "1000"))
+# 完了したジョブの結果を保持する秒数
+RECOMMENDATION_JOB_TTL_SECONDS = float(os.getenv("RECOMMENDATION_JOB_TTL_SECONDS", "600"))
+# 1件のジョブの実行時間の上限
+RECOMMENDATION_JOB_TIMEOUT_SECONDS = float(os.getenv("RECOMMENDATION_JOB_TIMEOUT_SECONDS", "300"))
+# ジョブを保存するSQLiteファイル（空の場合はプロセス内のみ。設定すると再起動後も結果を返せ、未完了のジョブは再実行する）
+RECOMMENDATION_JOB_STORE_PATH = os.getenv("RECOMMENDATION_JOB_STORE_PATH", "")
+# 未完了のジョブを実行中のプロセスが保持する期間（この間に更新がなければ他のプロセスが引き取る。1/3の間隔で更新する）
+RECOMMENDATION_JOB_LEASE_SECONDS = float(os.getenv("RECOMMENDATION_JOB_LEASE_SECONDS", "30"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+FINISHED_STATUSES = (COMPLETED, FAILED)
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class QueueFull(Exception):
+    """待機中のジョブが上限に達している"""
+
+
+class RecommendationJob:
+    """非同期の推薦ジョブ（リクエストの内容・状態・途中までの結果）"""
+
+    def __init__(self, principal: Principal, request: Dict[str, Any], job_id: Optional[str] = None, created_at: Optional[float] = None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.principal = principal
+        # vector_type, fields, weights
+        self.request = request
+        self.status = QUEUED
+        self.created_at = created_at or time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # top_jobs, freshness, recommendations（推薦文は生成が終わったベクトルタイプから入る）
+        self.result: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.on_change: Optional[Callable[["RecommendationJob"], None]] = None
+
+    def update(self, partial: Dict[str, Any]) -> None:
+        """
+        途中までの結果を反映する（GETで完了前から返す）
+
+        :param partial: resultに上書きする項目
+        """
+        self.result = {**self.result, **partial}
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "vector_type": self.request["vector_type"],
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            **self.result,
+            "error": self.error,
+            "status_code": self.status_code
+        }
+
+    def to_record(self) -> bytes:
+        return orjson.dumps({
+            **self.to_dict(),
+            "result": self.result,
+            "principal": list(self.principal),
+            "request": self.request
+        }, option=ORJSON_OPTIONS)
+
+    @classmethod
+    def from_record(cls, record: bytes) -> "RecommendationJob":
+        data = orjson.loads(record)
+        job = cls(Principal(*data["principal"]), data["request"], data["job_id"], data["created_at"])
+        job.status = data["status"]
+        job.started_at = data["started_at"]
+        job.finished_at = data["finished_at"]
+        job.result = data["result"]
+        job.error = data["error"]
+        job.status_code = data["status_code"]
+        return job
+
+
+class JobStore:
+    """
+    ジョブをSQLiteファイルに保存する（同じファイルを使う他のワーカープロセスのジョブも参照できる）
+    未完了のジョブは実行するプロセス（owner）がリースを更新し続け、リースが切れたジョブのみ他のプロセスが引き取る
+    """
+
+    def __init__(self, path: str, owner: str, lease_seconds: float = RECOMMENDATION_JOB_LEASE_SECONDS):
+        self.path = path
+        # このプロセスを表す値（未完了のジョブをどのプロセスが実行するかの記録に使う）
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS recommendation_jobs ("
+                "job_id TEXT PRIMARY KEY, employee_id INTEGER NOT NULL, owner TEXT NOT NULL, "
+                "status TEXT NOT NULL, record BLOB NOT NULL, finished_at REAL, heartbeat_at REAL, lease_expires_at REAL)"
+            )
+            # リースのカラムがない以前のファイルにはカラムを追加する（値がない行はリースが切れているとみなす）
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(recommendation_jobs)")}
+            for column in ("heartbeat_at", "lease_expires_at"):
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE recommendation_jobs ADD COLUMN {column} REAL")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_recommendation_jobs_finished_at ON recommendation_jobs (finished_at)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_recommendation_jobs_lease ON recommendation_jobs (status, lease_expires_at)")
+            self._connection = connection
+        return self._connection
+
+    def insert(self, job: RecommendationJob) -> None:
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "INSERT INTO recommendation_jobs (job_id, employee_id, owner, status, record, finished_at, heartbeat_at, lease_expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.job_id, job.principal.employee_id, self.owner, job.status, job.to_record(), job.finished_at, now, now + self.lease_seconds)
+            )
+
+    def save(self, job_id: str, status: str, record: bytes, finished_at: Optional[float]) -> bool:
+        """
+        このプロセスが保持しているジョブの状態を書き込み、リースを延長する
+
+        :param job_id: ジョブID
+        :param status: ジョブの状態
+        :param record: RecommendationJob.to_recordで作成した値
+        :param finished_at: 完了した時刻（未完了の場合None）
+        :return: 書き込んだ場合True（リースが切れて他のプロセスが引き取っていた場合False）
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._connect().execute(
+                "UPDATE recommendation_jobs SET status = ?, record = ?, finished_at = ?, heartbeat_at = ?, lease_expires_at = ? "
+                "WHERE job_id = ? AND owner = ?",
+                (status, record, finished_at, now, now + self.lease_seconds, job_id, self.owner)
+            )
+        return cursor.rowcount == 1
+
+    def heartbeat(self) -> int:
+        """
+        このプロセスが保持している未完了のジョブのリースをまとめて延長する
+
+        :return: 延長したジョブの数
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._connect().execute(
+                "UPDATE recommendation_jobs SET heartbeat_at = ?, lease_expires_at = ? WHERE owner = ? AND status IN (?, ?)",
+                (now, now + self.lease_seconds, self.owner, QUEUED, RUNNING)
+            )
+        return cursor.rowcount
+
+    def release(self) -> None:
+        # 終了時に未完了のジョブのリースを手放し、次に起動したプロセスがすぐに引き取れるようにする
+        with self._lock:
+            self._connect().execute(
+                "UPDATE recommendation_jobs SET lease_expires_at = 0 WHERE owner = ? AND status IN (?, ?)",
+                (self.owner, QUEUED, RUNNING)
+            )
+
+    def load(self, job_id: str) -> Optional[RecommendationJob]:
+        with self._lock:
+            row = self._connect().execute("SELECT record FROM recommendation_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return RecommendationJob.from_record(row[0]) if row else None
+
+    def claim_expired(self) -> List[RecommendationJob]:
+        """
+        リースが切れた未完了のジョブ（停止・応答しなくなったプロセスのジョブ）を、このプロセスで実行するために引き取る
+        引き取りはownerとリースの期限を条件にした更新で行うため、実行中のジョブや他のプロセスが先に引き取ったジョブは引き取らない
+
+        :return: 引き取ったジョブのリスト
+        """
+        claimed = []
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            rows = connection.execute(
+                "SELECT job_id, owner, record FROM recommendation_jobs "
+                "WHERE status IN (?, ?) AND COALESCE(lease_expires_at, 0) < ? AND owner != ?",
+                (QUEUED, RUNNING, now, self.owner)
+            ).fetchall()
+            for job_id, owner, record in rows:
+                cursor = connection.execute(
+                    "UPDATE recommendation_jobs SET owner = ?, heartbeat_at = ?, lease_expires_at = ? "
+                    "WHERE job_id = ? AND owner = ? AND COALESCE(lease_expires_at, 0) < ?",
+                    (self.owner, now, now + self.lease_seconds, job_id, owner, now)
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(RecommendationJob.from_record(record))
+        return claimed
+
+    def purge(self, finished_before: float) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM recommendation_jobs WHERE finished_at < ?", (finished_before,))
+
+
+class RecommendationJobQueue:
+    """
+    推薦ジョブのキューと、上限数のワーカーで実行するプール
+    リクエストはジョブIDを受け取ってすぐに返り、結果はGETで取得する（接続を推薦文の生成が終わるまで保持しない）
+    ストアへの書き込みはイベントループを止めないようにスレッドで行い、リースの更新・引き取り・期限切れの削除は一定間隔で行う
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[RecommendationJob], Awaitable[Dict[str, Any]]],
+        workers: int = RECOMMENDATION_JOB_WORKERS,
+        max_queued: int = RECOMMENDATION_JOB_QUEUE_SIZE,
+        ttl_seconds: float = RECOMMENDATION_JOB_TTL_SECONDS,
+        timeout_seconds: float = RECOMMENDATION_JOB_TIMEOUT_SECONDS,
+        store_path: str = RECOMMENDATION_JOB_STORE_PATH,
+        lease_seconds: float = RECOMMENDATION_JOB_LEASE_SECONDS
+    ):
+        self.runner = runner
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self.timeout_seconds = timeout_seconds
+        # リースの更新・期限切れのジョブの引き取りと削除を行う間隔
+        self.maintenance_seconds = lease_seconds / 3
+        self.store = JobStore(store_path, uuid.uuid4().hex, lease_seconds) if store_path else None
+        self._jobs: Dict[str, RecommendationJob] = {}
+        # 同じ内容の未完了のジョブ（キー -> ジョブID）。同じリクエストの再送は既存のジョブIDを返す
+        self._active: Dict[Hashable, str] = {}
+        self._keys: Dict[str, Hashable] = {}
+        # ジョブごとの書き込み中のタスクと、書き込み後に再度書き込む必要があるジョブ（書き込みの順序を保つ）
+        self._saving: Dict[str, asyncio.Task] = {}
+        self._dirty: Set[str] = set()
+        # リースが切れて他のプロセスが引き取ったジョブ（以降は書き込まない）
+        self._lost: Set[str] = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._maintenance: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._maintenance = asyncio.create_task(self._maintain())
+        await self._claim()
+
+    async def stop(self) -> None:
+        # 未完了のジョブはストアに残り、リースを手放すため次に起動したプロセスがすぐに引き取る
+        tasks = self._tasks + ([self._maintenance] if self._maintenance is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*self._saving.values(), return_exceptions=True)
+        self._tasks = []
+        self._maintenance = None
+        if self.store is not None:
+            await run_in_threadpool(self.store.release)
+
+    def _track(self, job: RecommendationJob, key: Optional[Hashable] = None) -> None:
+        self._jobs[job.job_id] = job
+        if key is not None:
+            self._active[key] = job.job_id
+            self._keys[job.job_id] = key
+        job.on_change = self._save_later
+
+    def _untrack(self, job: RecommendationJob) -> None:
+        key = self._keys.pop(job.job_id, None)
+        if key is not None and self._active.get(key) == job.job_id:
+            del self._active[key]
+
+    def _save_later(self, job: RecommendationJob) -> None:
+        # 進捗の書き込みはジョブごとに1つのタスクで順に行い、書き込み中の変更はまとめて次に書き込む
+        if self.store is None or job.job_id in self._lost:
+            return
+        self._dirty.add(job.job_id)
+        if job.job_id not in self._saving:
+            self._saving[job.job_id] = asyncio.create_task(self._flush(job))
+
+    async def _flush(self, job: RecommendationJob) -> None:
+        try:
+            while job.job_id in self._dirty:
+                self._dirty.discard(job.job_id)
+                # 書き込む内容はイベントループ上で確定させる
+                saved = await run_in_threadpool(self.store.save, job.job_id, job.status, job.to_record(), job.finished_at)
+                if not saved:
+                    self._lost.add(job.job_id)
+                    self._dirty.discard(job.job_id)
+                    print(f"Recommendation job {job.job_id} was claimed by another worker after its lease expired")
+        except Exception as e:
+            print(f"Error saving recommendation job {job.job_id}: {e}")
+        finally:
+            del self._saving[job.job_id]
+
+    async def submit(self, principal: Principal, request: Dict[str, Any], key: Optional[Hashable] = None) -> RecommendationJob:
+        """
+        ジョブをキューに追加する（同じキーの未完了のジョブがあればそれを返す）
+
+        :param principal: リクエストした従業員
+        :param request: vector_type, fields, weights を含む辞書
+        :param key: 同一のリクエストとみなすキー
+        :return: RecommendationJob
+        :raises QueueFull: 待機中のジョブが上限に達している場合
+        """
+        await self.start()
+        job_id = self._active.get(key) if key is not None else None
+        if job_id is not None:
+            self.deduplicated += 1
+            return self._jobs[job_id]
+        if self._queue.qsize() >= self.max_queued:
+            self.rejected += 1
+            RECOMMENDATION_JOBS.inc(outcome="rejected")
+            raise QueueFull(f"{self._queue.qsize()} recommendation jobs are already queued")
+        job = RecommendationJob(principal, request)
+        self.submitted += 1
+        # 書き込みを待つ間に届いた同じ内容のリクエストにも、このジョブを返す
+        self._track(job, key)
+        if self.store is not None:
+            try:
+                await run_in_threadpool(self.store.insert, job)
+            except Exception:
+                self._untrack(job)
+                del self._jobs[job.job_id]
+                raise
+        self._queue.put_nowait(job)
+        return job
+
+    async def get(self, job_id: str, employee_id: int) -> Optional[Dict[str, Any]]:
+        """
+        ジョブの状態と途中までの結果を取得する（他の従業員のジョブは返さない）
+
+        :param job_id: ジョブID
+        :param employee_id: リクエストした従業員のID
+        :return: ジョブの状態の辞書（存在しない・期限切れの場合None）
+        """
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            # 他のワーカープロセスが受け付けたジョブ
+            job = await run_in_threadpool(self.store.load, job_id)
+        if job is None or job.principal.employee_id != employee_id:
+            return None
+        if job.finished_at is not None and job.finished_at < time.time() - self.ttl_seconds:
+            return None
+        return job.to_dict()
+
+    async def _maintain(self) -> None:
+        while True:
+            await asyncio.sleep(self.maintenance_seconds)
+            try:
+                if self.store is not None:
+                    await run_in_threadpool(self.store.heartbeat)
+                    await self._claim()
+                await self._purge()
+            except Exception as e:
+                print(f"Error maintaining recommendation jobs: {e}")
+
+    async def _claim(self) -> None:
+        if self.store is None:
+            return
+        claimed = await run_in_threadpool(self.store.claim_expired)
+        for job in claimed:
+            # 実行途中で止まったジョブは最初からやり直す
+            job.status, job.started_at, job.result = QUEUED, None, {}
+            self._track(job)
+            self._save_later(job)
+            self._queue.put_nowait(job)
+        if claimed:
+            print(f"Recommendation jobs resumed: {len(claimed)}")
+
+    async def _purge(self) -> None:
+        expired_before = time.time() - self.ttl_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at is not None and job.finished_at < expired_before]:
+            del self._jobs[job_id]
+            self._lost.discard(job_id)
+        if self.store is not None:
+            await run_in_threadpool(self.store.purge, expired_before)
+
+    def _finish(self, job: RecommendationJob, status: str) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        self._untrack(job)
+        RECOMMENDATION_JOBS.inc(outcome=status)
+        self._save_later(job)
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                job.status = RUNNING
+                job.started_at = time.time()
+                RECOMMENDATION_JOB_WAIT_SECONDS.observe(job.started_at - job.created_at)
+                self._save_later(job)
+                # 実行中に反映された途中の結果を残すため、完了を待ってから結合する
+                result = await asyncio.wait_for(self.runner(job), self.timeout_seconds)
+                job.result = {**job.result, **result}
+                self._finish(job, COMPLETED)
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                job.error, job.status_code = f"Recommendation job timed out after {self.timeout_seconds}s", 504
+                self._finish(job, FAILED)
+            except Exception as e:
+                # HTTPExceptionの場合はステータスコードと詳細をそのまま返す
+                job.error = str(getattr(e, "detail", e))
+                job.status_code = getattr(e, "status_code", 500)
+                print(f"Error in recommendation job {job.job_id}: {job.error}")
+                self._finish(job, FAILED)
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": statuses.count(RUNNING),
+            "retained": sum(status in FINISHED_STATUSES for status in statuses),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected
+        }
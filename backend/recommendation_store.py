@@ -0,0 +1,302 @@
+# recommendation_store.py
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from employee_index import EMPLOYEE_VECTOR_COLUMNS, EmployeeVectorIndex
+from models import DataChangeLog, Employee, EmployeeJobRecommendation, RecommendationRefreshState
+from vector_index import FULL_RELOAD_RATIO, JobVectorIndex, latest_change_id, lookup_positions, top_k_rows
+
+# 従業員ごとに保存する上位求人の数（変更するとすべて再計算される）
+MATERIALIZED_TOP_N = int(os.getenv("MATERIALIZED_TOP_N", "10"))
+MATERIALIZE_CHUNK_SIZE = 1024
+# IN句に渡すIDの最大数（SQLiteの変数の上限を超えないようにする）
+ID_CHUNK_SIZE = 500
+
+JOB_TABLE_NAME = JobVectorIndex.TABLE_NAME
+EMPLOYEE_TABLE_NAME = Employee.__tablename__
+
+
+def _chunks(values: Sequence, size: int) -> Iterable[Sequence]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _changed_ids(db: Session, table_name: str, since: int, until: int) -> List[int]:
+    return [
+        row.row_id for row in db.query(DataChangeLog.row_id).filter(
+            DataChangeLog.table_name == table_name,
+            DataChangeLog.change_id > since,
+            DataChangeLog.change_id <= until
+        ).distinct()
+    ]
+
+
+def _delete_lists(db: Session, column: str, employee_ids: Sequence[int]) -> None:
+    for chunk in _chunks(list(employee_ids), ID_CHUNK_SIZE):
+        db.execute(delete(EmployeeJobRecommendation).where(
+            EmployeeJobRecommendation.vector_type == column,
+            EmployeeJobRecommendation.employee_id.in_(chunk)
+        ))
+
+
+def _insert_lists(db: Session, column: str, employee_ids: np.ndarray, job_ids: np.ndarray, scores: np.ndarray, computed_at: float) -> None:
+    # スコアが-infの列は空き（保存済みの件数が上限未満だった一覧）
+    rows = [
+        {
+            "employee_id": employee_id,
+            "vector_type": column,
+            "rank": rank,
+            "job_post_id": job_id,
+            "similarity": score,
+            "computed_at": computed_at
+        }
+        for employee_id, row_jobs, row_scores in zip(employee_ids.tolist(), job_ids.tolist(), scores.tolist())
+        for rank, (job_id, score) in enumerate(zip(row_jobs, row_scores))
+        if score != -np.inf
+    ]
+    if rows:
+        db.execute(insert(EmployeeJobRecommendation), rows)
+
+
+def _load_lists(db: Session, column: str, employee_ids: np.ndarray, top_n: int) -> tuple:
+    # 保存済みの一覧を 従業員×順位 の配列にする（空きのスコアは-inf）
+    positions = {employee_id: i for i, employee_id in enumerate(employee_ids.tolist())}
+    job_ids = np.zeros((len(employee_ids), top_n), dtype=np.int64)
+    scores = np.full((len(employee_ids), top_n), -np.inf, dtype=np.float32)
+    for chunk in _chunks(employee_ids.tolist(), ID_CHUNK_SIZE):
+        rows = db.execute(select(
+            EmployeeJobRecommendation.employee_id,
+            EmployeeJobRecommendation.rank,
+            EmployeeJobRecommendation.job_post_id,
+            EmployeeJobRecommendation.similarity
+        ).where(
+            EmployeeJobRecommendation.vector_type == column,
+            EmployeeJobRecommendation.employee_id.in_(chunk),
+            EmployeeJobRecommendation.rank < top_n
+        ))
+        for row in rows:
+            job_ids[positions[row.employee_id], row.rank] = row.job_post_id
+            scores[positions[row.employee_id], row.rank] = row.similarity
+    return job_ids, scores
+
+
+def _top_jobs(queries: np.ndarray, job_matrix: np.ndarray, top_n: int) -> tuple:
+    scores = queries @ job_matrix.T
+    indices = top_k_rows(scores, min(top_n, job_matrix.shape[0]))
+    return indices, np.take_along_axis(scores, indices, axis=1)
+
+
+class _Snapshot:
+    """1つのベクトルタイプの計算に使う求人・従業員の行列"""
+
+    def __init__(self, job_index: JobVectorIndex, employee_index: EmployeeVectorIndex, column: str):
+        self.job_ids = job_index.job_ids
+        self.job_matrix = job_index.matrix
+        self.employee_ids, self.matrix, has_vector = employee_index.vectors(column)
+        # 次元が一致しない（まだベクトルがないなど）場合は計算対象がない
+        if not len(self.job_ids) or self.matrix.shape[1] != self.job_matrix.shape[1]:
+            has_vector = np.zeros(len(self.employee_ids), dtype=bool)
+        self.has_vector = has_vector
+
+
+def _recompute(db: Session, column: str, snapshot: _Snapshot, employee_ids: Sequence[int], top_n: int, chunk_size: int, computed_at: float) -> int:
+    # 指定した従業員の一覧を全求人から計算し直す（削除された従業員やベクトルのない従業員は一覧を消す）
+    _delete_lists(db, column, employee_ids)
+    positions, found = lookup_positions(snapshot.employee_ids, np.asarray(list(employee_ids), dtype=np.int64))
+    rows = positions[found]
+    rows = rows[snapshot.has_vector[rows]]
+    for chunk in _chunks(rows, chunk_size):
+        indices, scores = _top_jobs(snapshot.matrix[chunk], snapshot.job_matrix, top_n)
+        _insert_lists(db, column, snapshot.employee_ids[chunk], snapshot.job_ids[indices], scores, computed_at)
+    return len(rows)
+
+
+def _rebuild(db: Session, column: str, snapshot: _Snapshot, top_n: int, chunk_size: int, computed_at: float) -> int:
+    db.execute(delete(EmployeeJobRecommendation).where(EmployeeJobRecommendation.vector_type == column))
+    rows = np.flatnonzero(snapshot.has_vector)
+    for chunk in _chunks(rows, chunk_size):
+        indices, scores = _top_jobs(snapshot.matrix[chunk], snapshot.job_matrix, top_n)
+        _insert_lists(db, column, snapshot.employee_ids[chunk], snapshot.job_ids[indices], scores, computed_at)
+    return len(rows)
+
+
+def _merge_new_jobs(db: Session, column: str, snapshot: _Snapshot, job_rows: np.ndarray, recompute: Set[int], top_n: int, chunk_size: int, computed_at: float) -> int:
+    """
+    追加・変更された求人のみを全従業員と比較し、保存済みの一覧の最下位を上回る従業員の一覧に差し込む
+    （変更された求人を一覧に含んでいた従業員はrecomputeに含まれているため対象外）
+
+    :return: 一覧を更新した従業員数
+    """
+    summary = db.execute(select(
+        EmployeeJobRecommendation.employee_id,
+        func.min(EmployeeJobRecommendation.similarity).label("threshold"),
+        func.count().label("count")
+    ).where(EmployeeJobRecommendation.vector_type == column).group_by(EmployeeJobRecommendation.employee_id)).all()
+    listed_ids = np.fromiter((row.employee_id for row in summary), dtype=np.int64, count=len(summary))
+    thresholds = np.fromiter((row.threshold for row in summary), dtype=np.float32, count=len(summary))
+    counts = np.fromiter((row.count for row in summary), dtype=np.int64, count=len(summary))
+
+    rows = np.flatnonzero(snapshot.has_vector & ~np.isin(snapshot.employee_ids, np.fromiter(recompute, dtype=np.int64, count=len(recompute))))
+    positions, listed = lookup_positions(listed_ids, snapshot.employee_ids[rows])
+    # 一覧がまだない従業員は全求人から計算する
+    recompute.update(snapshot.employee_ids[rows[~listed]].tolist())
+    rows, positions = rows[listed], positions[listed]
+
+    new_job_ids = snapshot.job_ids[job_rows]
+    new_job_matrix = snapshot.job_matrix[job_rows]
+    merged = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        chunk_positions = positions[start:start + chunk_size]
+        new_scores = snapshot.matrix[chunk] @ new_job_matrix.T
+        # 件数が上限未満の一覧は全求人を含んでいるため、必ず差し込む
+        needed = (counts[chunk_positions] < top_n) | (new_scores.max(axis=1) > thresholds[chunk_positions])
+        if not needed.any():
+            continue
+        employee_ids = snapshot.employee_ids[chunk[needed]]
+        old_job_ids, old_scores = _load_lists(db, column, employee_ids, top_n)
+        job_ids = np.hstack([old_job_ids, np.broadcast_to(new_job_ids, (len(employee_ids), len(new_job_ids)))])
+        scores = np.hstack([old_scores, new_scores[needed]])
+        top = top_k_rows(scores, top_n)
+        _delete_lists(db, column, employee_ids.tolist())
+        _insert_lists(db, column, employee_ids, np.take_along_axis(job_ids, top, axis=1), np.take_along_axis(scores, top, axis=1), computed_at)
+        merged += len(employee_ids)
+    return merged
+
+
+def refresh_recommendations(db: Session, job_index: Optional[JobVectorIndex] = None, employee_index: Optional[EmployeeVectorIndex] = None, top_n: int = MATERIALIZED_TOP_N, chunk_size: int = MATERIALIZE_CHUNK_SIZE, full: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    従業員ごとの上位求人の保存テーブルを更新する
+    前回の更新以降に変更された求人は全従業員と比較して各一覧に差し込み、変更された従業員は一覧を計算し直す
+    （変更が多い場合、保存件数が変わった場合、full=Trueの場合は全件を計算し直す）
+
+    :param db: データベースセッション
+    :param job_index: 求人ベクトルのインデックス（省略時は新しく読み込む）
+    :param employee_index: 従業員ベクトルのインデックス（省略時は新しく読み込む）
+    :param top_n: 従業員ごとに保存する件数
+    :param chunk_size: 一度に計算する従業員数
+    :param full: Trueの場合は全件を計算し直す
+    :return: ベクトルタイプごとの更新内容
+    """
+    # インデックスより先に変更IDを取得する（間に変更があっても次回の更新で再度反映される）
+    job_latest = latest_change_id(db, JOB_TABLE_NAME)
+    employee_latest = latest_change_id(db, EMPLOYEE_TABLE_NAME)
+    job_index = job_index or JobVectorIndex(search_backend="exact")
+    employee_index = employee_index or EmployeeVectorIndex()
+    job_index.refresh(db)
+    employee_index.refresh(db)
+
+    results = {}
+    for column in EMPLOYEE_VECTOR_COLUMNS:
+        snapshot = _Snapshot(job_index, employee_index, column)
+        now = time.time()
+        state = db.get(RecommendationRefreshState, column)
+        result = None
+        if state is not None and state.top_n == top_n and not full:
+            changed_jobs = _changed_ids(db, JOB_TABLE_NAME, state.job_change_id, job_latest)
+            changed_employees = _changed_ids(db, EMPLOYEE_TABLE_NAME, state.employee_change_id, employee_latest)
+            if (
+                len(changed_jobs) <= max(1, len(snapshot.job_ids)) * FULL_RELOAD_RATIO
+                and len(changed_employees) <= max(1, len(snapshot.employee_ids)) * FULL_RELOAD_RATIO
+            ):
+                # 変更された求人を一覧に含んでいた従業員は、その求人の順位が下がった可能性があるため計算し直す
+                recompute = set(changed_employees)
+                for chunk in _chunks(changed_jobs, ID_CHUNK_SIZE):
+                    recompute.update(db.scalars(select(EmployeeJobRecommendation.employee_id).where(
+                        EmployeeJobRecommendation.vector_type == column,
+                        EmployeeJobRecommendation.job_post_id.in_(chunk)
+                    ).distinct()))
+                job_rows, found = lookup_positions(snapshot.job_ids, np.asarray(changed_jobs, dtype=np.int64))
+                job_rows = job_rows[found]
+                merged = _merge_new_jobs(db, column, snapshot, job_rows, recompute, top_n, chunk_size, now) if len(job_rows) else 0
+                recomputed = _recompute(db, column, snapshot, sorted(recompute), top_n, chunk_size, now) if recompute else 0
+                result = {
+                    "mode": "incremental",
+                    "changed_jobs": len(changed_jobs),
+                    "changed_employees": len(changed_employees),
+                    "merged": merged,
+                    "recomputed": recomputed
+                }
+
+        if result is None:
+            result = {"mode": "full", "recomputed": _rebuild(db, column, snapshot, top_n, chunk_size, now)}
+            if state is None:
+                state = RecommendationRefreshState(vector_type=column)
+                db.add(state)
+            state.rebuilt_at = now
+        state.job_change_id = job_latest
+        state.employee_change_id = employee_latest
+        state.top_n = top_n
+        state.refreshed_at = now
+        db.commit()
+        results[column] = result
+    return results
+
+
+def recommendation_freshness(db: Session, state: RecommendationRefreshState, employee_id: int, computed_at: float) -> Dict[str, Any]:
+    """
+    保存済みの一覧の鮮度を取得する（最終更新以降に求人または従業員本人の変更があればstale）
+
+    :param db: データベースセッション
+    :param state: ベクトルタイプの更新状態
+    :param employee_id: 従業員ID
+    :param computed_at: 一覧を計算した時刻（UNIX時間）
+    :return: source, computed_at, age_seconds, refreshed_at, stale を含む辞書
+    """
+    stale = latest_change_id(db, JOB_TABLE_NAME) > state.job_change_id or db.query(DataChangeLog.change_id).filter(
+        DataChangeLog.table_name == EMPLOYEE_TABLE_NAME,
+        DataChangeLog.change_id > state.employee_change_id,
+        DataChangeLog.row_id == employee_id
+    ).first() is not None
+    return {
+        "source": "materialized",
+        "computed_at": computed_at,
+        "age_seconds": round(time.time() - computed_at, 1),
+        "refreshed_at": state.refreshed_at,
+        "stale": stale
+    }
+
+
+def live_freshness() -> Dict[str, Any]:
+    # リクエスト時に計算した結果の鮮度
+    return {"source": "live", "computed_at": time.time(), "age_seconds": 0.0, "stale": False}
+
+
+def get_materialized_top_jobs(db: Session, employee_id: int, column: str, top_n: int, return_percentage: bool = False) -> Optional[tuple]:
+    """
+    保存済みの上位求人を取得する
+
+    :param db: データベースセッション
+    :param employee_id: 従業員ID
+    :param column: "career_info_vector" または "personality_vector"
+    :param top_n: 取得する上位の数
+    :param return_percentage: 類似度をパーセンテージで返すかどうかのフラグ
+    :return: (job_id, similarity を含む辞書のリスト, 鮮度の辞書)（保存されていない場合はNone）
+    """
+    state = db.get(RecommendationRefreshState, column)
+    if state is None or state.top_n < top_n:
+        return None
+    rows = db.execute(select(
+        EmployeeJobRecommendation.job_post_id,
+        EmployeeJobRecommendation.similarity,
+        EmployeeJobRecommendation.computed_at
+    ).where(
+        EmployeeJobRecommendation.employee_id == employee_id,
+        EmployeeJobRecommendation.vector_type == column,
+        EmployeeJobRecommendation.rank < top_n
+    ).order_by(EmployeeJobRecommendation.rank)).all()
+    if not rows:
+        return None
+    jobs = [
+        {'job_id': row.job_post_id, 'similarity': round(row.similarity * 100, 2) if return_percentage else row.similarity}
+        for row in rows
+    ]
+    return jobs, recommendation_freshness(db, state, employee_id, rows[0].computed_at)
+
+
+def has_materialized_recommendations(db: Session) -> bool:
+    # 一度でも全件計算を行っていれば、以降の変更は差分で反映する
+    return db.query(RecommendationRefreshState.vector_type).first() is not None
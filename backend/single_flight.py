@@ -0,0 +1,56 @@
+# single_flight.py
+import asyncio
+import functools
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+# 処理の完了後も結果を共有し続ける秒数（0の場合は実行中の間のみ共有する）
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "2"))
+
+
+class SingleFlight:
+    """同じキーの処理が実行中（または完了直後）であれば、新たに実行せずその結果を共有する"""
+
+    def __init__(self, window_seconds: float = COALESCE_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        キーに対応する処理の結果を取得する（同じキーの処理がなければfactoryで開始する）
+
+        :param key: 同一の処理とみなすキー
+        :param factory: 処理のコルーチンを作成する関数
+        :return: 処理の結果（例外は待っているすべての呼び出し元に送られ、共有期間には残らない）
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            self.started += 1
+            flight = asyncio.ensure_future(factory())
+            self._flights[key] = flight
+            flight.add_done_callback(functools.partial(self._finished, key))
+        else:
+            self.coalesced += 1
+        # 待っている側のリクエストがキャンセルされても、共有している処理は止めない
+        return await asyncio.shield(flight)
+
+    def _finished(self, key: Hashable, flight: asyncio.Future) -> None:
+        if flight.cancelled() or flight.exception() is not None or self.window_seconds <= 0:
+            self._forget(key, flight)
+        else:
+            asyncio.get_running_loop().call_later(self.window_seconds, self._forget, key, flight)
+
+    def _forget(self, key: Hashable, flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, float]:
+        total = self.started + self.coalesced
+        return {
+            "hits": self.coalesced,
+            "misses": self.started,
+            "hit_rate": round(self.coalesced / total, 4) if total else 0.0,
+            "entries": len(self._flights)
+        }
@@ -0,0 +1,150 @@
+# skill_index.py
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy.orm import Session
+from models import EmployeeSkill, RequiredSkill
+from vector_index import latest_change_id, lookup_positions
+
+if TYPE_CHECKING:
+    # scipyの読み込みは時間がかかるため、実行時は行列を作る時点で読み込む
+    from scipy import sparse
+
+
+class JobSkillIndex:
+    """求人の必須スキルを スキル×求人 の疎行列として常駐させるインデックス"""
+
+    TABLE_NAME = RequiredSkill.__tablename__
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (スキルID（昇順）, 組ごとの求人ID, 組ごとのスキル列番号, 組ごとの重み)
+        self._snapshot = self._build_snapshot(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        # 求人ベクトルのスナップショットの求人順に並べ替えた行列のキャッシュ
+        self._aligned: Optional[tuple] = None
+        self.generation: Optional[int] = None
+
+    @staticmethod
+    def _build_snapshot(job_ids: np.ndarray, skill_ids: np.ndarray) -> tuple:
+        # 同じ求人・スキルの重複を除き、求人ごとの必須スキル数の逆数を重みにする（一致率が0〜1になる）
+        pairs = np.unique(np.column_stack([job_ids, skill_ids]), axis=0) if len(job_ids) else np.empty((0, 2), dtype=np.int64)
+        pair_jobs, pair_skills = pairs[:, 0], pairs[:, 1]
+        skill_vocabulary, skill_columns = np.unique(pair_skills, return_inverse=True)
+        _, job_inverse, job_counts = np.unique(pair_jobs, return_inverse=True, return_counts=True)
+        weights = (1.0 / job_counts[job_inverse]).astype(np.float32)
+        return skill_vocabulary, pair_jobs, skill_columns.reshape(-1), weights
+
+    @classmethod
+    def from_pairs(cls, job_ids: Sequence[int], skill_ids: Sequence[int]) -> "JobSkillIndex":
+        """
+        求人IDとスキルIDの組からインデックスを作成する（DBとは同期しない）
+
+        :param job_ids: 求人IDのリスト
+        :param skill_ids: job_idsと同じ長さのスキルIDのリスト
+        :return: JobSkillIndex
+        """
+        index = cls()
+        index._snapshot = cls._build_snapshot(np.asarray(job_ids, dtype=np.int64), np.asarray(skill_ids, dtype=np.int64))
+        return index
+
+    @property
+    def n_skills(self) -> int:
+        return len(self._snapshot[0])
+
+    def refresh(self, db: Session) -> bool:
+        """
+        required_skillの変更を検知した場合のみ読み込み直す
+
+        :param db: データベースセッション
+        :return: 更新した場合True
+        """
+        latest = latest_change_id(db, self.TABLE_NAME)
+        if latest == self.generation:
+            return False
+        with self._lock:
+            if latest == self.generation:
+                return False
+            rows = db.query(RequiredSkill.job_post_id, RequiredSkill.skill_id).all()
+            job_ids = np.fromiter((row.job_post_id for row in rows), dtype=np.int64, count=len(rows))
+            skill_ids = np.fromiter((row.skill_id for row in rows), dtype=np.int64, count=len(rows))
+            self._snapshot = self._build_snapshot(job_ids, skill_ids)
+            self._aligned = None
+            self.generation = latest
+        print(f"Job skill index loaded: {len(rows)} required skills")
+        return True
+
+    def job_matrix(self, job_ids: np.ndarray) -> "sparse.csr_matrix":
+        """
+        指定した求人の並び順に列を揃えた スキル×求人 の疎行列を取得する
+
+        :param job_ids: 列の順序とする求人IDの配列（求人ベクトルインデックスのjob_ids）
+        :return: 値が「1 / 求人の必須スキル数」の疎行列
+        """
+        snapshot = self._snapshot
+        aligned = self._aligned
+        if aligned is not None and aligned[0] is snapshot and aligned[1] is job_ids:
+            return aligned[2]
+
+        from scipy import sparse
+
+        skill_vocabulary, pair_jobs, skill_columns, weights = snapshot
+        # 求人ベクトルのない求人の必須スキルは除く
+        columns, valid = lookup_positions(job_ids, pair_jobs)
+        matrix = sparse.csr_matrix(
+            (weights[valid], (skill_columns[valid], columns[valid])),
+            shape=(len(skill_vocabulary), len(job_ids)),
+            dtype=np.float32
+        )
+        self._aligned = (snapshot, job_ids, matrix)
+        return matrix
+
+    def employee_matrix(self, skill_id_lists: List[Sequence[int]]) -> "sparse.csr_matrix":
+        """
+        従業員ごとの保有スキルを 従業員×スキル の疎行列にする（どの求人にも必要とされないスキルは除く）
+
+        :param skill_id_lists: 従業員ごとのスキルIDのリスト
+        :return: 値が1の疎行列
+        """
+        from scipy import sparse
+
+        skill_vocabulary = self._snapshot[0]
+        rows = np.repeat(np.arange(len(skill_id_lists)), [len(skill_ids) for skill_ids in skill_id_lists])
+        skill_ids = np.fromiter((skill_id for skill_ids in skill_id_lists for skill_id in skill_ids), dtype=np.int64, count=len(rows))
+        columns, valid = lookup_positions(skill_vocabulary, skill_ids)
+        matrix = sparse.csr_matrix(
+            (np.ones(int(valid.sum()), dtype=np.float32), (rows[valid], columns[valid])),
+            shape=(len(skill_id_lists), len(skill_vocabulary))
+        )
+        # 同じスキルが重複して登録されていても1として数える
+        matrix.data = np.minimum(matrix.data, 1)
+        return matrix
+
+
+def get_employee_skill_ids(db: Session, employee_ids: List[int]) -> Dict[int, List[int]]:
+    """
+    従業員ごとの保有スキルIDを取得する
+
+    :param db: データベースセッション
+    :param employee_ids: 従業員IDのリスト
+    :return: 従業員IDをキー、スキルIDのリストを値とする辞書
+    """
+    result: Dict[int, List[int]] = {employee_id: [] for employee_id in employee_ids}
+    rows = db.query(EmployeeSkill.employee_id, EmployeeSkill.skill_id).filter(EmployeeSkill.employee_id.in_(employee_ids)).all()
+    for row in rows:
+        result[row.employee_id].append(row.skill_id)
+    return result
+
+
+# プロセス全体で共有する求人スキルインデックス
+job_skill_index = JobSkillIndex()
+
+
+def get_job_skill_index(db: Session) -> JobSkillIndex:
+    """
+    最新の状態に同期した共有インデックスを取得する
+
+    :param db: データベースセッション
+    :return: JobSkillIndex
+    """
+    job_skill_index.refresh(db)
+    return job_skill_index
@@ -0,0 +1,28 @@
+# tests/conftest.py
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# モジュールの読み込み時に作られるクライアントやエンジンが外部に接続しないようにする
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import models  # noqa: E402
+
+
+@pytest.fixture
+def engine():
+    # 接続を1つに固定し、インメモリDBをセッション間で共有する
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
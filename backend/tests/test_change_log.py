@@ -0,0 +1,48 @@
+# tests/test_change_log.py
+import numpy as np
+from sqlalchemy import func
+import models
+from db_control.compact_change_log import compact_change_log
+from recommendation_store import _changed_ids
+from vector_index import latest_change_id
+
+
+def update_vectors(db, job_ids, value: float) -> None:
+    for job_id in job_ids:
+        row = db.query(models.JobPostVector).filter(models.JobPostVector.job_post_id == job_id).first()
+        row.vector = np.full(4, value, dtype=np.float32)
+    db.commit()
+
+
+def snapshot(db, watermarks):
+    # 利用側が参照する値: テーブルの最新の変更ID、行ごとの最新の変更ID、ある変更ID以降に変更された行
+    per_row = dict(db.query(models.DataChangeLog.row_id, func.max(models.DataChangeLog.change_id)).filter(
+        models.DataChangeLog.table_name == "job_post_vectors"
+    ).group_by(models.DataChangeLog.row_id).all())
+    latest = latest_change_id(db, "job_post_vectors")
+    changed = {since: sorted(_changed_ids(db, "job_post_vectors", since, latest)) for since in watermarks}
+    return latest, per_row, changed
+
+
+def test_compaction_keeps_latest_change_per_row(db):
+    db.add_all(models.JobPostVector(job_post_id=job_id, vector=np.zeros(4, dtype=np.float32)) for job_id in range(1, 6))
+    db.commit()
+    for value in range(1, 4):
+        update_vectors(db, [1, 2], value)
+    update_vectors(db, [3], 9)
+    watermarks = range(0, latest_change_id(db, "job_post_vectors") + 1)
+    before = snapshot(db, watermarks)
+    total = db.query(models.DataChangeLog).count()
+
+    deleted = compact_change_log(db, batch_size=3)
+
+    assert deleted == total - 5
+    assert db.query(models.DataChangeLog).count() == 5
+    assert snapshot(db, watermarks) == before
+    # 最新の行は残るため、変更IDは再利用されない
+    update_vectors(db, [4], 1)
+    assert latest_change_id(db, "job_post_vectors") == before[0] + 1
+
+
+def test_compaction_of_empty_log(db):
+    assert compact_change_log(db) == 0
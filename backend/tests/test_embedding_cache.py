@@ -0,0 +1,61 @@
+import numpy as np
+from embedding_cache import EmbeddingCache, fake_embedding
+from vector_codec import encode_vector
+
+MODEL = "text-embedding-3-small"
+DIM = 8
+# エンコード後のベクトル1件あたりのバイト数
+VECTOR_BYTES = len(encode_vector(np.zeros(DIM, dtype=np.float32)))
+
+
+def embed_fn(calls):
+    def fn(texts, model):
+        calls.append(list(texts))
+        return fake_embedding(texts, model, dim=DIM)
+    return fn
+
+
+def test_hit_and_miss(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"))
+    calls = []
+    first = cache.embed(["a", "b"], MODEL, embed_fn(calls))
+    second = cache.embed(["b", "c"], MODEL, embed_fn(calls))
+    assert calls == [["a", "b"], ["c"]]
+    np.testing.assert_allclose(first[1], second[0])
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+def test_get_many_keeps_input_order(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"))
+    texts = ["x", "y", "z"]
+    cache.put_many(MODEL, texts, fake_embedding(texts, MODEL, dim=DIM))
+    results = cache.get_many(MODEL, ["z", "missing", "x", "z"])
+    expected = fake_embedding(["z", "x"], MODEL, dim=DIM)
+    assert results[1] is None
+    np.testing.assert_allclose(results[0], expected[0])
+    np.testing.assert_allclose(results[2], expected[1])
+    np.testing.assert_allclose(results[3], expected[0])
+
+
+def test_evicts_least_recently_used_when_over_limit(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=VECTOR_BYTES * 4)
+    for text in ["a", "b", "c", "d"]:
+        cache.put_many(MODEL, [text], fake_embedding([text], MODEL, dim=DIM))
+    cache.get_many(MODEL, ["a"])
+    # 置き換えでは合計サイズが増えない
+    cache.put_many(MODEL, ["b"], fake_embedding(["b"], MODEL, dim=DIM))
+    assert cache.stats()["bytes"] == VECTOR_BYTES * 4
+    cache.put_many(MODEL, ["e"], fake_embedding(["e"], MODEL, dim=DIM))
+    # 上限の9割まで最終アクセスが古いものから削除される
+    remaining = [text for text, vector in zip("abcde", cache.get_many(MODEL, list("abcde"))) if vector is not None]
+    assert remaining == ["a", "b", "e"]
+    assert cache.stats()["bytes"] == VECTOR_BYTES * 3
+
+
+def test_total_is_loaded_from_existing_file(tmp_path):
+    path = str(tmp_path / "cache.db")
+    EmbeddingCache(path).put_many(MODEL, ["a", "b"], fake_embedding(["a", "b"], MODEL, dim=DIM))
+    cache = EmbeddingCache(path)
+    cache.get_many(MODEL, ["a"])
+    assert cache.stats()["bytes"] == VECTOR_BYTES * 2
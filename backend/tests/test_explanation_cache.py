@@ -0,0 +1,31 @@
+# tests/test_explanation_cache.py
+import asyncio
+import time
+import models
+from explanation_cache import ExplanationCache
+
+
+def test_async_round_trip_through_db(db):
+    async def run():
+        await ExplanationCache().set_async(db, "key", "推薦文")
+        # メモリにない別のインスタンスはDBから読み込む
+        cache = ExplanationCache()
+        assert await cache.get_async(db, "key") == "推薦文"
+        assert await cache.get_async(db, "key") == "推薦文"
+        assert await cache.get_async(db, "missing") is None
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["db_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_set_purges_expired_rows(db):
+    now = time.time()
+    db.add(models.ExplanationCacheEntry(cache_key="expired", explanation="古い推薦文", created_at=now - 20, expires_at=now - 10))
+    db.commit()
+
+    ExplanationCache(purge_rate=0).set(db, "first", "推薦文")
+    assert db.get(models.ExplanationCacheEntry, "expired") is not None
+    ExplanationCache(purge_rate=1).set(db, "second", "推薦文")
+    assert db.get(models.ExplanationCacheEntry, "expired") is None
+    assert db.get(models.ExplanationCacheEntry, "first") is not None
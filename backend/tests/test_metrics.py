@@ -0,0 +1,23 @@
+# tests/test_metrics.py
+import asyncio
+import anyio
+import metrics
+
+
+def test_cancelled_finish_releases_profiler(monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILE_SLOW_REQUEST_MS", 1.0)
+    monkeypatch.setattr(metrics, "PROFILE_SAMPLE_RATE", 1.0)
+
+    async def run():
+        profiler = metrics.start_profiler()
+        assert profiler is not None
+        assert metrics.start_profiler() is None
+        # クライアントの切断などでキャンセル済みのスコープでは、スレッドで保存する前にキャンセルされる
+        with anyio.CancelScope() as scope:
+            scope.cancel()
+            await metrics.finish_profiler(profiler, 0.0, "GET /")
+
+    asyncio.run(run())
+    profiler = metrics.start_profiler()
+    assert profiler is not None
+    profiler.stop()
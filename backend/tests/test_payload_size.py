@@ -0,0 +1,93 @@
+# tests/test_payload_size.py
+import datetime
+import numpy as np
+import orjson
+import pytest
+import main
+import models
+from benchmarks.payload_size import MAX_PROMPT_TOKENS, MAX_RESPONSE_BYTES, count_tokens
+from principal_cache import Principal
+from utils import DEFAULT_JOB_FIELDS, JOB_RESPONSE_FIELDS, _explanation_key, build_recommendation_messages
+from vector_index import JobVectorIndex
+
+DIM = 1536
+N_JOBS = 20
+# プロンプトでは切り詰められる長さのテキスト
+LONG_TEXT = "長い職務経歴。" * 2000
+JOB_DETAIL = "求人の詳細。" * 25
+
+
+@pytest.fixture
+def recommendation_db(db, monkeypatch):
+    rng = np.random.default_rng(0)
+    db.add(models.Department(department_id=1, department_name="開発部"))
+    db.add(models.Grade(grade_id=1, grade_name="G1"))
+    db.add_all(models.SkillList(skill_id=skill_id, skill_name=f"スキル{skill_id}") for skill_id in range(1, 4))
+    db.add(models.Employee(
+        employee_id=1,
+        employee_name="employee1",
+        birthdate=datetime.date(1990, 1, 1),
+        hire_date=datetime.date(2015, 4, 1),
+        career_info_detail=LONG_TEXT,
+        personality_detail=LONG_TEXT,
+        career_info_vector=rng.standard_normal(DIM).astype(np.float32),
+        personality_vector=rng.standard_normal(DIM).astype(np.float32)
+    ))
+    db.add(models.EmployeeGrade(employee_id=1, grade=1))
+    db.add(models.DepartmentMember(employee_id=1, department_id=1))
+    db.add(models.Spi(employee_id=1, extraversion=50, openness=70))
+    db.add_all(models.EmployeeSkill(employee_id=1, skill_id=skill_id) for skill_id in (1, 2))
+    for job_id in range(1, N_JOBS + 1):
+        db.add(models.JobPost(job_post_id=job_id, department_id=1, job_title=f"求人{job_id}", job_detail=JOB_DETAIL))
+        db.add(models.JobPostVector(job_post_id=job_id, vector=rng.standard_normal(DIM).astype(np.float32)))
+    db.commit()
+    # 他のテストのDBを読み込んだ共有インデックスを使わないようにする
+    index = JobVectorIndex(search_backend="exact", snapshot_dir=None)
+
+    def get_job_vector_index(session):
+        index.refresh(session)
+        return index
+
+    monkeypatch.setattr(main, "get_job_vector_index", get_job_vector_index)
+    return db
+
+
+def prepare(db, vector_type: str, fields=DEFAULT_JOB_FIELDS):
+    return main.prepare_job_recommendations(db, Principal(1, "employee1"), vector_type, fields)
+
+
+@pytest.mark.parametrize("vector_type", ["career", "personality", "hybrid"])
+def test_response_and_prompt_stay_bounded(recommendation_db, vector_type):
+    prepared, top_jobs, _, _ = prepare(recommendation_db, vector_type)
+
+    body = orjson.dumps({"recommendations": {}, "top_jobs": top_jobs}, option=orjson.OPT_SERIALIZE_NUMPY)
+    assert all("vector" not in job for jobs in top_jobs.values() for job in jobs)
+    assert len(body) <= MAX_RESPONSE_BYTES
+
+    for vec_type, prepared_data in prepared.items():
+        # ベクトルはハッシュ値のみを保持し、プロンプトには含めない
+        assert set(prepared_data) == {"employee_info", "employee_vector_hash", "top_jobs"}
+        prompt = "".join(message["content"] for message in build_recommendation_messages(prepared_data, vec_type))
+        assert count_tokens(prompt)["tokens"] <= MAX_PROMPT_TOKENS
+
+
+def test_vector_is_returned_only_when_requested(recommendation_db):
+    _, top_jobs, _, _ = prepare(recommendation_db, "career", JOB_RESPONSE_FIELDS)
+    assert all(len(job["vector"]) == DIM for job in top_jobs["career_info_vector"])
+
+
+def test_explanation_key_changes_with_prompt_features(recommendation_db):
+    prepared, _, generation, _ = prepare(recommendation_db, "personality")
+    before = _explanation_key(prepared["personality_vector"], "personality_vector", generation)
+
+    # ベクトルが変わらない変更（スキル・等級名・SPI）も別のキーになる
+    recommendation_db.add(models.EmployeeSkill(employee_id=1, skill_id=3))
+    recommendation_db.commit()
+    prepared, _, _, _ = prepare(recommendation_db, "personality")
+    after_skill = _explanation_key(prepared["personality_vector"], "personality_vector", generation)
+    assert after_skill != before
+
+    recommendation_db.get(models.Spi, 1).openness = 10
+    recommendation_db.commit()
+    prepared, _, _, _ = prepare(recommendation_db, "personality")
+    assert _explanation_key(prepared["personality_vector"], "personality_vector", generation) not in (before, after_skill)
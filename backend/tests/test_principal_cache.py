@@ -0,0 +1,42 @@
+# tests/test_principal_cache.py
+import datetime
+from sqlalchemy import text
+import models
+from principal_cache import Principal, PrincipalCache
+
+
+def add_employee(db, employee_id: int) -> None:
+    db.add(models.Employee(
+        employee_id=employee_id,
+        employee_name=f"employee{employee_id}",
+        birthdate=datetime.date(1990, 1, 1),
+        hire_date=datetime.date(2015, 4, 1)
+    ))
+    db.commit()
+
+
+def test_invalidates_changes_made_outside_the_orm(db):
+    add_employee(db, 1)
+    add_employee(db, 2)
+    cache = PrincipalCache(check_seconds=0)
+    assert cache.get(db, 1) == Principal(1, "employee1")
+    assert cache.get(db, 2) == Principal(2, "employee2")
+
+    # ORMを経由しない更新・削除も変更ログから反映される
+    db.execute(text("UPDATE employee SET employee_name = 'renamed' WHERE employee_id = 1"))
+    db.execute(text("DELETE FROM employee WHERE employee_id = 2"))
+    db.commit()
+
+    assert cache.get(db, 1) == Principal(1, "renamed")
+    assert cache.get(db, 2) is None
+
+
+def test_serves_from_cache_between_checks(db):
+    add_employee(db, 1)
+    cache = PrincipalCache(check_seconds=3600)
+    cache.get(db, 1)
+    db.execute(text("UPDATE employee SET employee_name = 'renamed' WHERE employee_id = 1"))
+    db.commit()
+
+    assert cache.get(db, 1) == Principal(1, "employee1")
+    assert cache.stats()["hits"] == 1
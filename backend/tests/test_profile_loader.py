@@ -0,0 +1,91 @@
+# tests/test_profile_loader.py
+import datetime
+from contextlib import contextmanager
+from typing import Iterator, List
+import pytest
+from sqlalchemy import event
+import models
+from utils import load_employee_profile, load_employee_profiles
+
+
+def add_employee(db, employee_id: int, n_skills: int, n_evaluations: int) -> None:
+    db.add(models.Employee(
+        employee_id=employee_id,
+        employee_name=f"employee{employee_id}",
+        birthdate=datetime.date(1990, 1, 1),
+        hire_date=datetime.date(2015, 4, 1),
+        career_info_detail="経歴",
+        personality_detail="性格"
+    ))
+    db.add(models.EmployeeGrade(employee_id=employee_id, grade=1))
+    db.add(models.DepartmentMember(employee_id=employee_id, department_id=1))
+    db.add(models.Spi(employee_id=employee_id, extraversion=50))
+    db.add_all(models.EmployeeSkill(employee_id=employee_id, skill_id=skill_id) for skill_id in range(1, n_skills + 1))
+    db.add_all(
+        models.EvaluationHistory(employee_id=employee_id, evaluation_year=2000 + year, evaluation="A")
+        for year in range(n_evaluations)
+    )
+
+
+@pytest.fixture
+def profiles(db):
+    db.add(models.Department(department_id=1, department_name="開発部"))
+    db.add(models.Grade(grade_id=1, grade_name="G1"))
+    db.add_all(models.SkillList(skill_id=skill_id, skill_name=f"スキル{skill_id}") for skill_id in range(1, 13))
+    # (従業員ID, スキル数, 評価数)
+    for employee_id, n_skills, n_evaluations in ((1, 2, 1), (2, 12, 1), (3, 2, 21), (4, 12, 21)):
+        add_employee(db, employee_id, n_skills, n_evaluations)
+    db.commit()
+    return db
+
+
+@contextmanager
+def count_queries(engine) -> Iterator[List[str]]:
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def load_and_count(engine, db, load) -> int:
+    # 関連がセッションに残っていると読み込みが省略されるため、毎回空の状態から読み込む
+    db.expunge_all()
+    with count_queries(engine) as statements:
+        employees = load()
+        for employee in employees:
+            # 読み込み済みでなければここで遅延読み込みのクエリが発生する
+            [skill.skill.skill_name for skill in employee.skills]
+            [evaluation.evaluation for evaluation in employee.evaluations]
+            [grade.grade_info.grade_name for grade in employee.grades]
+            [member.department.department_name for member in employee.departments]
+            employee.spi
+    return len(statements)
+
+
+@pytest.mark.parametrize("small, large", [(1, 2), (1, 3), (1, 4)])
+def test_load_employee_profile_query_count_is_constant(engine, profiles, small, large):
+    # 2件と12件のスキル、1件と21件の評価で同じクエリ数になる
+    small_count = load_and_count(engine, profiles, lambda: [load_employee_profile(profiles, small)])
+    large_count = load_and_count(engine, profiles, lambda: [load_employee_profile(profiles, large)])
+    assert small_count == large_count
+
+
+def test_load_employee_profiles_query_count_is_constant(engine, profiles):
+    single = load_and_count(engine, profiles, lambda: load_employee_profiles(profiles, [1]))
+    several = load_and_count(engine, profiles, lambda: load_employee_profiles(profiles, [2, 3, 4]))
+    everyone = load_and_count(engine, profiles, lambda: load_employee_profiles(profiles))
+    assert single == several == everyone
+
+
+def test_load_employee_profile_loads_relations(profiles):
+    employee = load_employee_profile(profiles, 4)
+    assert len(employee.skills) == 12
+    assert len(employee.evaluations) == 21
+    assert employee.spi.extraversion == 50
+    assert load_employee_profile(profiles, 99) is None
@@ -0,0 +1,124 @@
+# tests/test_recommendation_jobs.py
+import asyncio
+import sqlite3
+import time
+import pytest
+from principal_cache import Principal
+from recommendation_jobs import COMPLETED, QUEUED, RUNNING, JobStore, RecommendationJob, RecommendationJobQueue
+
+PRINCIPAL = Principal(1, "employee1")
+REQUEST = {"vector_type": "career", "fields": ["job_id"], "weights": None}
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def insert_job(store: JobStore, status: str = RUNNING) -> RecommendationJob:
+    job = RecommendationJob(PRINCIPAL, REQUEST)
+    job.status = status
+    store.insert(job)
+    return job
+
+
+def test_live_lease_is_not_claimed(store_path):
+    first = JobStore(store_path, "first", lease_seconds=60)
+    second = JobStore(store_path, "second", lease_seconds=60)
+    insert_job(first)
+    insert_job(first, QUEUED)
+    assert second.claim_expired() == []
+
+
+def test_heartbeat_keeps_lease(store_path):
+    first = JobStore(store_path, "first", lease_seconds=0.5)
+    second = JobStore(store_path, "second", lease_seconds=0.5)
+    insert_job(first)
+    time.sleep(0.3)
+    assert first.heartbeat() == 1
+    # 延長しなければ切れている時刻
+    time.sleep(0.3)
+    assert second.claim_expired() == []
+
+
+def test_expired_lease_is_claimed_once_and_fences_old_owner(store_path):
+    first = JobStore(store_path, "first", lease_seconds=0.05)
+    second = JobStore(store_path, "second", lease_seconds=60)
+    third = JobStore(store_path, "third", lease_seconds=60)
+    job = insert_job(first)
+    time.sleep(0.1)
+
+    assert [claimed.job_id for claimed in second.claim_expired()] == [job.job_id]
+    assert third.claim_expired() == []
+    # 引き取られた後の元のプロセスの書き込みは反映されない
+    assert not first.save(job.job_id, COMPLETED, job.to_record(), time.time())
+    assert second.save(job.job_id, RUNNING, job.to_record(), None)
+    assert second.load(job.job_id).status == RUNNING
+
+
+def test_release_lets_next_process_claim_immediately(store_path):
+    first = JobStore(store_path, "first", lease_seconds=60)
+    job = insert_job(first)
+    first.release()
+    assert [claimed.job_id for claimed in JobStore(store_path, "second").claim_expired()] == [job.job_id]
+
+
+def test_store_without_lease_columns_is_migrated(store_path):
+    connection = sqlite3.connect(store_path)
+    connection.execute(
+        "CREATE TABLE recommendation_jobs (job_id TEXT PRIMARY KEY, employee_id INTEGER NOT NULL, owner TEXT NOT NULL, "
+        "status TEXT NOT NULL, record BLOB NOT NULL, finished_at REAL)"
+    )
+    job = RecommendationJob(PRINCIPAL, REQUEST)
+    connection.execute(
+        "INSERT INTO recommendation_jobs VALUES (?, ?, ?, ?, ?, ?)", (job.job_id, 1, "old", QUEUED, job.to_record(), None)
+    )
+    connection.commit()
+    connection.close()
+    # リースのない以前の行は切れているとみなす
+    assert [claimed.job_id for claimed in JobStore(store_path, "new").claim_expired()] == [job.job_id]
+
+
+def test_queue_persists_progress_and_result(store_path):
+    async def runner(job):
+        job.update({"top_jobs": {"career_info_vector": [{"job_id": 1}]}})
+        await asyncio.sleep(0.01)
+        return {"recommendations": {"career_info_vector": "推薦文"}}
+
+    async def run():
+        queue = RecommendationJobQueue(runner, workers=1, store_path=store_path, lease_seconds=60)
+        await queue.start()
+        job = await queue.submit(PRINCIPAL, REQUEST, key="same")
+        assert (await queue.submit(PRINCIPAL, REQUEST, key="same")) is job
+        while (await queue.get(job.job_id, 1))["status"] != COMPLETED:
+            await asyncio.sleep(0.01)
+        assert await queue.get(job.job_id, 2) is None
+        await queue.stop()
+        return job
+
+    job = asyncio.run(run())
+    stored = JobStore(store_path, "reader").load(job.job_id)
+    assert stored.status == COMPLETED
+    assert stored.result["recommendations"] == {"career_info_vector": "推薦文"}
+    assert stored.result["top_jobs"] == {"career_info_vector": [{"job_id": 1}]}
+
+
+def test_queue_resumes_jobs_of_stopped_process(store_path):
+    finished = []
+
+    async def runner(job):
+        finished.append(job.job_id)
+        return {}
+
+    async def run():
+        queue = RecommendationJobQueue(runner, workers=1, store_path=store_path, lease_seconds=60)
+        await queue.start()
+        while finished != [job.job_id]:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    old = JobStore(store_path, "old", lease_seconds=60)
+    job = insert_job(old, QUEUED)
+    old.release()
+    asyncio.run(run())
+    assert JobStore(store_path, "reader").load(job.job_id).status == COMPLETED
@@ -0,0 +1,77 @@
+# tests/test_recommendation_stream.py
+import asyncio
+import httpx
+import pytest
+from sqlalchemy.orm import sessionmaker
+import main
+from metrics import HTTP_REQUEST_SECONDS
+from database import get_db
+from principal_cache import Principal
+from recommendation_store import live_freshness
+
+
+@pytest.fixture
+def stream_app(engine, monkeypatch):
+    def prepare_job_recommendations(db, current_user, vector_type, fields, weights=None):
+        prepared = {"career_info_vector": {"employee_info": {}, "employee_vector_hash": "0", "top_jobs": [{"job_id": 1}]}}
+        return prepared, {"career_info_vector": [{"job_id": 1}]}, 1, {"career_info_vector": live_freshness()}
+
+    monkeypatch.setattr(main, "prepare_job_recommendations", prepare_job_recommendations)
+    monkeypatch.setattr(main, "SessionLocal", sessionmaker(bind=engine, autoflush=False))
+    main.app.dependency_overrides[main.get_current_user] = lambda: Principal(1, "employee1")
+    main.app.dependency_overrides[get_db] = lambda: None
+    yield monkeypatch
+    main.app.dependency_overrides.clear()
+
+
+def read_events(body: str):
+    return [block.split("\n", 1)[0].removeprefix("event: ") for block in body.split("\n\n") if block]
+
+
+def post_stream() -> str:
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/recommendations/stream", json={"vector_type": "career"})
+            assert response.status_code == 200
+            return response.text
+
+    return asyncio.run(run())
+
+
+def test_stream_ends_with_done(stream_app):
+    async def stream_recommendations_cached(db, prepared_data, vector_type, generation):
+        for token in ("推薦", "文"):
+            yield token
+
+    stream_app.setattr(main, "stream_recommendations_cached", stream_recommendations_cached)
+    assert read_events(post_stream()) == ["top_jobs", "token", "token", "done"]
+
+
+def test_failure_mid_stream_sends_error_event(stream_app):
+    async def stream_recommendations_cached(db, prepared_data, vector_type, generation):
+        yield "推薦"
+        raise RuntimeError("database is locked")
+
+    stream_app.setattr(main, "stream_recommendations_cached", stream_recommendations_cached)
+    body = post_stream()
+    assert read_events(body) == ["top_jobs", "token", "error"]
+    assert "database is locked" in body
+
+
+def test_latency_covers_the_whole_stream(stream_app):
+    async def stream_recommendations_cached(db, prepared_data, vector_type, generation):
+        await asyncio.sleep(0.2)
+        yield "推薦"
+
+    def recorded():
+        entry = HTTP_REQUEST_SECONDS._values.get(("POST", "/recommendations/stream", "200"))
+        return (entry[1], entry[2]) if entry else (0.0, 0)
+
+    stream_app.setattr(main, "stream_recommendations_cached", stream_recommendations_cached)
+    total_before, count_before = recorded()
+    post_stream()
+    total_after, count_after = recorded()
+    # ヘッダーを返した時点ではなく、本文を送り終えた時点までを計測する
+    assert count_after == count_before + 1
+    assert total_after - total_before >= 0.2
@@ -0,0 +1,83 @@
+# tests/test_recruiter_access.py
+import asyncio
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+import auth
+import main
+import models
+from database import get_async_db
+from principal_cache import Principal
+
+RECRUITER_ID = 1
+HR_MEMBER_ID = 2
+EMPLOYEE_ID = 3
+HR_DEPARTMENT_ID = 10
+
+
+@pytest.fixture
+def async_sessions(tmp_path, monkeypatch):
+    path = tmp_path / "access.db"
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(models.Department.__table__.insert(), [
+            {"department_id": HR_DEPARTMENT_ID, "department_name": "人事部"}, {"department_id": 20, "department_name": "開発部"}
+        ])
+        connection.execute(models.DepartmentMember.__table__.insert(), [
+            {"employee_id": HR_MEMBER_ID, "department_id": HR_DEPARTMENT_ID}, {"employee_id": EMPLOYEE_ID, "department_id": 20}
+        ])
+    engine.dispose()
+    monkeypatch.setattr(auth, "RECRUITER_EMPLOYEE_IDS", frozenset({RECRUITER_ID}))
+    monkeypatch.setattr(auth, "RECRUITER_DEPARTMENT_IDS", frozenset({HR_DEPARTMENT_ID}))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    yield async_sessionmaker(async_engine, expire_on_commit=False)
+    asyncio.run(async_engine.dispose())
+
+
+def test_is_recruiter_by_employee_or_department(async_sessions):
+    async def check(employee_id):
+        async with async_sessions() as db:
+            return await auth.is_recruiter(db, employee_id)
+
+    assert asyncio.run(check(RECRUITER_ID))
+    assert asyncio.run(check(HR_MEMBER_ID))
+    assert not asyncio.run(check(EMPLOYEE_ID))
+
+
+def call(async_sessions, employee_id, method, url, **kwargs):
+    async def get_db():
+        async with async_sessions() as db:
+            yield db
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+
+    main.app.dependency_overrides[main.get_current_user] = lambda: Principal(employee_id, f"employee{employee_id}")
+    main.app.dependency_overrides[get_async_db] = get_db
+    try:
+        return asyncio.run(run())
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+def post_batch(async_sessions, employee_id, **body):
+    return call(async_sessions, employee_id, "POST", "/recommendations/batch", json={"vector_type": "career", **body})
+
+
+def test_batch_requires_recruiter(async_sessions):
+    assert post_batch(async_sessions, EMPLOYEE_ID, employee_ids=[RECRUITER_ID]).status_code == 403
+
+
+def test_batch_size_is_capped(async_sessions):
+    too_many = post_batch(async_sessions, RECRUITER_ID, employee_ids=list(range(main.BATCH_MAX_EMPLOYEES + 1)))
+    assert too_many.status_code == 400
+    too_deep = post_batch(async_sessions, RECRUITER_ID, employee_ids=[EMPLOYEE_ID], top_n=main.BATCH_MAX_TOP_N + 1)
+    assert too_deep.status_code == 400
+
+
+def test_candidates_requires_recruiter(async_sessions):
+    assert call(async_sessions, EMPLOYEE_ID, "GET", "/jobs/1/candidates").status_code == 403
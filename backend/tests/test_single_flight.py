@@ -0,0 +1,107 @@
+# tests/test_single_flight.py
+import asyncio
+import httpx
+import pytest
+from sqlalchemy.orm import sessionmaker
+import main
+import utils
+from explanation_cache import ExplanationCache
+from principal_cache import Principal
+from recommendation_store import live_freshness
+from single_flight import SingleFlight
+
+CONCURRENCY = 20
+LLM_LATENCY_SECONDS = 0.05
+
+
+def test_single_flight_runs_factory_once():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        flights = SingleFlight(window_seconds=0)
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(CONCURRENCY)))
+        return results, flights.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == ["result"] * CONCURRENCY
+    assert len(calls) == 1
+    assert (stats["misses"], stats["hits"]) == (1, CONCURRENCY - 1)
+
+
+def test_single_flight_does_not_keep_failures():
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        raise RuntimeError("upstream error")
+
+    async def run():
+        flights = SingleFlight(window_seconds=60)
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await flights.do("key", fail)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+@pytest.fixture
+def completions(engine, monkeypatch):
+    """/recommendations のベクトル検索とLLMを置き換え、chat completionの呼び出しを記録する"""
+    calls = []
+
+    def prepare_job_recommendations(db, current_user, vector_type, fields, weights=None):
+        column = utils.VECTOR_TYPE_COLUMNS[vector_type]
+        prepared = {column: {"employee_info": {"name": current_user.employee_name}, "employee_vector_hash": "0", "top_jobs": [{"job_id": 1}]}}
+        return prepared, {column: [{"job_id": 1}]}, main.shared_job_vector_index.generation, {column: live_freshness()}
+
+    async def generate_recommendations(prepared_data, vector_type):
+        calls.append(vector_type)
+        await asyncio.sleep(LLM_LATENCY_SECONDS)
+        return f"{vector_type}の推薦文"
+
+    monkeypatch.setattr(main, "prepare_job_recommendations", prepare_job_recommendations)
+    monkeypatch.setattr(main, "SessionLocal", sessionmaker(bind=engine, autoflush=False))
+    monkeypatch.setattr(main, "recommendation_flights", SingleFlight(window_seconds=60))
+    monkeypatch.setattr(main.shared_job_vector_index, "generation", 1)
+    monkeypatch.setattr(utils, "generate_recommendations", generate_recommendations)
+    monkeypatch.setattr(utils, "explanation_cache", ExplanationCache())
+    main.app.dependency_overrides[main.get_current_user] = lambda: Principal(1, "employee1")
+    yield calls
+    main.app.dependency_overrides.pop(main.get_current_user, None)
+
+
+async def post_recommendations(*vector_types):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(*(
+            client.post("/recommendations", json={"vector_type": vector_type}) for vector_type in vector_types
+        ))
+    assert all(response.status_code == 200 for response in responses)
+    return responses
+
+
+def test_concurrent_duplicate_requests_share_one_completion(completions):
+    responses = asyncio.run(post_recommendations(*["career"] * CONCURRENCY))
+    assert len(completions) == 1
+    assert len({response.content for response in responses}) == 1
+    # 共有期間内の後続のリクエストも同じ結果を使う
+    asyncio.run(post_recommendations("career"))
+    assert len(completions) == 1
+
+
+def test_different_vector_type_is_not_coalesced(completions):
+    asyncio.run(post_recommendations(*["career", "personality"] * (CONCURRENCY // 2)))
+    assert sorted(completions) == ["career_info_vector", "personality_vector"]
+
+
+def test_changed_generation_is_not_coalesced(completions, monkeypatch):
+    asyncio.run(post_recommendations("career"))
+    monkeypatch.setattr(main.shared_job_vector_index, "generation", 2)
+    asyncio.run(post_recommendations("career"))
+    assert completions == ["career_info_vector", "career_info_vector"]
@@ -1,35 +1,119 @@
 # utils.py
-from openai import OpenAI
+import asyncio
 import json
+import time
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from models import JobPost, JobPostVector, EmployeeVector, Employee, Department, SkillList, RequiredSkill
+from models import JobPost, JobPostVector, EmployeeVector, Employee, Department, SkillList, RequiredSkill, EmployeeGrade, EmployeeSkill, DepartmentMember, Spi
 import os
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
-from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload, defer
+from typing import List, Dict, Any, Optional, Union, AsyncIterator, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from vector_index import JobVectorIndex
+from skill_index import JobSkillIndex, get_employee_skill_ids
+from employee_index import EmployeeVectorIndex
+from explanation_cache import explanation_cache, make_explanation_key, prompt_hash, vector_hash
+from embedding_cache import embedding_cache, normalize_text
+from metrics import record_llm_call, timed
 
 
 # 定数
 EMBEDDING_MODEL = "text-embedding-ada-002"
 GPT_MODEL = "gpt-4o-mini"
 TOP_N_JOBS = 5
+TOP_N_CANDIDATES = 10
+BATCH_CHUNK_SIZE = 1024
+# /recommendations/batch の1回のリクエストで指定できる従業員数と上位の数
+BATCH_MAX_EMPLOYEES = int(os.getenv("BATCH_MAX_EMPLOYEES", "1000"))
+BATCH_MAX_TOP_N = int(os.getenv("BATCH_MAX_TOP_N", "100"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_ERROR_PREFIX = "Error in API call"
+
+# vector_typeと従業員ベクトルのカラム名の対応
+VECTOR_TYPE_COLUMNS = {
+    "career": "career_info_vector",
+    "personality": "personality_vector"
+}
+
+# キャリア・性格ベクトルの類似度とスキル一致率を組み合わせるvector_type
+HYBRID_VECTOR_TYPE = "hybrid"
+HYBRID_SIGNALS = ("career", "personality", "skill")
+# 例: HYBRID_WEIGHTS="career=0.4,personality=0.3,skill=0.3"
+DEFAULT_HYBRID_WEIGHTS = {
+    name: float(value)
+    for name, value in (item.split("=") for item in os.getenv("HYBRID_WEIGHTS", "career=0.4,personality=0.3,skill=0.3").split(","))
+}
+
+# レスポンスの求人に含められるフィールド（vectorはfieldsで指定した場合のみ返す、signalsはhybridの場合のみ）
+JOB_RESPONSE_FIELDS = ("job_id", "similarity", "signals", "job_title", "department_name", "job_detail", "vector")
+DEFAULT_JOB_FIELDS = tuple(field for field in JOB_RESPONSE_FIELDS if field != "vector")
+
+# プロンプトに含めるテキストの最大文字数
+PROMPT_TEXT_MAX_CHARS = 400
+SPI_TRAITS = ("extraversion", "agreebleness", "conscientiousness", "neuroticism", "openness")
 
 # 環境変数の読み込み
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class EmployeeVectorNotFound(Exception):
     """従業員ベクトルが見つからない場合の例外"""
     pass
 
-client = OpenAI()
+class JobVectorNotFound(Exception):
+    """求人ベクトルが見つからない場合の例外"""
+    pass
+
+# openaiのimportとクライアントの作成は時間がかかるため、最初に使われた時点で1回だけ行う
+_client = None
+_async_client = None
+
+def get_openai_client():
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+def get_async_openai_client():
+    global _async_client
+    if _async_client is None:
+        from openai import AsyncOpenAI
+        _async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=LLM_TIMEOUT_SECONDS)
+    return _async_client
+
+# プロセス全体で同時に実行するLLM呼び出しの上限
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+def request_embeddings(texts: List[str], model: str = EMBEDDING_MODEL) -> List[List[float]]:
+    """
+    複数のテキストを1回のAPI呼び出しでベクトル化する（キャッシュを使わない）
+    
+    :param texts: テキストのリスト
+    :param model: 埋め込みモデル名
+    :return: 入力と同じ順序のベクトルのリスト
+    """
+    response = get_openai_client().embeddings.create(input=[normalize_text(text) for text in texts], model=model)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def get_embeddings(texts: List[str], model: str = EMBEDDING_MODEL) -> List[Sequence[float]]:
+    """
+    複数のテキストをベクトル化する（埋め込みキャッシュにないテキストのみAPIを呼び出す）
+    
+    :param texts: テキストのリスト
+    :param model: 埋め込みモデル名
+    :return: 入力と同じ順序のベクトルのリスト
+    """
+    if embedding_cache is None:
+        return request_embeddings(texts, model)
+    return embedding_cache.embed(texts, model, request_embeddings)
+
 def get_embedding(text, model= EMBEDDING_MODEL):
-    text = text.replace("\n", " ")
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+    return np.asarray(get_embeddings([text], model)[0]).tolist()
 
-def get_employee_vectors(db: Session, employee_id: int) -> Dict[str, List[float]]:
+@timed("employee_vectors")
+def get_employee_vectors(db: Session, employee_id: int) -> Dict[str, np.ndarray]:
     """
     従業員のcareer_info_vectorとpersonality_vectorを取得する
     
@@ -38,54 +122,165 @@ def get_employee_vectors(db: Session, employee_id: int) -> Dict[str, List[float]
     :return: キャリア情報ベクトルと性格ベクトルの辞書
     :raises EmployeeVectorNotFound: 従業員ベクトルが見つからない場合
     """
-    employee = db.query(Employee).filter(Employee.employee_id == employee_id).first()
-    if employee is None or employee.career_info_vector is None or employee.personality_vector is None:
+    row = db.query(Employee.career_info_vector, Employee.personality_vector).filter(Employee.employee_id == employee_id).first()
+    if row is None or row.career_info_vector is None or row.personality_vector is None:
         raise EmployeeVectorNotFound(f"Employee vectors not found for id: {employee_id}")
     return {
-        "career_info_vector": json.loads(employee.career_info_vector),
-        "personality_vector": json.loads(employee.personality_vector)
+        "career_info_vector": row.career_info_vector,
+        "personality_vector": row.personality_vector
     }
 
-def get_all_job_post_vectors(db: Session) -> Dict[int, List[float]]:
+def get_all_job_post_vectors(db: Session) -> Dict[int, np.ndarray]:
     """
     全ての求人ポストのベクトルを取得する
     
     :param db: データベースセッション
     :return: 求人IDをキー、ベクトルを値とする辞書
     """
-    job_post_vectors = db.query(JobPostVector).all()
-    return {jpv.job_post_id: json.loads(jpv.vector) for jpv in job_post_vectors}
+    job_post_vectors = db.query(JobPostVector.job_post_id, JobPostVector.vector).all()
+    return {jpv.job_post_id: jpv.vector for jpv in job_post_vectors}
 
-def get_top_similar_jobs_for_vectors(employee_vectors: Dict[str, List[float]], job_vectors: Dict[int, List[float]], top_n: int = TOP_N_JOBS, return_percentage: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+@timed("vector_search")
+def get_top_similar_jobs_for_vectors(employee_vectors: Dict[str, List[float]], job_vectors: Union[JobVectorIndex, Dict[int, List[float]]], top_n: int = TOP_N_JOBS, return_percentage: bool = False, include_vector: bool = False) -> Dict[str, List[Dict[str, Any]]]:
     """
     キャリア情報ベクトルと性格ベクトルそれぞれについて、最も類似度の高い求人IDとオプションでパーセンテージを取得する
     
     :param employee_vectors: 従業員のキャリア情報ベクトルと性格ベクトルの辞書
-    :param job_vectors: 求人ベクトルの辞書
+    :param job_vectors: 求人ベクトルのインデックス（または求人ベクトルの辞書）
     :param top_n: 取得する上位の数
     :param return_percentage: 類似度をパーセンテージで返すかどうかのフラグ
+    :param include_vector: 求人ベクトルを結果に含めるかどうかのフラグ
     :return: キャリア情報と性格それぞれの類似度の高い求人IDのリストとオプションで類似度パーセンテージ
     """
+    if not isinstance(job_vectors, JobVectorIndex):
+        job_vectors = JobVectorIndex.from_vectors(job_vectors)
+    return {
+        vector_type: job_vectors.search(employee_vector, top_n, return_percentage, include_vector)
+        for vector_type, employee_vector in employee_vectors.items()
+    }
+
+@timed("vector_search_batch")
+def get_top_similar_jobs_for_employees(db: Session, employee_ids: List[int], vector_type: str, job_index: JobVectorIndex, top_n: int = TOP_N_JOBS, chunk_size: int = BATCH_CHUNK_SIZE, return_percentage: bool = False, include_vector: bool = False) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    複数の従業員について、類似度の高い求人をまとめて取得する
+    従業員ベクトルをchunk_size件ずつ行列にまとめ、求人行列との行列積1回でスコアを計算する
+    
+    :param db: データベースセッション
+    :param employee_ids: 従業員IDのリスト
+    :param vector_type: "career" または "personality"
+    :param job_index: 求人ベクトルのインデックス
+    :param top_n: 取得する上位の数
+    :param chunk_size: 一度に計算する従業員数
+    :param return_percentage: 類似度をパーセンテージで返すかどうかのフラグ
+    :param include_vector: 求人ベクトルを結果に含めるかどうかのフラグ
+    :return: 従業員IDをキー、類似度の高い求人のリストを値とする辞書（ベクトルがない従業員は含まない）
+    """
+    column = getattr(Employee, VECTOR_TYPE_COLUMNS[vector_type])
     result = {}
-    for vector_type, employee_vector in employee_vectors.items():
-        job_ids = list(job_vectors.keys())
-        job_vector_array = np.array(list(job_vectors.values()))
-        similarities = cosine_similarity([employee_vector], job_vector_array)[0]
+    unique_ids = list(dict.fromkeys(employee_ids))
+    for start in range(0, len(unique_ids), chunk_size):
+        rows = db.query(Employee.employee_id, column).filter(
+            Employee.employee_id.in_(unique_ids[start:start + chunk_size]),
+            column.isnot(None)
+        ).all()
+        if not rows:
+            continue
+        vectors = np.vstack([row[1] for row in rows])
+        top_jobs = job_index.search_batch(vectors, top_n, return_percentage=return_percentage, chunk_size=chunk_size, include_vector=include_vector)
+        for row, jobs in zip(rows, top_jobs):
+            result[row.employee_id] = jobs
+    return result
 
-        if return_percentage:
-            similarities = [round(similarity * 100, 2) for similarity in similarities]
+def resolve_hybrid_weights(weights: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    hybridの重みを検証し、合計が1になるように正規化する
 
-        top_indices = np.argsort(similarities)[-top_n:][::-1]
-        result[vector_type] = [
-            {
-                'job_id': job_ids[i],
-                'similarity': similarities[i],
-                'vector': job_vectors[job_ids[i]]  # Include the vector
-            } for i in top_indices
-        ]
+    :param weights: 指標ごとの重み（Noneの場合は既定値、指定のない指標は0）
+    :return: "career", "personality", "skill" の重み
+    :raises ValueError: 不明な指標・負の重みが指定された場合、または重みの合計が0の場合
+    """
+    weights = DEFAULT_HYBRID_WEIGHTS if weights is None else weights
+    unknown = [name for name in weights if name not in HYBRID_SIGNALS]
+    if unknown:
+        raise ValueError(f"Unknown weights: {', '.join(unknown)}")
+    if any(value < 0 for value in weights.values()):
+        raise ValueError("Weights must be non-negative")
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Weights must not all be zero")
+    return {name: weights.get(name, 0.0) / total for name in HYBRID_SIGNALS}
+
+@timed("hybrid_search")
+def get_top_hybrid_jobs_for_employees(db: Session, employee_ids: List[int], job_index: JobVectorIndex, skill_index: JobSkillIndex, weights: Dict[str, float], top_n: int = TOP_N_JOBS, chunk_size: int = BATCH_CHUNK_SIZE, return_percentage: bool = False) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    複数の従業員について、キャリア・性格ベクトルの類似度とスキル一致率の加重和で類似度の高い求人を取得する
 
+    :param db: データベースセッション
+    :param employee_ids: 従業員IDのリスト
+    :param job_index: 求人ベクトルのインデックス
+    :param skill_index: 求人の必須スキルのインデックス
+    :param weights: resolve_hybrid_weightsで正規化した重み
+    :param top_n: 取得する上位の数
+    :param chunk_size: 一度に計算する従業員数
+    :param return_percentage: 類似度をパーセンテージで返すかどうかのフラグ
+    :return: 従業員IDをキー、類似度の高い求人のリストを値とする辞書（ベクトルがない従業員は含まない）
+    """
+    dim = job_index.matrix.shape[1]
+    result = {}
+    unique_ids = list(dict.fromkeys(employee_ids))
+    for start in range(0, len(unique_ids), chunk_size):
+        rows = db.query(Employee.employee_id, Employee.career_info_vector, Employee.personality_vector).filter(
+            Employee.employee_id.in_(unique_ids[start:start + chunk_size]),
+            (Employee.career_info_vector.isnot(None)) | (Employee.personality_vector.isnot(None))
+        ).all()
+        if not rows:
+            continue
+        # 片方のベクトルがない場合はその指標を0として扱う
+        career = np.vstack([row.career_info_vector if row.career_info_vector is not None else np.zeros(dim, dtype=np.float32) for row in rows])
+        personality = np.vstack([row.personality_vector if row.personality_vector is not None else np.zeros(dim, dtype=np.float32) for row in rows])
+        skill_ids = get_employee_skill_ids(db, [row.employee_id for row in rows])
+        employee_skills = skill_index.employee_matrix([skill_ids[row.employee_id] for row in rows])
+        top_jobs = job_index.search_hybrid(career, personality, employee_skills, skill_index, weights, top_n, return_percentage, chunk_size)
+        for row, jobs in zip(rows, top_jobs):
+            result[row.employee_id] = jobs
     return result
 
+@timed("candidate_search")
+def get_top_candidates_for_job(db: Session, job_post_id: int, vector_type: str, employee_index: EmployeeVectorIndex, top_n: int = TOP_N_CANDIDATES, department_ids: Optional[List[int]] = None, grade_ids: Optional[List[int]] = None, exclude_current_department: bool = False, return_percentage: bool = False) -> List[Dict[str, Any]]:
+    """
+    求人に適合する従業員を類似度の高い順に取得する
+
+    :param db: データベースセッション
+    :param job_post_id: 求人ID
+    :param vector_type: "career" または "personality"
+    :param employee_index: 従業員ベクトルのインデックス
+    :param top_n: 取得する上位の数
+    :param department_ids: 指定した部署のいずれかに所属する従業員に絞り込む
+    :param grade_ids: 指定した等級のいずれかの従業員に絞り込む
+    :param exclude_current_department: 求人の部署に所属している従業員を除くかどうかのフラグ
+    :param return_percentage: 類似度をパーセンテージで返すかどうかのフラグ
+    :return: employee_id, employee_name, similarity を含む辞書のリスト
+    :raises JobVectorNotFound: 求人ベクトルが見つからない場合
+    """
+    job = db.query(JobPostVector.vector, JobPost.department_id).join(
+        JobPost, JobPost.job_post_id == JobPostVector.job_post_id
+    ).filter(JobPostVector.job_post_id == job_post_id, JobPostVector.vector.isnot(None)).first()
+    if job is None:
+        raise JobVectorNotFound(f"Job post vector not found for id: {job_post_id}")
+
+    candidates = employee_index.search(
+        job.vector, VECTOR_TYPE_COLUMNS[vector_type], top_n,
+        department_ids=department_ids,
+        grade_ids=grade_ids,
+        exclude_department_id=job.department_id if exclude_current_department else None,
+        return_percentage=return_percentage
+    )
+    names = dict(db.query(Employee.employee_id, Employee.employee_name).filter(
+        Employee.employee_id.in_([candidate['employee_id'] for candidate in candidates])
+    ).all())
+    return [{**candidate, 'employee_name': names.get(candidate['employee_id'])} for candidate in candidates]
+
+@timed("job_details")
 def get_job_details(db: Session, job_ids: List[int]) -> List[Dict[str, Any]]:
     """
     求人IDのリストから求人詳細と部署名を取得する
@@ -105,9 +300,6 @@ def get_job_details(db: Session, job_ids: List[int]) -> List[Dict[str, Any]]:
         JobPost.job_post_id.in_(job_ids)
     ).all()
 
-    # デバッグ用にクエリ結果をログに出力
-    print("Job details query result:", jobs)
-
     # 求人詳細に部署名を含めて返す
     return [
         {
@@ -119,34 +311,95 @@ def get_job_details(db: Session, job_ids: List[int]) -> List[Dict[str, Any]]:
         for job in jobs
     ]
 
-def prepare_recommendation_data(employee_data: Dict[str, Any], top_jobs: List[Dict[str, Any]], employee_vector: List[float]) -> Dict[str, Any]:
+def resolve_job_fields(fields: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+    """
+    レスポンスに含める求人のフィールドを決める
+
+    :param fields: 指定されたフィールドのリスト（Noneの場合はvector以外のすべて）
+    :return: フィールドのタプル
+    :raises ValueError: 不明なフィールドが指定された場合
+    """
+    if fields is None:
+        return DEFAULT_JOB_FIELDS
+    unknown = [field for field in fields if field not in JOB_RESPONSE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(fields))
+
+def project_jobs(jobs: List[Dict[str, Any]], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    求人の辞書から指定されたフィールドのみを取り出す
+
+    :param jobs: 求人の辞書のリスト
+    :param fields: 含めるフィールド
+    :return: 射影した求人の辞書のリスト
+    """
+    return [{field: job[field] for field in fields if field in job} for job in jobs]
+
+def truncate_text(text: Optional[str], max_chars: int = PROMPT_TEXT_MAX_CHARS) -> Optional[str]:
+    if text is None or len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "…"
+
+@timed("prompt_data")
+def prepare_recommendation_data(employee_data: Dict[str, Any], top_jobs: List[Dict[str, Any]], employee_vector: Sequence[float], vector_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    推薦文生成用のデータを作成する
+    ベクトルはプロンプトに含めず、キャッシュキー用のハッシュ値のみを保持する
+
+    :param employee_data: get_all_employee_dataで取得した従業員データ
+    :param top_jobs: 求人詳細を結合した上位求人のリスト
+    :param employee_vector: 検索に使った従業員ベクトル
+    :param vector_type: "career_info_vector", "personality_vector" または "hybrid"（hybridとNoneの場合は両方の特徴を含める）
+    :return: 推薦文生成用のデータ
+    """
+    employee_info = employee_data['employee_info']
+    profile = {
+        "name": employee_info['name'],
+        "skills": [skill['skill_name'] for skill in employee_data['skills']],
+        "academic_background": employee_info['academic_background'],
+        "recruitment_type": employee_info['recruitment_type'],
+        "departments": [department['department_name'] for department in employee_data['departments']],
+        "grades": [grade['grade_name'] for grade in employee_data['grades']]
+    }
+    if vector_type != "personality_vector":
+        profile["career_info"] = truncate_text(employee_info['career_info_detail'])
+    if vector_type != "career_info_vector":
+        profile["personality"] = truncate_text(employee_info['personality_detail'])
+        if employee_data['spi']:
+            profile["spi"] = {trait: employee_data['spi'].get(trait) for trait in SPI_TRAITS}
+
     return {
-        "employee_info": {
-            "name": employee_data['employee_info']['name'],  # ここを変更
-            "skills": [skill['skill_name'] for skill in employee_data['skills']],
-            "academic_background": employee_data['employee_info']['academic_background'],
-            "recruitment_type": employee_data['employee_info']['recruitment_type']
-        },
-        "employee_vector": employee_vector,
+        "employee_info": profile,
+        "employee_vector_hash": vector_hash(employee_vector),
         "top_jobs": [
             {
                 "job_id": job['job_id'],
                 "job_title": job['job_title'],
                 "department_name": job['department_name'],
-                "job_detail": job['job_detail'],
+                "job_detail": truncate_text(job['job_detail']),
                 "similarity": job['similarity'],
-                "vector": job['vector']
+                **({"signals": job['signals']} if 'signals' in job else {})
             } for job in top_jobs
         ]
     }
 
-def generate_recommendations(prepared_data: Dict[str, Any], vector_type: str) -> str:
+def build_recommendation_messages(prepared_data: Dict[str, Any], vector_type: str) -> List[Dict[str, str]]:
+    """
+    推薦文生成用のチャットメッセージを組み立てる
+    
+    :param prepared_data: prepare_recommendation_dataで作成したデータ
+    :param vector_type: "career_info_vector", "personality_vector" または "hybrid"
+    :return: チャットメッセージのリスト
+    :raises ValueError: vector_typeが不正な場合
+    """
 
-    employee_vector = json.dumps(prepared_data['employee_vector'], separators=(',', ':'))
-    job_information = json.dumps(prepared_data['top_jobs'], separators=(',', ':'))
+    # 日本語をエスケープするとトークン数が増えるため、ensure_asciiは無効にする
+    employee_profile = json.dumps(prepared_data['employee_info'], ensure_ascii=False, separators=(',', ':'))
+    job_information = json.dumps(prepared_data['top_jobs'], ensure_ascii=False, separators=(',', ':'))
 
     base_prompt = f"""
-    Employee Vector: {employee_vector}
+    Employee Profile: {employee_profile}
     Job Information: {job_information}
 
     Provide your answer in Japanese, using natural, professional language appropriate for a business setting. Your response should paint a vivid picture of how the employee would excel in each role. Use the following format EXACTLY, expressing the information in a conversational, engaging manner:
@@ -178,12 +431,12 @@ def generate_recommendations(prepared_data: Dict[str, Any], vector_type: str) ->
 
     DO NOT include any additional text, headers, or formatting outside of this exact structure. Each job recommendation should have exactly two bullet points for matching reasons.
 
-    各推奨求人について、この方の活躍が即座にイメージできるような具体的な推論を用いて説明してください。その方の強みやスキルがどのように職務に貢献するか、どのような場面で特に力を発揮するかなど、具体的なシナリオを交えて説明することで、読み手がその人物の適性を明確にイメージできるようにしてください。ただし、求人のタイトルや詳細な情報は含めず、ベクトル情報のみに基づいて推論してください。
+    各推奨求人について、この方の活躍が即座にイメージできるような具体的な推論を用いて説明してください。その方の強みやスキルがどのように職務に貢献するか、どのような場面で特に力を発揮するかなど、具体的なシナリオを交えて説明することで、読み手がその人物の適性を明確にイメージできるようにしてください。ただし、求人のタイトルや詳細な情報をそのまま書き写さず、従業員のプロフィールと求人情報の対応関係に基づいて推論してください。
     """
 
     if vector_type == "career_info_vector":
         specific_prompt = """
-        Analyze the provided employee vector and job information to suggest the 5 most suitable job matches based on the employee's career information. For each match, provide specific and detailed reasons focusing on the employee's career experiences, skills, and how they align with the job requirements.
+        Analyze the provided employee profile and job information to suggest the 5 most suitable job matches based on the employee's career information. For each match, provide specific and detailed reasons focusing on the employee's career experiences, skills, and how they align with the job requirements.
 
         Consider the following aspects in your analysis:
         - The employee's past work experiences and how they relate to the job requirements
@@ -198,7 +451,7 @@ def generate_recommendations(prepared_data: Dict[str, Any], vector_type: str) ->
         """
     elif vector_type == "personality_vector":
         specific_prompt = """
-        Analyze the provided employee vector and job information to suggest the 5 most suitable job matches based on the employee's personality traits. For each match, provide specific and detailed reasons focusing on how the employee's personality aligns with the job requirements and company culture.
+        Analyze the provided employee profile and job information to suggest the 5 most suitable job matches based on the employee's personality traits. For each match, provide specific and detailed reasons focusing on how the employee's personality aligns with the job requirements and company culture.
 
         Consider the following aspects in your analysis:
         - The employee's key personality traits and how they benefit the role
@@ -211,24 +464,217 @@ def generate_recommendations(prepared_data: Dict[str, Any], vector_type: str) ->
         - Examples of how their personality can contribute to success in the role
         - How their interpersonal skills and work style match the job requirements
         """
+    elif vector_type == HYBRID_VECTOR_TYPE:
+        specific_prompt = """
+        Analyze the provided employee profile and job information to suggest the 5 most suitable job matches based on the employee's career information, personality traits and skills together. Each job includes "signals" showing how strongly the career, personality and required-skill coverage each contributed to the match.
+
+        Consider the following aspects in your analysis:
+        - The employee's past work experiences and how they relate to the job requirements
+        - The employee's key personality traits and how they would fit the team and role
+        - Which of the job's required skills the employee already has, as indicated by the skill signal
+
+        When explaining the matching reasons, focus on:
+        - The signals that contributed most to each match
+        - How the combination of experience, personality and skills makes the employee a strong fit
+        """
     else:
         raise ValueError(f"Invalid vector type: {vector_type}")
 
     full_prompt = specific_prompt + base_prompt
 
+    return [
+        {"role": "system", "content": "あなたは優秀な人材マッチングの専門家です。従業員の特性と求人の要件を詳細に分析し、最適なマッチングを提案します。ビジネスの場で使用される自然な日本語で、具体的かつ臨場感のある推薦を行ってください。指定された形式を厳密に守り、それ以外の追加のテキストや書式は含めないでください。"},
+        {"role": "user", "content": full_prompt}
+    ]
+
+@timed("llm")
+async def generate_recommendations(prepared_data: Dict[str, Any], vector_type: str) -> str:
+    """
+    推薦文を非同期に生成する（同時実行数はllm_semaphoreで制限し、呼び出しごとにタイムアウトする）
+    
+    :param prepared_data: prepare_recommendation_dataで作成したデータ
+    :param vector_type: "career_info_vector", "personality_vector" または "hybrid"
+    :return: 推薦文（エラー時はエラーメッセージ）
+    :raises ValueError: vector_typeが不正な場合
+    """
+    messages = build_recommendation_messages(prepared_data, vector_type)
+
+    start = time.perf_counter()
     try:
-        completion = client.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[
-                {"role": "system", "content": "あなたは優秀な人材マッチングの専門家です。従業員の特性と求人の要件を詳細に分析し、最適なマッチングを提案します。ビジネスの場で使用される自然な日本語で、具体的かつ臨場感のある推薦を行ってください。指定された形式を厳密に守り、それ以外の追加のテキストや書式は含めないでください。"},
-                {"role": "user", "content": full_prompt}
-            ],
-            max_tokens=2000
-        )
+        async with llm_semaphore:
+            completion = await asyncio.wait_for(
+                get_async_openai_client().chat.completions.create(
+                    model=GPT_MODEL,
+                    messages=messages,
+                    max_tokens=2000
+                ),
+                timeout=LLM_TIMEOUT_SECONDS
+            )
+        record_llm_call("complete", "ok", time.perf_counter() - start, getattr(completion, "usage", None))
         return completion.choices[0].message.content
+    except asyncio.TimeoutError:
+        record_llm_call("complete", "timeout", time.perf_counter() - start)
+        return f"{LLM_ERROR_PREFIX}: timed out after {LLM_TIMEOUT_SECONDS} seconds"
     except Exception as e:
-        return f"Error in API call: {str(e)}"
-  
+        record_llm_call("complete", "error", time.perf_counter() - start)
+        return f"{LLM_ERROR_PREFIX}: {str(e)}"
+
+def _explanation_key(prepared_data: Dict[str, Any], vector_type: str, data_generation: int) -> str:
+    # プロンプトに含める特徴（スキル・部署・等級・SPI・求人詳細など）が変わった場合も別のキーになる
+    return make_explanation_key(
+        prepared_data['employee_vector_hash'],
+        [job['job_id'] for job in prepared_data['top_jobs']],
+        vector_type,
+        GPT_MODEL,
+        data_generation,
+        prompt_data_hash=prompt_hash([prepared_data['employee_info'], prepared_data['top_jobs']])
+    )
+
+async def generate_recommendations_cached(db: Session, prepared_data: Dict[str, Any], vector_type: str, data_generation: int = 0) -> str:
+    """
+    キャッシュを参照し、ない場合のみ推薦文を生成する
+    
+    :param db: データベースセッション
+    :param prepared_data: prepare_recommendation_dataで作成したデータ
+    :param vector_type: "career_info_vector", "personality_vector" または "hybrid"
+    :param data_generation: 求人ベクトルの世代
+    :return: 推薦文（エラー時はエラーメッセージ）
+    """
+    key = _explanation_key(prepared_data, vector_type, data_generation)
+    cached = await explanation_cache.get_async(db, key)
+    if cached is not None:
+        return cached
+
+    explanation = await generate_recommendations(prepared_data, vector_type)
+    # エラーメッセージはキャッシュしない
+    if not explanation.startswith(LLM_ERROR_PREFIX):
+        await explanation_cache.set_async(db, key, explanation)
+    return explanation
+
+async def stream_recommendations(prepared_data: Dict[str, Any], vector_type: str) -> AsyncIterator[str]:
+    """
+    推薦文を生成しながらトークンを順に返す（タイムアウトはチャンクごとに適用する）
+    
+    :param prepared_data: prepare_recommendation_dataで作成したデータ
+    :param vector_type: "career_info_vector", "personality_vector" または "hybrid"
+    :return: 生成されたテキスト片の非同期イテレータ
+    :raises asyncio.TimeoutError: 応答が途切れた場合
+    """
+    messages = build_recommendation_messages(prepared_data, vector_type)
+
+    start = time.perf_counter()
+    usage = None
+    outcome = "error"
+    try:
+        async with llm_semaphore:
+            stream = await asyncio.wait_for(
+                get_async_openai_client().chat.completions.create(
+                    model=GPT_MODEL,
+                    messages=messages,
+                    max_tokens=2000,
+                    stream=True,
+                    # 最後のチャンクでトークン数を受け取る
+                    stream_options={"include_usage": True}
+                ),
+                timeout=LLM_TIMEOUT_SECONDS
+            )
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=LLM_TIMEOUT_SECONDS)
+                except StopAsyncIteration:
+                    break
+                usage = getattr(chunk, "usage", None) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        outcome = "ok"
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    except GeneratorExit:
+        # クライアントの切断などで途中で閉じられた場合
+        outcome = "cancelled"
+        raise
+    finally:
+        record_llm_call("stream", outcome, time.perf_counter() - start, usage)
+
+async def stream_recommendations_cached(db: Session, prepared_data: Dict[str, Any], vector_type: str, data_generation: int = 0) -> AsyncIterator[str]:
+    """
+    キャッシュがあれば推薦文全体を一度に返し、なければ生成しながら返す
+    
+    :param db: データベースセッション
+    :param prepared_data: prepare_recommendation_dataで作成したデータ
+    :param vector_type: "career_info_vector", "personality_vector" または "hybrid"
+    :param data_generation: 求人ベクトルの世代
+    :return: テキスト片の非同期イテレータ（エラー時は最後にエラーメッセージを返す）
+    """
+    key = _explanation_key(prepared_data, vector_type, data_generation)
+    cached = await explanation_cache.get_async(db, key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        async for token in stream_recommendations(prepared_data, vector_type):
+            parts.append(token)
+            yield token
+    except asyncio.TimeoutError:
+        yield f"{LLM_ERROR_PREFIX}: timed out after {LLM_TIMEOUT_SECONDS} seconds"
+        return
+    except Exception as e:
+        yield f"{LLM_ERROR_PREFIX}: {str(e)}"
+        return
+    await explanation_cache.set_async(db, key, "".join(parts))
+
+# 従業員プロフィールの関連テーブルを一括で読み込むためのオプション（関連の件数に関わらずクエリ数は一定）
+EMPLOYEE_PROFILE_OPTIONS = (
+    defer(Employee.career_info_vector),
+    defer(Employee.personality_vector),
+    selectinload(Employee.grades).joinedload(EmployeeGrade.grade_info),
+    selectinload(Employee.skills).joinedload(EmployeeSkill.skill),
+    selectinload(Employee.spi),
+    selectinload(Employee.evaluations),
+    selectinload(Employee.departments).joinedload(DepartmentMember.department)
+)
+
+@timed("employee_profile")
+def load_employee_profile(db: Session, employee_id: int) -> Optional[Employee]:
+    """
+    従業員と関連テーブル（等級・スキル・SPI・評価・部署）をまとめて取得する
+    
+    :param db: データベースセッション
+    :param employee_id: 従業員ID
+    :return: 関連を読み込み済みのEmployee（存在しない場合はNone）
+    """
+    return db.query(Employee).options(*EMPLOYEE_PROFILE_OPTIONS).filter(Employee.employee_id == employee_id).first()
+
+@timed("employee_profile")
+async def load_employee_profile_async(db: AsyncSession, employee_id: int) -> Optional[Employee]:
+    """
+    load_employee_profileの非同期版
+
+    :param db: 非同期データベースセッション
+    :param employee_id: 従業員ID
+    :return: 関連を読み込み済みのEmployee（存在しない場合はNone）
+    """
+    result = await db.execute(select(Employee).options(*EMPLOYEE_PROFILE_OPTIONS).where(Employee.employee_id == employee_id))
+    return result.scalars().first()
+
+def load_employee_profiles(db: Session, employee_ids: Optional[List[int]] = None) -> List[Employee]:
+    """
+    複数の従業員を関連テーブルごとまとめて取得する
+    
+    :param db: データベースセッション
+    :param employee_ids: 従業員IDのリスト（Noneの場合は全従業員）
+    :return: 関連を読み込み済みのEmployeeのリスト
+    """
+    query = db.query(Employee).options(*EMPLOYEE_PROFILE_OPTIONS)
+    if employee_ids is not None:
+        query = query.filter(Employee.employee_id.in_(employee_ids))
+    return query.order_by(Employee.employee_id).all()
+
+@timed("employee_data")
 def get_all_employee_data(session: Session, employee: Employee) -> Optional[Dict[str, Any]]:
     try:
         return {
@@ -245,7 +691,7 @@ def get_all_employee_data(session: Session, employee: Employee) -> Optional[Dict
             },
             "grades": [{"grade_id": g.grade, "grade_name": g.grade_info.grade_name} for g in employee.grades],
             "skills": [{"skill_id": s.skill_id, "skill_name": s.skill.skill_name, "skill_category": s.skill.skill_category} for s in employee.skills],
-            "spi": employee.spi.__dict__ if employee.spi else None,
+            "spi": {column.name: getattr(employee.spi, column.name) for column in Spi.__table__.columns} if employee.spi else None,
             "evaluations": [{"year": e.evaluation_year, "evaluation": e.evaluation, "comment": e.evaluation_comment} for e in employee.evaluations],
             "departments": [{"department_id": d.department_id, "department_name": d.department.department_name} for d in employee.departments]
         }
@@ -0,0 +1,91 @@
+# vector_codec.py
+import json
+import struct
+from typing import Optional
+import numpy as np
+from sqlalchemy.types import TypeDecorator, LargeBinary
+
+# ヘッダー: マジック(2バイト) + バージョン(1バイト) + dtypeコード(1バイト) + 次元数(uint32)
+# 8バイトに揃えることで、本体のfloat32配列のアライメントを保つ
+VECTOR_MAGIC = b"TV"
+VECTOR_FORMAT_VERSION = 1
+HEADER_FORMAT = "<2sBBI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# dtypeコード（現在はリトルエンディアンのfloat32のみ）
+DTYPE_CODES = {1: np.dtype("<f4")}
+DTYPE_FLOAT32 = 1
+
+
+class InvalidVectorData(Exception):
+    """ベクトルのバイナリ形式が不正な場合の例外"""
+    pass
+
+
+def encode_vector(vector) -> bytes:
+    """
+    ベクトルをヘッダー付きのリトルエンディアンfloat32バイト列に変換する
+
+    :param vector: シーケンス、numpy配列、またはJSON文字列
+    :return: バイト列
+    """
+    if isinstance(vector, str):
+        vector = json.loads(vector)
+    array = np.ascontiguousarray(vector, dtype=DTYPE_CODES[DTYPE_FLOAT32])
+    if array.ndim != 1:
+        raise InvalidVectorData(f"Vector must be 1-dimensional, got shape {array.shape}")
+    header = struct.pack(HEADER_FORMAT, VECTOR_MAGIC, VECTOR_FORMAT_VERSION, DTYPE_FLOAT32, array.shape[0])
+    return header + array.tobytes()
+
+
+def is_binary_vector(value) -> bool:
+    """バイナリ形式のベクトルかどうかを判定する"""
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:2]) == VECTOR_MAGIC
+
+
+def decode_vector(value) -> Optional[np.ndarray]:
+    """
+    DBに格納されたベクトルをfloat32配列に変換する
+    バイナリ形式はnp.frombufferでコピーせずに読み込み、旧形式のJSON文字列も読み込める
+
+    :param value: バイト列、JSON文字列、またはシーケンス
+    :return: float32の1次元配列（読み取り専用の場合がある）
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        if not is_binary_vector(value):
+            # バイト列として保存されたJSON
+            return np.asarray(json.loads(bytes(value).decode("utf-8")), dtype=np.float32)
+        magic, version, dtype_code, dim = struct.unpack_from(HEADER_FORMAT, value)
+        if version != VECTOR_FORMAT_VERSION or dtype_code not in DTYPE_CODES:
+            raise InvalidVectorData(f"Unsupported vector format: version={version}, dtype={dtype_code}")
+        if len(value) != HEADER_SIZE + dim * DTYPE_CODES[dtype_code].itemsize:
+            raise InvalidVectorData(f"Vector payload size does not match dimension {dim}")
+        return np.frombuffer(value, dtype=DTYPE_CODES[dtype_code], count=dim, offset=HEADER_SIZE)
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+class BinaryVector(TypeDecorator):
+    """
+    float32ベクトルをBLOBとして保存するカラム型
+    移行期間中は旧形式のJSON文字列の行もそのまま読み込める
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or is_binary_vector(value):
+            return value
+        return encode_vector(value)
+
+    def compare_values(self, x, y):
+        if x is None or y is None:
+            return x is y
+        return np.array_equal(decode_vector(x), decode_vector(y))
+
+    def result_processor(self, dialect, coltype):
+        # LargeBinaryの結果処理は文字列（旧JSON形式）を扱えないため使わない
+        return decode_vector
@@ -0,0 +1,470 @@
+# vector_index.py
+import os
+import threading
+from typing import Dict, List, Any, Optional, Sequence
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import DataChangeLog, JobPostVector
+from vector_codec import decode_vector
+from vector_snapshot import VECTOR_SNAPSHOT_DIR, VectorSnapshotStore
+
+# 変更件数がこの割合を超えたら差分更新ではなく全件を再読み込みする
+FULL_RELOAD_RATIO = 0.5
+# 検索バックエンド: "exact"（全件走査）、"ivf"（近似最近傍探索）または "compressed"（削減した行列で候補を絞り、全精度で計算し直す）
+SEARCH_BACKENDS = ("exact", "ivf", "compressed")
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "exact")
+# db_control/build_ann_index.py で事前に作成するANNインデックスのパス
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", "./job_ann_index.npz")
+# db_control/build_compressed_index.py で事前に作成する削減済みインデックスのパス
+COMPRESSED_INDEX_PATH = os.getenv("COMPRESSED_INDEX_PATH", "./job_compressed_index.npz")
+
+
+def normalize_rows(matrix: np.ndarray) -> tuple:
+    """
+    行ごとにL2正規化した行列と元のノルムを返す（ノルム0の行は0のまま）
+
+    :param matrix: 2次元配列
+    :return: (正規化済みfloat32行列, ノルム配列)
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+    safe_norms = np.where(norms == 0, 1, norms).astype(np.float32)
+    return np.ascontiguousarray(matrix / safe_norms[:, None]), norms.astype(np.float32)
+
+
+def latest_change_id(db: Session, table_name: str) -> int:
+    """
+    テーブルの最新の変更IDを取得する（インデックスを使う軽量なクエリ）
+
+    :param db: データベースセッション
+    :param table_name: 変更ログのテーブル名
+    :return: 最新の変更ID（変更がなければ0）
+    """
+    latest = db.query(func.max(DataChangeLog.change_id)).filter(DataChangeLog.table_name == table_name).scalar()
+    return latest or 0
+
+
+def lookup_positions(keys: np.ndarray, values: np.ndarray) -> tuple:
+    """
+    valuesの各要素がkeysの何番目にあるかをまとめて求める（keysはソートされていなくてよい）
+
+    :param keys: 一意なIDの配列
+    :param values: 探すIDの配列
+    :return: (位置の配列, 見つかったかどうかの配列)（見つからない要素の位置は不定）
+    """
+    if not len(keys):
+        return np.zeros(len(values), dtype=np.int64), np.zeros(len(values), dtype=bool)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    positions = np.minimum(np.searchsorted(sorted_keys, values), len(keys) - 1)
+    return order[positions], sorted_keys[positions] == values
+
+
+def top_k_indices(scores: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    スコアの上位top_n件のインデックスを降順で返す（全件ソートは行わない）
+
+    :param scores: 1次元のスコア配列
+    :param top_n: 取得する件数
+    :return: 上位のインデックス配列
+    """
+    top_n = min(top_n, len(scores))
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, top_n - 1)[:top_n]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def top_k_rows(scores: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    スコア行列の行ごとに上位top_n件の列インデックスを降順で返す
+
+    :param scores: 2次元のスコア配列
+    :param top_n: 取得する件数（列数以下）
+    :return: 行ごとの上位のインデックス配列
+    """
+    if top_n <= 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+    candidates = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class JobVectorIndex:
+    """求人ベクトルを正規化済みのfloat32行列として常駐させるインデックス"""
+
+    TABLE_NAME = JobPostVector.__tablename__
+
+    def __init__(self, search_backend: str = SEARCH_BACKEND, ann_index_path: Optional[str] = ANN_INDEX_PATH, compressed_index_path: Optional[str] = COMPRESSED_INDEX_PATH, snapshot_dir: Optional[str] = VECTOR_SNAPSHOT_DIR):
+        if search_backend not in SEARCH_BACKENDS:
+            raise ValueError(f"Invalid search backend: {search_backend}")
+        self._lock = threading.Lock()
+        # 検索側は常にこのタプルを一度だけ参照するため、更新中でも不整合が起きない
+        self._snapshot = self._build_snapshot(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+        self.generation: Optional[int] = None
+        self.search_backend = search_backend
+        self.ann_index_path = ann_index_path
+        self.compressed_index_path = compressed_index_path
+        # (IVFFlatIndex または CompressedIndex, 対応するスナップショット, 求人ID→行番号)
+        self._ann_view: Optional[tuple] = None
+        # db_control/export_vector_snapshot.py で書き出した共有スナップショット（設定されていなければDBから読み込む）
+        self.snapshot_store = VectorSnapshotStore(snapshot_dir) if snapshot_dir else None
+        # 現在mmapしているスナップショットのマニフェスト（DBの変更を反映してプロセス内のコピーになった場合はNone）
+        self.shared_snapshot: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_vectors(cls, job_vectors: Dict[int, Sequence[float]]) -> "JobVectorIndex":
+        """
+        求人IDとベクトルの辞書からインデックスを作成する（DBとは同期しない）
+
+        :param job_vectors: 求人IDをキー、ベクトルを値とする辞書
+        :return: JobVectorIndex
+        """
+        index = cls(search_backend="exact", snapshot_dir=None)
+        job_ids = np.fromiter(job_vectors.keys(), dtype=np.int64, count=len(job_vectors))
+        vectors = [decode_vector(v) for v in job_vectors.values()]
+        matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        index._snapshot = index._build_snapshot(job_ids, matrix)
+        return index
+
+    def with_index(self, search_backend: str, ann) -> "JobVectorIndex":
+        """
+        同じ行列を共有し、作成済みのIVFFlatIndex / CompressedIndexで検索するインデックスを作成する（DBとは同期しない）
+
+        :param search_backend: annに対応する検索バックエンド（"ivf" または "compressed"）
+        :param ann: 現在のスナップショットから作成したインデックス
+        :return: JobVectorIndex
+        """
+        index = JobVectorIndex(search_backend=search_backend, ann_index_path=None, compressed_index_path=None, snapshot_dir=None)
+        index._snapshot = self._snapshot
+        job_ids = self._snapshot[0]
+        index._ann_view = (ann, self._snapshot, dict(zip(job_ids.tolist(), range(len(job_ids)))))
+        return index
+
+    @staticmethod
+    def _build_snapshot(job_ids: np.ndarray, raw_matrix: np.ndarray) -> tuple:
+        matrix, norms = normalize_rows(raw_matrix)
+        return job_ids, matrix, norms
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0])
+
+    @property
+    def job_ids(self) -> np.ndarray:
+        return self._snapshot[0]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._snapshot[1]
+
+    def current_generation(self, db: Session) -> int:
+        """
+        job_post_vectorsの最新の変更IDを取得する（インデックスを使う軽量なクエリ）
+
+        :param db: データベースセッション
+        :return: 最新の変更ID（変更がなければ0）
+        """
+        return latest_change_id(db, self.TABLE_NAME)
+
+    def refresh(self, db: Session) -> bool:
+        """
+        DBの変更を検知した場合のみインデックスを更新する
+
+        :param db: データベースセッション
+        :return: 更新した場合True
+        """
+        latest = self.current_generation(db)
+        if latest == self.generation and not self._should_map(latest):
+            return False
+        with self._lock:
+            manifest = self._should_map(latest)
+            if latest == self.generation and not manifest:
+                return False
+            base = self.generation
+            if manifest:
+                self._snapshot = self.snapshot_store.load(manifest)
+                self.shared_snapshot = manifest
+                base = manifest["generation"]
+                print(f"Job vector index mapped: {manifest['count']} vectors from snapshot generation {base}")
+            if base is None or base < latest:
+                # スナップショットより新しい変更は、次のスナップショットが公開されるまでプロセス内のコピーに反映する
+                if base is None or not self._apply_changes(db, self._changed_ids(db, base, latest)):
+                    self._load_all(db)
+                self.shared_snapshot = None
+            if self.search_backend != "exact":
+                self._sync_ann(db, latest)
+            self.generation = latest
+        return True
+
+    def _should_map(self, latest: int) -> Optional[Dict[str, Any]]:
+        # 新しく公開されたスナップショットがDBの最新に追いついている場合（初回は常に）のみ切り替える
+        manifest = self.snapshot_store.current() if self.snapshot_store else None
+        if manifest is None or (self.shared_snapshot and manifest["path"] == self.shared_snapshot["path"]):
+            return None
+        if self.generation is not None and manifest["generation"] < latest:
+            return None
+        return manifest
+
+    def publish_snapshot(self) -> Optional[Dict[str, Any]]:
+        """
+        現在の行列を共有スナップショットとして公開する（ワーカーは次のrefreshで切り替える）
+
+        :return: 公開したマニフェスト（スナップショットのディレクトリが未設定の場合None）
+        """
+        if self.snapshot_store is None:
+            return None
+        with self._lock:
+            job_ids, matrix, norms = self._snapshot
+            if self.shared_snapshot and self.shared_snapshot["generation"] == self.generation:
+                return self.shared_snapshot
+            return self.snapshot_store.publish(self.generation or 0, job_ids, matrix, norms)
+
+    def stats(self) -> Dict[str, Any]:
+        job_ids, matrix, _ = self._snapshot
+        return {
+            "generation": self.generation,
+            "vectors": len(job_ids),
+            "matrix_bytes": int(matrix.nbytes),
+            "shared_snapshot_generation": self.shared_snapshot["generation"] if self.shared_snapshot else None
+        }
+
+    def _load_all(self, db: Session) -> None:
+        rows = db.query(JobPostVector.job_post_id, JobPostVector.vector).filter(
+            JobPostVector.vector.isnot(None)
+        ).all()
+        job_ids = np.fromiter((row.job_post_id for row in rows), dtype=np.int64, count=len(rows))
+        matrix = np.vstack([decode_vector(row.vector) for row in rows]) if rows else np.empty((0, 0), dtype=np.float32)
+        self._snapshot = self._build_snapshot(job_ids, matrix)
+        print(f"Job vector index loaded: {len(job_ids)} vectors")
+
+    def _changed_ids(self, db: Session, since: int, until: int) -> List[int]:
+        return [
+            row.row_id for row in db.query(DataChangeLog.row_id).filter(
+                DataChangeLog.table_name == self.TABLE_NAME,
+                DataChangeLog.change_id > since,
+                DataChangeLog.change_id <= until
+            ).distinct()
+        ]
+
+    def _apply_changes(self, db: Session, changed_ids: List[int]) -> bool:
+        job_ids, matrix, norms = self._snapshot
+        if len(changed_ids) > max(1, len(job_ids)) * FULL_RELOAD_RATIO:
+            return False
+
+        rows = db.query(JobPostVector.job_post_id, JobPostVector.vector).filter(
+            JobPostVector.job_post_id.in_(changed_ids),
+            JobPostVector.vector.isnot(None)
+        ).all()
+        new_vectors = [decode_vector(row.vector) for row in rows]
+        if new_vectors and matrix.size and new_vectors[0].shape[0] != matrix.shape[1]:
+            return False
+
+        # 変更のあった行を取り除き、最新の行を末尾に追加した新しい行列に差し替える
+        keep = ~np.isin(job_ids, np.asarray(changed_ids, dtype=np.int64))
+        new_ids = np.fromiter((row.job_post_id for row in rows), dtype=np.int64, count=len(rows))
+        if new_vectors:
+            new_matrix, new_norms = normalize_rows(np.vstack(new_vectors))
+            matrix = np.vstack([matrix[keep], new_matrix]) if matrix.size else new_matrix
+            norms = np.concatenate([norms[keep], new_norms])
+        else:
+            matrix, norms = matrix[keep], norms[keep]
+        self._snapshot = (np.concatenate([job_ids[keep], new_ids]), np.ascontiguousarray(matrix), norms)
+        return True
+
+    def _sync_ann(self, db: Session, latest: int) -> None:
+        if self.search_backend == "ivf":
+            from ann_index import IVFFlatIndex as index_class
+            index_path = self.ann_index_path
+        else:
+            from compressed_index import CompressedIndex as index_class
+            index_path = self.compressed_index_path
+
+        snapshot = self._snapshot
+        job_ids, matrix, _ = snapshot
+        ann = self._ann_view[0] if self._ann_view else None
+        if ann is None and index_path and os.path.exists(index_path):
+            # 事前に作成したインデックスを読み込み、作成後の変更だけを反映する
+            ann = index_class.load(index_path)
+            print(f"{self.search_backend} index loaded: {len(ann)} vectors from {index_path}")
+        positions = dict(zip(job_ids.tolist(), range(len(job_ids))))
+        if ann is None:
+            if not len(job_ids):
+                return
+            ann = index_class.build(job_ids, matrix)
+        else:
+            changed_ids = self._changed_ids(db, ann.generation, latest)
+            if changed_ids:
+                ann.remove(np.asarray(changed_ids, dtype=np.int64))
+                rows = [positions[job_id] for job_id in changed_ids if job_id in positions]
+                ann.add(job_ids[rows], matrix[rows])
+        ann.generation = latest
+        # 検索側がインデックスと行番号の対応を一度に参照できるようにまとめて差し替える
+        self._ann_view = (ann, snapshot, positions)
+
+    def _format_results(self, snapshot: tuple, indices: Sequence[int], scores: Sequence[float], return_percentage: bool, include_vector: bool) -> List[Dict[str, Any]]:
+        job_ids, matrix, norms = snapshot
+        results = []
+        for i, score in zip(indices, scores):
+            similarity = float(score)
+            if return_percentage:
+                similarity = round(similarity * 100, 2)
+            result = {'job_id': int(job_ids[i]), 'similarity': similarity}
+            if include_vector:
+                result['vector'] = (matrix[i] * norms[i]).tolist()
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _rerank(matrix: np.ndarray, positions: Dict[int, int], candidate_ids: np.ndarray, query: np.ndarray, top_n: int) -> tuple:
+        # 候補の行のみ全精度で計算し直す（スナップショットをmmapしている場合も候補のページしか読まない）
+        rows = np.fromiter((positions[job_id] for job_id in candidate_ids.tolist()), dtype=np.int64, count=len(candidate_ids))
+        scores = matrix[rows] @ query
+        order = top_k_indices(scores, top_n)
+        return rows[order], scores[order]
+
+    def search(self, vector: Sequence[float], top_n: int, return_percentage: bool = False, include_vector: bool = False, n_probe: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        コサイン類似度の高い求人を取得する（exactの場合は行列ベクトル積1回、ivfの場合はn_probe個のクラスタのみ走査、
+        compressedの場合は削減した行列で候補を絞り、候補のみ全精度で計算し直す）
+
+        :param vector: 検索に使うベクトル
+        :param top_n: 取得する上位の数
+        :param return_percentage: 類似度をパーセンテージで返すかどうかのフラグ
+        :param include_vector: 求人ベクトルを結果に含めるかどうかのフラグ
+        :param n_probe: ivfで調べるクラスタ数（省略時はインデックスの設定）
+        :return: job_id, similarity（include_vectorの場合はvectorも）を含む辞書のリスト
+        """
+        ann_view = self._ann_view if self.search_backend != "exact" else None
+        snapshot = ann_view[1] if ann_view else self._snapshot
+        job_ids, matrix, _ = snapshot
+        if not len(job_ids):
+            return []
+        query = decode_vector(vector)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            scores = np.zeros(len(job_ids), dtype=np.float32)
+        elif ann_view and self.search_backend == "compressed":
+            compressed, _, positions = ann_view
+            query = query / query_norm
+            indices, scores = self._rerank(matrix, positions, compressed.candidates(query[None, :], top_n)[0], query, top_n)
+            return self._format_results(snapshot, indices, scores, return_percentage, include_vector)
+        elif ann_view:
+            ann, _, positions = ann_view
+            ann_ids, ann_scores = ann.search(query / query_norm, top_n, n_probe)
+            indices = [positions[job_id] for job_id in ann_ids.tolist()]
+            return self._format_results(snapshot, indices, ann_scores, return_percentage, include_vector)
+        else:
+            scores = matrix @ (query / query_norm)
+        indices = top_k_indices(scores, top_n)
+        return self._format_results(snapshot, indices, scores[indices], return_percentage, include_vector)
+
+    def search_batch(self, vectors: np.ndarray, top_n: int, return_percentage: bool = False, chunk_size: int = 1024, include_vector: bool = False) -> List[List[Dict[str, Any]]]:
+        """
+        複数のベクトルをまとめて検索する（チャンクごとに行列積1回。compressedの場合は候補のみ全精度で計算し直す）
+
+        :param vectors: 検索に使うベクトルを行に持つ2次元配列
+        :param top_n: 取得する上位の数
+        :param return_percentage: 類似度をパーセンテージで返すかどうかのフラグ
+        :param chunk_size: 一度に計算する行数（スコア行列のメモリは chunk_size × 求人数）
+        :param include_vector: 求人ベクトルを結果に含めるかどうかのフラグ
+        :return: 入力の行ごとの検索結果のリスト
+        """
+        if self.search_backend == "ivf" and self._ann_view:
+            return [self.search(vector, top_n, return_percentage, include_vector) for vector in vectors]
+        ann_view = self._ann_view if self.search_backend == "compressed" else None
+        snapshot = ann_view[1] if ann_view else self._snapshot
+        job_ids, matrix, _ = snapshot
+        queries, _ = normalize_rows(vectors)
+        if not len(job_ids):
+            return [[] for _ in range(len(queries))]
+        top_n = min(top_n, len(job_ids))
+
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            if ann_view:
+                compressed, _, positions = ann_view
+                chunk = queries[start:start + chunk_size]
+                for query, candidate_ids in zip(chunk, compressed.candidates(chunk, top_n)):
+                    indices, scores = self._rerank(matrix, positions, candidate_ids, query, top_n)
+                    results.append(self._format_results(snapshot, indices, scores, return_percentage, include_vector))
+                continue
+            scores = queries[start:start + chunk_size] @ matrix.T
+            for row_scores, indices in zip(scores, top_k_rows(scores, top_n)):
+                results.append(self._format_results(snapshot, indices, row_scores[indices], return_percentage, include_vector))
+        return results
+
+    def search_hybrid(self, career_vectors: np.ndarray, personality_vectors: np.ndarray, employee_skills, skill_index, weights: Dict[str, float], top_n: int, return_percentage: bool = False, chunk_size: int = 1024) -> List[List[Dict[str, Any]]]:
+        """
+        キャリア・性格ベクトルの類似度とスキル一致率の加重和で検索する（常に全件走査）
+        2つのベクトル類似度は重み付きのクエリにまとめて行列積1回で計算し、スキル一致率は疎行列の積で加える
+
+        :param career_vectors: 従業員のキャリア情報ベクトルを行に持つ2次元配列
+        :param personality_vectors: 従業員の性格ベクトルを行に持つ2次元配列
+        :param employee_skills: JobSkillIndex.employee_matrixで作成した 従業員×スキル の疎行列
+        :param skill_index: JobSkillIndex
+        :param weights: "career", "personality", "skill" の重み
+        :param top_n: 取得する上位の数
+        :param return_percentage: 類似度をパーセンテージで返すかどうかのフラグ
+        :param chunk_size: 一度に計算する行数
+        :return: 入力の行ごとの検索結果のリスト（similarityは加重和、signalsは各指標の値）
+        """
+        snapshot = self._snapshot
+        job_ids, matrix, _ = snapshot
+        if not len(job_ids):
+            return [[] for _ in range(len(career_vectors))]
+        career_queries, _ = normalize_rows(career_vectors)
+        personality_queries, _ = normalize_rows(personality_vectors)
+        skill_matrix = skill_index.job_matrix(job_ids)
+        top_n = min(top_n, len(job_ids))
+
+        def output(value) -> float:
+            return round(float(value) * 100, 2) if return_percentage else float(value)
+
+        results = []
+        for start in range(0, len(career_queries), chunk_size):
+            career = career_queries[start:start + chunk_size]
+            personality = personality_queries[start:start + chunk_size]
+            scores = (weights["career"] * career + weights["personality"] * personality) @ matrix.T
+            overlap = (employee_skills[start:start + chunk_size] @ skill_matrix).tocsr()
+            if weights["skill"]:
+                coo = overlap.tocoo()
+                scores[coo.row, coo.col] += weights["skill"] * coo.data
+            top_indices = top_k_rows(scores, top_n)
+
+            # 上位の求人についてのみ、指標ごとの値を計算する
+            top_vectors = matrix[top_indices]
+            career_signals = np.einsum("nd,nkd->nk", career, top_vectors)
+            personality_signals = np.einsum("nd,nkd->nk", personality, top_vectors)
+            skill_signals = np.asarray(overlap[np.arange(len(scores))[:, None], top_indices].todense()) if top_n else np.empty((len(scores), 0))
+            top_scores = np.take_along_axis(scores, top_indices, axis=1)
+            for row in range(len(scores)):
+                results.append([
+                    {
+                        'job_id': int(job_ids[index]),
+                        'similarity': output(top_scores[row, k]),
+                        'signals': {
+                            'career': output(career_signals[row, k]),
+                            'personality': output(personality_signals[row, k]),
+                            'skill': output(skill_signals[row, k])
+                        }
+                    }
+                    for k, index in enumerate(top_indices[row])
+                ])
+        return results
+
+
+# プロセス全体で共有する求人ベクトルインデックス
+job_vector_index = JobVectorIndex()
+
+
+def get_job_vector_index(db: Session) -> JobVectorIndex:
+    """
+    最新の状態に同期した共有インデックスを取得する
+
+    :param db: データベースセッション
+    :return: JobVectorIndex
+    """
+    job_vector_index.refresh(db)
+    return job_vector_index
@@ -0,0 +1,114 @@
+# vector_snapshot.py
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, Optional
+import numpy as np
+
+# 求人ベクトルのスナップショットを置くディレクトリ（空の場合は使わず、ワーカーごとにDBから読み込む）
+# /dev/shm 以下を指定するとディスクを介さない共有メモリになる
+VECTOR_SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR", "")
+# 古い世代を削除せずに残す数（切り替え前の世代を読んでいるワーカーのため）
+KEEP_GENERATIONS = int(os.getenv("VECTOR_SNAPSHOT_KEEP", "2"))
+MANIFEST_NAME = "CURRENT"
+SNAPSHOT_ARRAYS = ("job_ids", "matrix", "norms")
+
+
+class VectorSnapshotStore:
+    """
+    正規化済みの求人ベクトル行列を世代ごとのファイルに書き出し、複数のワーカーから読み取り専用でmmapさせる
+    世代のファイルをすべて書き終えてからマニフェストを置き換えるため、読み取り側が書きかけの行列を見ることはない
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # マニフェストの(mtime, サイズ) -> 内容（変わっていなければ読み直さない）
+        self._manifest_cache: tuple = (None, None)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """
+        公開中の世代のマニフェストを取得する（リクエストごとに呼ばれるため、変更がなければstatのみ）
+
+        :return: generation, path, count, dim, created_atを含む辞書（未作成の場合None）
+        """
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        if self._manifest_cache[0] != key:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self._manifest_cache = (key, json.load(f))
+        return self._manifest_cache[1]
+
+    def load(self, manifest: Dict[str, Any]) -> tuple:
+        """
+        マニフェストの世代をmmapで読み込む（ページはOSのページキャッシュを介して全ワーカーで共有される）
+
+        :param manifest: current()で取得したマニフェスト
+        :return: (求人IDの配列, 正規化済み行列, ノルムの配列)（いずれも読み取り専用）
+        """
+        path = os.path.join(self.directory, manifest["path"])
+        return tuple(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in SNAPSHOT_ARRAYS)
+
+    def publish(self, generation: int, job_ids: np.ndarray, matrix: np.ndarray, norms: np.ndarray) -> Dict[str, Any]:
+        """
+        スナップショットを新しい世代として書き出し、マニフェストを置き換えて公開する
+
+        :param generation: job_post_vectorsの変更ID
+        :param job_ids: 求人IDの配列
+        :param matrix: 正規化済みのfloat32行列
+        :param norms: 元のノルムの配列
+        :return: 公開したマニフェスト
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        # 同じ世代を同時に書き出しても衝突しないよう、ディレクトリ名に一意な値を付ける
+        name = f"job_vectors-{generation}-{uuid.uuid4().hex[:8]}"
+        tmp_path = os.path.join(self.directory, f".{name}.tmp")
+        os.makedirs(tmp_path)
+        arrays = {
+            "job_ids": np.asarray(job_ids, dtype=np.int64),
+            "matrix": np.ascontiguousarray(matrix, dtype=np.float32),
+            "norms": np.asarray(norms, dtype=np.float32)
+        }
+        for array_name, array in arrays.items():
+            with open(os.path.join(tmp_path, f"{array_name}.npy"), "wb") as f:
+                np.save(f, array)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.directory, name))
+
+        manifest = {
+            "generation": generation,
+            "path": name,
+            "count": len(arrays["job_ids"]),
+            "dim": arrays["matrix"].shape[1] if arrays["matrix"].ndim == 2 else 0,
+            "created_at": time.time()
+        }
+        tmp_manifest = f"{self.manifest_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_manifest, self.manifest_path)
+        self._remove_old_generations(name)
+        return manifest
+
+    def _remove_old_generations(self, current_name: str) -> None:
+        # mmap済みのファイルは削除しても読み続けられる（Windowsでは使用中のため削除に失敗し、次回に持ち越す）
+        generations = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_dir() and entry.name.startswith("job_vectors-") and entry.name != current_name),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in generations[max(KEEP_GENERATIONS - 1, 0):]:
+            try:
+                shutil.rmtree(entry.path)
+            except OSError as e:
+                print(f"Could not remove old vector snapshot {entry.name}: {e}")
@@ -0,0 +1,103 @@
+# warmup.py
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import AsyncSessionLocal, SessionLocal
+from employee_index import get_employee_vector_index
+from models import Department, Grade, SkillList
+from skill_index import get_job_skill_index
+from utils import get_async_openai_client, get_openai_client
+from vector_index import get_job_vector_index
+
+# 起動時にインデックスやクライアントを読み込んでおく（無効にすると最初のリクエストで読み込む）
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+# 1の場合はウォームアップが終わるまで接続を受け付けない（0の場合は/readyが503を返す間も受け付ける）
+WARMUP_BLOCKING = os.getenv("WARMUP_BLOCKING", "0") == "1"
+# 候補者検索を使う場合のみ有効にする（全従業員のベクトルを読み込むためメモリを使う）
+WARMUP_EMPLOYEE_INDEX = os.getenv("WARMUP_EMPLOYEE_INDEX", "0") == "1"
+
+
+def _load_lookup_tables(db: Session) -> None:
+    # 求人詳細・プロフィールの読み込みで毎回結合する小さなテーブルをページキャッシュに載せる
+    for model in (Department, Grade, SkillList):
+        db.query(model).all()
+
+
+def _create_openai_clients(db: Session) -> None:
+    get_openai_client()
+    get_async_openai_client()
+
+
+def warmup_steps() -> List[Tuple[str, Callable[[Session], Any]]]:
+    steps = [
+        ("job_vector_index", get_job_vector_index),
+        ("job_skill_index", get_job_skill_index),
+        ("lookup_tables", _load_lookup_tables),
+        ("openai_client", _create_openai_clients)
+    ]
+    if WARMUP_EMPLOYEE_INDEX:
+        steps.append(("employee_vector_index", get_employee_vector_index))
+    return steps
+
+
+class WarmupState:
+    """起動時のウォームアップの進捗（/readyで返す）"""
+
+    def __init__(self, enabled: bool = WARMUP_ON_STARTUP):
+        self.enabled = enabled
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 手順名 -> 所要秒数
+        self.steps: Dict[str, float] = {}
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        # 失敗した場合も読み込みは最初のリクエストで再度行われるため、受け付けを始める
+        return not self.enabled or self.finished_at is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "warmup_enabled": self.enabled,
+            "warmup_seconds": round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+            "steps": self.steps,
+            "error": self.error
+        }
+
+
+def _run_sync_steps(state: WarmupState) -> None:
+    db = SessionLocal()
+    try:
+        for name, step in warmup_steps():
+            start = time.perf_counter()
+            step(db)
+            state.steps[name] = round(time.perf_counter() - start, 3)
+    finally:
+        db.close()
+
+
+async def run_warmup(state: WarmupState) -> None:
+    """
+    インデックス・参照テーブル・APIクライアント・非同期エンジンを読み込み、終わったらstateを完了にする
+
+    :param state: 進捗を記録するWarmupState
+    """
+    from starlette.concurrency import run_in_threadpool
+
+    state.started_at = time.perf_counter()
+    try:
+        # 同期セッションのクエリと行列の読み込みはイベントループを止めないようにスレッドで実行する
+        await run_in_threadpool(_run_sync_steps, state)
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+        state.steps["async_engine"] = round(time.perf_counter() - start, 3)
+    except Exception as e:
+        state.error = str(e)
+        print(f"Warm-up failed: {e}")
+    finally:
+        state.finished_at = time.perf_counter()
+    print(f"Warm-up finished in {state.finished_at - state.started_at:.2f}s: {state.steps}")
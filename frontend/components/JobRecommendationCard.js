@@ -58,8 +58,9 @@ const JobRecommendationCard = ({
     };
 
     const vectorType = recommendationType === 'personality' ? 'personality_vector' : 'career_info_vector';
-    const jobsToRender = topJobs[vectorType] && recommendations[vectorType]
-        ? combineJobsWithRecommendations(topJobs[vectorType], parseRecommendations(recommendations[vectorType]))
+    // 推薦文はストリーミングで届くため、上位求人が届いた時点で表示する
+    const jobsToRender = topJobs[vectorType]
+        ? combineJobsWithRecommendations(topJobs[vectorType], parseRecommendations(recommendations[vectorType] || ''))
         : [];
 
     return (
@@ -1,30 +1,79 @@
 // useJobRecommendation.js
-import axios from 'axios';
+
+// SSEのイベントブロック（"event: ...\ndata: ..."）を解析する
+const parseEvent = (block) => {
+    let event = 'message';
+    const dataLines = [];
+    block.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : null };
+};
 
 export default function useJobRecommendation(setRecommendations, setTopJobs, setLoading, setError) {
     const handleJobRecommendation = async (vectorType) => {
         console.log("handleJobRecommendation called with vectorType:", vectorType);
         setLoading(true);
         setError('');
+        setRecommendations({});
         try {
             const token = localStorage.getItem('token');
             console.log("Token retrieved:", token ? "Token exists" : "No token");
-            const response = await axios.post(`${process.env.NEXT_PUBLIC_API_URL}/recommendations`, { vector_type: vectorType }, {
+            const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/recommendations/stream`, {
+                method: 'POST',
                 headers: {
+                    'Content-Type': 'application/json',
                     Authorization: `Bearer ${token}`
-                }
+                },
+                body: JSON.stringify({ vector_type: vectorType })
             });
+            if (!response.ok || !response.body) {
+                throw new Error(`Request failed with status ${response.status}`);
+            }
 
-            console.log("API Response:", response.data);
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let finished = false;
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
 
-            const { recommendations, top_jobs } = response.data;
-
-            console.log("Raw recommendations:", recommendations);
-            console.log("Raw top_jobs:", top_jobs);
-            
-            setRecommendations(recommendations || {});
-            setTopJobs(top_jobs || {});
-            
+                const blocks = buffer.split('\n\n');
+                buffer = blocks.pop();
+                for (const block of blocks) {
+                    const { event, data } = parseEvent(block);
+                    if (event === 'top_jobs') {
+                        // 上位求人が届いた時点で表示を始め、推薦文は届いた分から追記する
+                        console.log("Raw top_jobs:", data.top_jobs);
+                        setTopJobs(data.top_jobs || {});
+                        setLoading(false);
+                    } else if (event === 'token') {
+                        setRecommendations((prev) => ({
+                            ...prev,
+                            [data.vector_type]: (prev[data.vector_type] || '') + data.content
+                        }));
+                    } else if (event === 'done') {
+                        console.log("Raw recommendations:", data.recommendations);
+                        setRecommendations(data.recommendations || {});
+                        finished = true;
+                    } else if (event === 'error') {
+                        // 生成の途中でサーバー側のエラーが起きた場合
+                        console.error('Job recommendation stream failed:', data.detail);
+                        setError('求人推薦の生成中にエラーが発生しました。');
+                        finished = true;
+                    }
+                }
+            }
+            if (!finished) {
+                // doneもerrorも届かずに接続が切れた場合は、途中までの推薦文にエラーを表示する
+                throw new Error('Stream ended before the done event');
+            }
         } catch (error) {
             console.error('Failed to fetch job recommendations:', error);
             setError('求人推薦の取得に失敗しました。');